@@ -1,4 +1,10 @@
+import os
 import random
+import time
+import ChessBitboard
+import ChessBook
+import ChessEngine
+import ChessTablebase
 
 # Assigning point values to each piece (Scoring)
 pieceValues={"K":0,"Q":10,"R":5,"B":3,"N":3,"p":1}
@@ -65,21 +71,467 @@ blackPawnScores=[[0,0,0,0,0,0,0,0],
 
 piecePositionScores={"N": knightScores, "B": bishopScores, "Q": queenScores, "R": rookScores, "wp": whitePawnScores, "bp": blackPawnScores}
 
+SCORE_SCALE=10 # piece-square scores are worth a tenth of a pawn, so the incremental board score is kept in tenths (as integers)
+
+def buildScoreTable():
+    """
+    Folds pieceValues and piecePositionScores into one table of piece -> 64 per-square scores (in tenths of a pawn) which
+    GameState uses to keep each side's score up to date incrementally
+    """
+    table={}
+    for color in ('w','b'):
+        for pieceType in pieceValues:
+            piece=color+pieceType
+            if pieceType=="K":  # king is only one that doesnt have piece position table
+                positionScores=[[0]*8 for _ in range(8)]
+            elif pieceType=="p":
+                positionScores=piecePositionScores[piece]
+            else:
+                positionScores=piecePositionScores[pieceType]
+            table[piece]=[pieceValues[pieceType]*SCORE_SCALE+positionScores[row][col] for row in range(8) for col in range(8)]
+    return table
+
+ChessEngine.GameState.scoreTable=buildScoreTable()
+
 CHECKMATE=1000
 STALEMATE=0
 DEPTH=4 # for recursion - how far into the recursion tree to dive (ie. how many moves ahead is computer looking)
+TIME_LIMIT=None # milliseconds per AI move - when set, deepen iteratively until it runs out instead of stopping at DEPTH
+MAX_DEPTH=64 # deepest iteration a time-limited search will start
+QUIESCENCE_NODE_LIMIT=5000 # most quiescence nodes searched below any one horizon node before falling back to the static score
+QUIESCENCE_CHECK_EVASIONS=True # search every evasion (instead of standing pat) when in check during quiescence
+DELTA_MARGIN=2 # pawns - a capture that can't raise alpha even with this much extra positional gain is not searched
+TT_BUCKETS=1<<16 # number of transposition table buckets (two entries each) - must be a power of 2
+USE_BOOK=True # play opening book moves (ChessBook) without searching while the position is in the book
+USE_TABLEBASES=True # play/score positions with few pieces from the endgame tablebases (ChessTablebase) when there is a table
+TABLEBASE_WIN=900 # score of a tablebase win, less the plies to mate (below CHECKMATE, so a mate the search sees still beats it)
+VERBOSE=True # print the search stats after every search (off when stdout carries results, see ChessAnalyze)
+PROFILE=False # time move generation, makeMove/undoMove and scoreBoard separately into SearchStats.timings (slows the search)
+
+# bound types of a transposition table score
+EXACT=0  # score is the true negamax score of the position
+LOWERBOUND=1  # search failed high (beta cutoff) so the true score is at least this
+UPPERBOUND=2  # no move raised alpha so the true score is at most this
+
+class TranspositionTable():
+    """
+    Fixed-size table of already searched positions keyed by `GameState.zobristKey`
+        - Each bucket holds two entries: a depth-preferred entry (only replaced by an equal/deeper search or by any entry
+          once it is left over from an earlier findBestMove) and an always-replace entry (takes everything else)
+        - Entries are tuples (key, depth, score, bound, bestMoveID, generation), so memory is fixed by the bucket count
+    """
+    def __init__(self,buckets=TT_BUCKETS):
+        self.mask=buckets-1
+        self.depthEntries=[None]*buckets
+        self.recentEntries=[None]*buckets
+        self.generation=0  # bumped by every search so stale deep entries can be replaced
+        self.hits=0
+        self.misses=0
+        self.stores=0
+
+    def newSearch(self):
+        self.generation+=1
+
+    def probe(self,key):
+        """
+        Returns the entry stored for the position key or None
+        """
+        index=key&self.mask
+        entry=self.depthEntries[index]
+        if entry is not None and entry[0]==key:
+            self.hits+=1
+            return entry
+        entry=self.recentEntries[index]
+        if entry is not None and entry[0]==key:
+            self.hits+=1
+            return entry
+        self.misses+=1
+        return None
+
+    def store(self,key,depth,score,bound,bestMove):
+        index=key&self.mask
+        entry=(key,depth,score,bound,bestMove.moveID if bestMove is not None else None,self.generation)
+        current=self.depthEntries[index]
+        if current is None or current[0]==key or depth>=current[1] or current[5]!=self.generation:
+            self.depthEntries[index]=entry
+        else:
+            self.recentEntries[index]=entry
+        self.stores+=1
+
+    def stats(self):
+        probes=self.hits+self.misses
+        return {'hits':self.hits,'misses':self.misses,'stores':self.stores,'hitRate':self.hits/probes if probes else 0.0}
+
+transpositionTable=TranspositionTable()  # module level so it is kept across findBestMove calls within a game
+
+# Move ordering - the sooner the best move is searched, the more of the remaining moves alpha/beta can cut off
+    # Killer moves: per ply, the last two quiet moves that caused a beta cutoff (a refutation often works in sibling positions)
+    # History: per side, how often (weighted by depth) each quiet move caused a cutoff anywhere in the tree
+killerMoves=[[None,None] for _ in range(MAX_DEPTH+1)]  # moveIDs, indexed by ply (distance from the root)
+historyScores={'w':{},'b':{}}  # moveID -> score
+
+def orderMoves(validMoves,hashMoveID,ply,allyColor):
+    """
+    Returns the moves in the order they should be searched
+        1) hash move (best move found by an earlier search of the position)
+        2) captures and promotions, most valuable victim first then least valuable attacker (MVV-LVA)
+        3) killer moves of this ply
+        4) remaining quiet moves, highest history score first
+    """
+    hashMoves=[]
+    captures=[]
+    killers=[]
+    quietMoves=[]
+    killerIDs=killerMoves[ply]
+    for move in validMoves:
+        if move.moveID==hashMoveID:
+            hashMoves.append(move)
+        elif move.pieceCaptured!='--' or move.isPawnPromotion:
+            captures.append(move)
+        elif move.moveID==killerIDs[0] or move.moveID==killerIDs[1]:
+            killers.append(move)
+        else:
+            quietMoves.append(move)
+    captures.sort(key=scoreCapture,reverse=True)
+    history=historyScores[allyColor]
+    quietMoves.sort(key=lambda move: history.get(move.moveID,0),reverse=True)
+    return hashMoves+captures+killers+quietMoves
+
+def generateOrderedMoves(gamestate,hashMoveID,ply,allyColor):
+    """
+    Staged, lazy version of orderMoves for positions below the root - yields pseudo-legal moves (the search checks
+    legality only of the ones it tries) and each stage is only generated once the earlier ones failed to cut off
+    """
+    triedIDs=[]
+    if hashMoveID is not None:
+        hashMove=gamestate.getPseudoLegalMove(hashMoveID)
+        if hashMove is not None:
+            triedIDs.append(hashMoveID)
+            yield hashMove
+    for move in sorted(gamestate.getPseudoLegalCaptures(),key=scoreCapture,reverse=True):
+        if move.moveID not in triedIDs:
+            yield move
+    for killerID in killerMoves[ply]:
+        if killerID is not None and killerID not in triedIDs:
+            killer=gamestate.getPseudoLegalMove(killerID)
+            if killer is not None and killer.pieceCaptured=='--' and not killer.isPawnPromotion:
+                triedIDs.append(killerID)
+                yield killer
+    history=historyScores[allyColor]
+    for move in sorted(gamestate.getPseudoLegalQuietMoves(),key=lambda move: history.get(move.moveID,0),reverse=True):
+        if move.moveID not in triedIDs:
+            yield move
+
+def hasLegalMove(gamestate):
+    for move in gamestate.getPseudoLegalMoves():
+        if gamestate.isLegalMove(move):
+            return True
+    return False
+
+def scoreCapture(move):
+    """
+    MVV-LVA ordering key - victim value dominates, attacker value breaks ties (a king capture is safe so it sorts first)
+    """
+    score=pieceValues[move.pieceCaptured[1]]*10-pieceValues[move.pieceMoved[1]] if move.pieceCaptured!='--' else 0
+    if move.isPawnPromotion:
+        score+=pieceValues[move.promotionPiece]*10
+    return score
+
+def recordCutoff(move,depth,ply,allyColor):
+    """
+    Updates the killer moves and history table when a quiet move causes a beta cutoff
+    """
+    if move.pieceCaptured!='--' or move.isPawnPromotion:
+        return  # captures are already ordered by MVV-LVA
+    killerIDs=killerMoves[ply]
+    if killerIDs[0]!=move.moveID:
+        killerIDs[1]=killerIDs[0]
+        killerIDs[0]=move.moveID
+    history=historyScores[allyColor]
+    history[move.moveID]=history.get(move.moveID,0)+depth*depth
+
+def resetMoveOrdering():
+    """
+    Called before each findBestMove - killers are tied to plies of the previous search so they are cleared, history is
+    halved so it keeps what it learned but adapts to the new position
+    """
+    for killerIDs in killerMoves:
+        killerIDs[0]=killerIDs[1]=None
+    for history in historyScores.values():
+        for moveID in history:
+            history[moveID]//=2
 
 def findRandomMove(validMoves):
     return validMoves[random.randint(0,len(validMoves)-1)]
 
-def findBestMove(gamestate,validMoves,returnQueue):
-    global nextMove, counter
-    nextMove=None
+openingBook=None  # ChessBook.OpeningBook, opened the first time it is needed
+
+def probeBook(gamestate,validMoves):
+    """
+    Book move for the position, None when it is out of book (or there is no book file)
+    """
+    global openingBook
+    if openingBook is None:
+        if not os.path.exists(ChessBook.BOOK_PATH):
+            return None
+        openingBook=ChessBook.OpeningBook()
+    return openingBook.findMove(gamestate,validMoves)
+
+tablebases=ChessTablebase.Tablebases()  # tables are mapped the first time their material comes up
+
+def scoreTablebase(result):
+    """
+    Search score (side to move's point of view) of a tablebase result - quicker wins and slower losses score higher
+    """
+    wdl,plies=result
+    return wdl*(TABLEBASE_WIN-plies)
+
+def probeTablebaseMove(gamestate,validMoves):
+    """
+    Best root move by the tablebases - (move, score), None when the position isn't in them
+    """
+    if countPieces(gamestate)>ChessTablebase.MAX_PIECES or tablebases.probe(gamestate) is None:
+        return None
+    best=None
+    for move in validMoves:
+        gamestate.makeMove(move)
+        result=tablebases.probe(gamestate)  # captures/promotions land in other tables
+        gamestate.undoMove()
+        if result is None:
+            return None
+        score=-scoreTablebase(result)
+        if best is None or score>best[1]:
+            best=(move,score)
+    return best
+
+def countPieces(gamestate):
+    return ChessBitboard.popCount(gamestate.colorBitboards['w']|gamestate.colorBitboards['b'])
+
+class SearchStats():
+    """
+    What one searchBestMove did - the latest is kept in `searchStats` (ChessWorker sends it back with the move)
+        - source: 'search', or 'book'/'tablebase' when the move was looked up instead
+        - nodes: negamax nodes (horizon nodes included), quiescenceNodes: nodes below the horizon
+        - depth: last completed iteration, selDepth: deepest ply reached (quiescence included)
+        - principalVariation: best line of the last completed iteration, in chess notation
+        - cutoffsByMoveIndex: beta cutoffs caused by the 1st, 2nd, 3rd... move searched at a node (move ordering quality)
+        - iterations: per completed iteration - depth, time (ms), nodes so far, score and principal variation
+        - timings: name -> [calls, seconds] of the profiled functions when PROFILE is on
+    """
+    def __init__(self):
+        self.source='search'
+        self.depth=0
+        self.selDepth=0
+        self.score=None
+        self.nodes=0
+        self.quiescenceNodes=0
+        self.time=0.0  # seconds
+        self.principalVariation=[]
+        self.ttHits=0
+        self.ttMisses=0
+        self.cutoffsByMoveIndex=[]
+        self.iterations=[]
+        self.timings={}
+
+    @property
+    def nodesPerSecond(self):
+        return (self.nodes+self.quiescenceNodes)/self.time if self.time else 0.0
+
+    @property
+    def ttHitRate(self):
+        probes=self.ttHits+self.ttMisses
+        return self.ttHits/probes if probes else 0.0
+
+    @property
+    def cutoffRates(self):
+        """
+        Share of the cutoffs caused by the 1st, 2nd, 3rd... move - the higher the first, the better the move ordering
+        """
+        cutoffs=sum(self.cutoffsByMoveIndex)
+        return [count/cutoffs for count in self.cutoffsByMoveIndex] if cutoffs else []
+
+    def asDict(self):
+        return {'source':self.source,'depth':self.depth,'selDepth':self.selDepth,'score':self.score,'nodes':self.nodes,
+                'quiescenceNodes':self.quiescenceNodes,'time':self.time,'nodesPerSecond':self.nodesPerSecond,
+                'principalVariation':self.principalVariation,'ttHitRate':self.ttHitRate,
+                'cutoffsByMoveIndex':self.cutoffsByMoveIndex,'iterations':self.iterations,'timings':self.timings}
+
+    def __str__(self):
+        text=(self.source+" depth "+str(self.depth)+"/"+str(self.selDepth)+" score "+str(self.score)+" nodes "+
+              str(self.nodes)+"+"+str(self.quiescenceNodes)+"q "+format(self.nodesPerSecond,".0f")+"/s tt "+
+              format(self.ttHitRate,".0%")+" first move cutoffs "+format(self.cutoffRates[0] if self.cutoffRates else 0,".0%")+
+              " pv "+' '.join(self.principalVariation))
+        for name,(calls,seconds) in sorted(self.timings.items()):
+            text+="\n  "+name+": "+str(calls)+" calls "+format(seconds*1000,".0f")+"ms"
+        return text
+
+searchStats=SearchStats()  # stats of the latest search
+
+def getPrincipalVariation(gamestate,firstMove,maxLength):
+    """
+    Best line from the root - firstMove, then the hash moves of the positions it leads to, until the table has no move
+    (or the line repeats)
+    """
+    hits,misses=transpositionTable.hits,transpositionTable.misses
+    line=[]
+    move=firstMove
+    seen=set()
+    while move is not None and len(line)<maxLength:
+        seen.add(gamestate.zobristKey)
+        gamestate.makeMove(move)
+        line.append(move)
+        entry=transpositionTable.probe(gamestate.zobristKey)
+        if entry is None or entry[4] is None or gamestate.zobristKey in seen:
+            break
+        move=gamestate.getPseudoLegalMove(entry[4])
+        if move is None:  # castling isn't rebuilt from a moveID
+            move=next((move for move in gamestate.getPseudoLegalMoves() if move.moveID==entry[4]),None)
+        if move is not None and not gamestate.isLegalMove(move):
+            move=None
+    for _ in line:
+        gamestate.undoMove()
+    transpositionTable.hits,transpositionTable.misses=hits,misses  # these lookups aren't part of the search's stats
+    return [move.getChessNotation() for move in line]
+
+# profiled gamestate methods -> timings name
+PROFILED_METHODS={'getValidMoves':'moveGeneration','getPseudoLegalCaptures':'moveGeneration',
+                  'getPseudoLegalQuietMoves':'moveGeneration','getPseudoLegalMove':'moveGeneration',
+                  'isLegalMove':'legality','makeMove':'makeMove','undoMove':'undoMove'}
+
+def timeCalls(function,timing):
+    """
+    Wraps function so its calls and time are added to timing ([calls, seconds])
+    """
+    def timed(*args):
+        startTime=time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            timing[0]+=1
+            timing[1]+=time.perf_counter()-startTime
+    return timed
+
+def installProfiler(gamestate,timings):
+    """
+    Hooks timers around scoreBoard and the gamestate's move generation and make/undo (as instance attributes, so only this
+    search's copy of the position is affected) - returns the unprofiled scoreBoard to put back afterwards
+    """
+    global scoreBoard
+    for name,timingName in PROFILED_METHODS.items():
+        setattr(gamestate,name,timeCalls(getattr(gamestate,name),timings.setdefault(timingName,[0,0.0])))
+    unprofiledScoreBoard=scoreBoard
+    scoreBoard=timeCalls(scoreBoard,timings.setdefault('scoreBoard',[0,0.0]))
+    return unprofiledScoreBoard
+
+stopSearch=None  # optional callable polled at every node - returning True cancels the search (see ChessWorker)
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search once the time limit is used up (or stopSearch cancels it), unwinding straight back to
+    searchBestMove
+    """
+
+def findBestMove(gamestate,validMoves,returnQueue,timeLimit=None):
+    """
+    Searches for the best move and passes it back through returnQueue (used when the search runs in its own process)
+    """
+    returnQueue.put(searchBestMove(gamestate,validMoves,timeLimit))
+
+def searchBestMove(gamestate,validMoves,timeLimit=None,firstDepth=1):
+    """
+    Iterative deepening - searches depth 1, 2, 3... so every iteration is ordered by the previous one's best move
+        - timeLimit=None: uses TIME_LIMIT, and if that is None too stops after the DEPTH iteration
+        - timeLimit in ms: keeps deepening until it runs out. The move of the last completed iteration is returned, or the
+          move of the unfinished iteration if it already beat that one (the previous best is always searched first there,
+          so anything it picked has been compared against it)
+        - firstDepth: depth of the first iteration (parallel search helpers start deeper to stagger their work)
+        - returns None only if the search was cancelled before depth 1 finished
+    """
+    global counter, deadline, quiescenceNodes, completedDepth, searchScore, searchStats, rootPly, selDepth, cutoffCounts, \
+           scoreBoard
+    gamestate=ChessBitboard.BitboardGameState.fromGameState(gamestate)  # search on the bitboard core - same contract, faster move generation
     random.shuffle(validMoves)
     counter=0
-    findMoveNegaMaxAlphaBeta(gamestate,validMoves,DEPTH,-CHECKMATE,CHECKMATE,1 if gamestate.whiteToMove else -1)
-    print(counter)
-    returnQueue.put(nextMove)
+    quiescenceNodes=0
+    rootPly=len(gamestate.moveLog)
+    selDepth=0
+    cutoffCounts=[0]*256  # by index of the move that cut off (there are never more than 218 legal moves)
+    transpositionTable.newSearch()
+    resetMoveOrdering()
+    if timeLimit is None:
+        timeLimit=TIME_LIMIT
+    deadline=None  # depth 1 always completes so there is a move to return
+    bestMove=None
+    completedDepth=0
+    searchScore=None  # score of the last completed iteration, from the point of view of the side to move
+    stats=searchStats=SearchStats()
+    startTime=time.perf_counter()
+    ttHits,ttMisses=transpositionTable.hits,transpositionTable.misses
+    unprofiledScoreBoard=installProfiler(gamestate,stats.timings) if PROFILE else None
+    try:
+        if USE_BOOK:
+            bestMove=probeBook(gamestate,validMoves)
+            if bestMove is not None:  # known opening move - no search needed
+                stats.source='book'
+        if bestMove is None and USE_TABLEBASES and len(validMoves)!=0:
+            tablebaseMove=probeTablebaseMove(gamestate,validMoves)
+            if tablebaseMove is not None:  # perfect play known - no search needed
+                bestMove,searchScore=tablebaseMove
+                stats.source='tablebase'
+        if stats.source=='search':
+            bestMove=deepen(gamestate,validMoves,timeLimit,firstDepth,startTime,stats)
+    finally:
+        if unprofiledScoreBoard is not None:
+            scoreBoard=unprofiledScoreBoard
+    stats.time=time.perf_counter()-startTime
+    stats.depth=completedDepth
+    stats.selDepth=max(selDepth,completedDepth)
+    stats.score=searchScore
+    stats.nodes=counter
+    stats.quiescenceNodes=quiescenceNodes
+    stats.ttHits=transpositionTable.hits-ttHits
+    stats.ttMisses=transpositionTable.misses-ttMisses
+    while cutoffCounts and cutoffCounts[-1]==0:
+        cutoffCounts.pop()
+    stats.cutoffsByMoveIndex=cutoffCounts
+    if stats.source!='search' and bestMove is not None:
+        stats.principalVariation=[bestMove.getChessNotation()]
+    if VERBOSE:
+        print(stats)
+    return bestMove
+
+def deepen(gamestate,validMoves,timeLimit,firstDepth,startTime,stats):
+    """
+    The iterations of searchBestMove - returns the best move, recording each completed iteration in stats
+    """
+    global nextMove, rootDepth, deadline, completedDepth, searchScore
+    bestMove=None
+    maxDepth=DEPTH if timeLimit is None else MAX_DEPTH
+    for rootDepth in range(firstDepth,maxDepth+1):
+        nextMove=None
+        iterationStart=time.perf_counter()
+        try:
+            score=findMoveNegaMaxAlphaBeta(gamestate,validMoves,rootDepth,-CHECKMATE,CHECKMATE,1 if gamestate.whiteToMove else -1)
+        except SearchTimeout:
+            if nextMove is not None:
+                bestMove=nextMove
+            break
+        if nextMove is not None:
+            bestMove=nextMove
+            validMoves.remove(bestMove)  # principal variation move goes first in the next iteration
+            validMoves.insert(0,bestMove)
+        completedDepth=rootDepth
+        searchScore=score
+        stats.principalVariation=getPrincipalVariation(gamestate,bestMove,rootDepth)
+        stats.iterations.append({'depth':rootDepth,'time':round((time.perf_counter()-iterationStart)*1000),
+                                 'nodes':counter+quiescenceNodes,'score':score,'pv':stats.principalVariation})
+        if abs(score)>=CHECKMATE:  # forced mate found, deeper won't change it
+            break
+        if timeLimit is not None:
+            deadline=startTime+timeLimit/1000
+            if time.perf_counter()>=deadline:
+                break
+    return bestMove
 
 def findMoveNegaMaxAlphaBeta(gamestate,validMoves,depth,alpha,beta,turnMultiplier):
     """
@@ -88,29 +540,142 @@ def findMoveNegaMaxAlphaBeta(gamestate,validMoves,depth,alpha,beta,turnMultiplie
             - if black's turn then multiply by -1
         - Implements Alpha/Beta pruning
             - alpha:=upper bound; beta:=lower bound
+        - validMoves: the legal moves at the root. Below the root it is None and moves come lazily from
+          generateOrderedMoves, so most nodes never build (or legality check) the moves after a cutoff
     """
-    global nextMove
-    if depth==0:
+    global nextMove, quiescenceStop, counter
+    if (deadline is not None and time.perf_counter()>deadline) or (stopSearch is not None and stopSearch()):
+        raise SearchTimeout()
+    counter+=1
+    if depth!=rootDepth:  # draws by rule - a repeat of an earlier position, or 100 plies without a capture/pawn move
+        # (checked before the horizon too, so a repeat on the last ply is scored as the draw it is, not as material)
+        if gamestate.isRepetition() or (gamestate.halfmoveClock>=100 and not (gamestate.inCheck() and not hasLegalMove(gamestate))):
+            return STALEMATE
+    if depth==0:  # horizon - keep searching captures so the score isn't taken halfway through an exchange
+        quiescenceStop=quiescenceNodes+QUIESCENCE_NODE_LIMIT
+        return quiescenceSearch(gamestate,alpha,beta,turnMultiplier)
+    if validMoves is not None and len(validMoves)==0:  # root is checkmate/stalemate (flags were set by getValidMoves)
         return turnMultiplier*scoreBoard(gamestate)
+    if USE_TABLEBASES and depth!=rootDepth and countPieces(gamestate)<=ChessTablebase.MAX_PIECES:
+        result=tablebases.probe(gamestate)
+        if result is not None:  # exact score, no need to search any further
+            return scoreTablebase(result)
+
+    # transposition table - a deep enough earlier search of this position can cut off here (except at the root, which
+    # has to search to set nextMove), otherwise its best move is searched first
+    alphaOriginal=alpha
+    hashMoveID=None
+    entry=transpositionTable.probe(gamestate.zobristKey)
+    if entry is not None:
+        entryDepth,entryScore,entryBound,hashMoveID=entry[1],entry[2],entry[3],entry[4]
+        if entryDepth>=depth and depth!=rootDepth:
+            if entryBound==EXACT:
+                return entryScore
+            elif entryBound==LOWERBOUND:
+                alpha=max(alpha,entryScore)
+            else:
+                beta=min(beta,entryScore)
+            if alpha>=beta:
+                return entryScore
 
     # move ordering - want to evaluate best moves first to find better scores to eliminate irrelevant branches (improves efficiency) 
+    ply=rootDepth-depth
+    allyColor='w' if gamestate.whiteToMove else 'b'
+    if validMoves is None:
+        moves=generateOrderedMoves(gamestate,hashMoveID,ply,allyColor)
+    else:
+        if depth==rootDepth and rootDepth>1:
+            hashMoveID=validMoves[0].moveID  # findBestMove put the previous iteration's best move first
+        moves=orderMoves(validMoves,hashMoveID,ply,allyColor)
     maxScore=-CHECKMATE
-    for move in validMoves:
+    bestMove=None
+    legalMoves=0
+    for move in moves:
+        if validMoves is None and not gamestate.isLegalMove(move):
+            continue
+        legalMoves+=1
         gamestate.makeMove(move)
-        nextMoves=gamestate.getValidMoves()
-        score=-findMoveNegaMaxAlphaBeta(gamestate,nextMoves,depth-1,-beta,-alpha,-turnMultiplier)  # note - switch alpha and beta each turn (-alpha becomes new minimum, while -beta becomes new maximum)
-        if score>maxScore:
+        score=-findMoveNegaMaxAlphaBeta(gamestate,None,depth-1,-beta,-alpha,-turnMultiplier)  # note - switch alpha and beta each turn (-alpha becomes new minimum, while -beta becomes new maximum)
+        if score>maxScore or bestMove is None:  # first legal move is kept even if it gets mated, so there always is a move
             maxScore=score
-            if depth==DEPTH:
+            bestMove=move
+            if depth==rootDepth:
                 nextMove=move
         gamestate.undoMove()
         # pruning
         if maxScore>alpha: 
             alpha=maxScore
         if alpha>=beta:
+            recordCutoff(move,depth,ply,allyColor)
+            cutoffCounts[legalMoves-1]+=1
             break
+    if legalMoves==0:  # checkmate or stalemate
+        return -CHECKMATE if gamestate.inCheck() else STALEMATE
+
+    if maxScore<=alphaOriginal:
+        bound=UPPERBOUND
+    elif maxScore>=beta:
+        bound=LOWERBOUND
+    else:
+        bound=EXACT
+    transpositionTable.store(gamestate.zobristKey,depth,maxScore,bound,bestMove)
     return maxScore
     
+def quiescenceSearch(gamestate,alpha,beta,turnMultiplier):
+    """
+    Captures-only search past the horizon
+        - Stand pat: the side to move doesn't have to capture, so the static score is a lower bound on the position
+        - Delta pruning: captures that can't raise alpha even winning the piece for free (plus DELTA_MARGIN) are skipped
+        - In check there is no standing pat, every evasion is searched (QUIESCENCE_CHECK_EVASIONS)
+        - After QUIESCENCE_NODE_LIMIT nodes below one horizon node the static score is returned instead
+    """
+    global quiescenceNodes, selDepth
+    if (deadline is not None and time.perf_counter()>deadline) or (stopSearch is not None and stopSearch()):
+        raise SearchTimeout()
+    quiescenceNodes+=1
+    if len(gamestate.moveLog)-rootPly>selDepth:
+        selDepth=len(gamestate.moveLog)-rootPly
+    if gamestate.inCheck():
+        if QUIESCENCE_CHECK_EVASIONS and quiescenceNodes<quiescenceStop:
+            maxScore=-CHECKMATE
+            for move in gamestate.getPseudoLegalMoves():  # captures come first
+                if not gamestate.isLegalMove(move):
+                    continue
+                gamestate.makeMove(move)
+                score=-quiescenceSearch(gamestate,-beta,-alpha,-turnMultiplier)
+                gamestate.undoMove()
+                if score>maxScore:
+                    maxScore=score
+                if maxScore>alpha:
+                    alpha=maxScore
+                if alpha>=beta:
+                    break
+            return maxScore  # stays -CHECKMATE if there was no legal move
+        if not hasLegalMove(gamestate):
+            return -CHECKMATE
+
+    standPat=turnMultiplier*scoreBoard(gamestate)
+    if standPat>=beta or quiescenceNodes>=quiescenceStop:
+        return standPat
+    if standPat>alpha:
+        alpha=standPat
+    for move in sorted(gamestate.getPseudoLegalCaptures(),key=scoreCapture,reverse=True):
+        gain=pieceValues[move.pieceCaptured[1]] if move.pieceCaptured!='--' else 0
+        if move.isPawnPromotion:
+            gain+=pieceValues[move.promotionPiece]-pieceValues['p']
+        if standPat+gain+DELTA_MARGIN<=alpha:  # delta pruning
+            continue
+        if not gamestate.isLegalMove(move):
+            continue
+        gamestate.makeMove(move)
+        score=-quiescenceSearch(gamestate,-beta,-alpha,-turnMultiplier)
+        gamestate.undoMove()
+        if score>alpha:
+            alpha=score
+            if alpha>=beta:
+                break
+    return alpha
+
 def scoreBoard(gamestate):
     # score>0 => white winning vs score<0 => black winning
     # 0) Before scoring the board, check for checkmate or stalemate
@@ -121,20 +686,5 @@ def scoreBoard(gamestate):
             return CHECKMATE # white wins
     elif gamestate.stalemate:
         return STALEMATE
-    score=0
-    for row in range(len(gamestate.board)):
-        for col in range(len(gamestate.board[row])):
-            square=gamestate.board[row][col]
-            if square!="--":
-                # score piece positionally
-                if square[1]!="K": # (king is only one that doesnt have piece position table)
-                    if square[1]=="p":  # for pawns
-                        piecePositionScore=piecePositionScores[square][row][col]
-                    else:  # for other pieces
-                        piecePositionScore=piecePositionScores[square[1]][row][col]
-                
-            if square[0]=="w":
-                score+=pieceValues[square[1]]+piecePositionScore*0.1
-            elif square[0]=="b":
-                score-=pieceValues[square[1]]+piecePositionScore*0.1
-    return score
\ No newline at end of file
+    # material + piece-square score is kept up to date by makeMove/undoMove
+    return (gamestate.whiteScore-gamestate.blackScore)/SCORE_SCALE
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+Headless batch analysis - streams FEN/EPD positions through the AI, no pygame window needed
+    - Reads one position per line from a file (or stdin) and writes one JSON object per line (JSON Lines) with the best
+      move, score, depth reached (and selective depth), principal variation, nodes and time
+    - Positions are spread over a pool of processes. Only a bounded number are in flight at once, so memory stays flat
+      however long the input is, and results are written in input order as soon as they are ready
+    - Or, with --threads, one position at a time is searched by several processes at once (ChessSMP Lazy SMP)
+Usage (from the repo root):
+    python src/ChessAnalyze.py positions.epd --time 1000 --workers 4 > results.jsonl
+    python src/ChessAnalyze.py positions.epd --time 5000 --threads 4 > results.jsonl
+    cat positions.fen | python src/ChessAnalyze.py --depth 4
+"""
+
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+import ChessAI
+import ChessBitboard
+import ChessSMP
+
+PENDING_PER_WORKER=4  # positions queued per worker process - keeps them busy without reading the whole input ahead
+
+def parsePosition(line):
+    """
+    Splits a FEN or EPD line into (FEN, EPD operations)
+        - FEN: 6 fields, or 4 (counters default to 0 1)
+        - EPD: the first 4 FEN fields, optionally the 2 counters, then operations such as `bm Nf3; id "pos 1";`
+          (returned as a dict opcode -> operand)
+    """
+    fields=line.split(None,4)
+    if len(fields)<4:
+        raise ValueError("Invalid FEN/EPD: "+line)
+    rest=fields[4] if len(fields)>4 else ''
+    counters=[]
+    while len(counters)<2:  # halfmove clock and fullmove number, before any operations
+        parts=rest.split(None,1)
+        if not parts or not parts[0].isdigit():
+            break
+        counters.append(parts[0])
+        rest=parts[1] if len(parts)>1 else ''
+    operations={}
+    for operation in rest.split(';'):
+        parts=operation.strip().split(None,1)
+        if parts:
+            operations[parts[0]]=parts[1].strip().strip('"') if len(parts)>1 else ''
+    return ' '.join(fields[:4]+counters),operations
+
+def initWorker(depth):
+    """
+    Sets up the AI in each analysis process - no stats printed to stdout (it carries the results), no opening book and
+    the depth budget
+    """
+    ChessAI.VERBOSE=False
+    ChessAI.USE_BOOK=False  # positions are graded by searching them, not by looking them up
+    if depth is not None:
+        ChessAI.DEPTH=depth  # depth searched when there is no time limit
+        ChessAI.MAX_DEPTH=depth  # and the deepest a time limited search goes
+
+def analysePosition(task,searcher=None):
+    """
+    Searches one position - task is (line number, line, time limit in ms or None), returns its result as a dict
+        - searcher: ChessSMP.ParallelSearcher to search with, None searches in this process only
+    """
+    lineNumber,line,timeLimit=task
+    result={'line':lineNumber}
+    try:
+        fen,operations=parsePosition(line)
+        gamestate=ChessBitboard.BitboardGameState.fromFen(fen)
+    except (ValueError,KeyError,IndexError):
+        result['error']="Invalid FEN/EPD: "+line
+        return result
+    result['fen']=fen
+    if operations:
+        result['epd']=operations
+    startTime=time.perf_counter()
+    try:
+        validMoves=gamestate.getValidMoves()
+        parallelStats=None
+        if len(validMoves)==0:
+            bestMove=None
+        elif searcher is not None:
+            bestMove,parallelStats=searcher.search(gamestate,timeLimit,startFen=fen)
+        else:
+            bestMove=ChessAI.searchBestMove(gamestate,validMoves,timeLimit)
+    except Exception as error:  # one position the engine can't handle mustn't end the whole run
+        result['error']="Search failed: "+type(error).__name__+": "+str(error)
+        return result
+    if len(validMoves)==0:  # nothing to search - checkmate or stalemate
+        result.update(bestMove=None,score=-ChessAI.CHECKMATE if gamestate.checkmate else ChessAI.STALEMATE,depth=0,nodes=0,
+                      quiescenceNodes=0)
+    else:
+        stats=ChessAI.searchStats
+        result.update(bestMove=bestMove.getChessNotation() if bestMove is not None else None,score=stats.score,
+                      depth=stats.depth,selDepth=stats.selDepth,pv=stats.principalVariation,nodes=stats.nodes,
+                      quiescenceNodes=stats.quiescenceNodes,nodesPerSecond=round(stats.nodesPerSecond),
+                      ttHitRate=round(stats.ttHitRate,3))
+        if parallelStats is not None:  # nodes of every worker, the other stats are the main worker's
+            result.update(nodes=parallelStats['nodes'],quiescenceNodes=parallelStats['quiescenceNodes'],
+                          nodesPerSecond=round(parallelStats['nodesPerSecond']),workers=parallelStats['workers'])
+    result['time']=round((time.perf_counter()-startTime)*1000)  # ms
+    return result
+
+def readTasks(lines,timeLimit):
+    """
+    Lazily turns input lines into analysis tasks, skipping blank lines and # comments
+    """
+    for lineNumber,line in enumerate(lines,1):
+        line=line.strip()
+        if line and not line.startswith('#'):
+            yield (lineNumber,line,timeLimit)
+
+def analyse(lines,output,timeLimit=None,depth=None,workers=1,threads=1):
+    """
+    Analyses every position of `lines` and writes the results to `output` as JSON Lines, in input order
+        - threads>1: positions are searched one at a time by a ChessSMP.ParallelSearcher of that many processes (pool
+          processes can't start processes of their own, so workers is then ignored)
+    """
+    tasks=readTasks(lines,timeLimit)
+    if workers==1 or threads>1:  # in process, no pool to start
+        initWorker(depth)
+        searcher=ChessSMP.ParallelSearcher(threads) if threads>1 else None  # helpers start with the settings above
+        try:
+            for task in tasks:
+                output.write(json.dumps(analysePosition(task,searcher))+'\n')
+                output.flush()
+        finally:
+            if searcher is not None:
+                searcher.close()
+        return
+    with Pool(workers,initializer=initWorker,initargs=(depth,)) as pool:
+        pending=collections.deque()
+        for task in tasks:
+            pending.append(pool.apply_async(analysePosition,(task,)))
+            if len(pending)>=workers*PENDING_PER_WORKER:
+                output.write(json.dumps(pending.popleft().get())+'\n')
+                output.flush()
+        while pending:
+            output.write(json.dumps(pending.popleft().get())+'\n')
+            output.flush()
+
+def main():
+    parser=argparse.ArgumentParser(description="Analyse FEN/EPD positions with the AI, writing JSON Lines results")
+    parser.add_argument('input',nargs='?',help="file with one FEN/EPD per line (default: stdin)")
+    parser.add_argument('--output',help="file to write the results to (default: stdout)")
+    parser.add_argument('--time',type=int,help="time budget per position in ms")
+    parser.add_argument('--depth',type=int,help="depth budget per position (deepest iteration when --time is also given)")
+    parser.add_argument('--workers',type=int,default=os.cpu_count(),help="analysis processes (default: one per core)")
+    parser.add_argument('--threads',type=int,default=1,help="processes searching each position together (Lazy SMP) - "
+                        "positions are then analysed one at a time")
+    args=parser.parse_args()
+
+    lines=open(args.input) if args.input else sys.stdin
+    output=open(args.output,'w') if args.output else sys.stdout
+    try:
+        analyse(lines,output,args.time,args.depth,max(1,args.workers),max(1,args.threads))
+    finally:
+        if args.input:
+            lines.close()
+        if args.output:
+            output.close()
+
+if __name__=="__main__":
+    main()
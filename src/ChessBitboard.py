@@ -0,0 +1,801 @@
+"""
+Bitboard position core - move generation and make/undo on 64-bit integers instead of the 8x8 string board
+    - Each piece type of each color is stored as a 64-bit integer (one bit per square)
+    - Square index is row*8+col, so bit 0 is a8 and bit 63 is h1 (same orientation as `GameState.board`)
+    - Keeps the same makeMove/undoMove/getValidMoves contract as ChessEngine.GameState (FEN/byte encodings and the draw
+      rules are shared with it), so the AI, the search worker and the tools run on it without knowing the difference
+    - It is not a GameState subclass: makeMove/undoMove only update the bitboards, one history entry per move and the
+      squares of `board` the move touches (`board` is kept only as the piece-on-square lookup Move objects are built from)
+    - Sliding attacks are looked up by square and the occupancy of the squares that can block them, each computed the
+      first time that occupancy comes up (magic bitboards with a dict in place of the multiply)
+"""
+
+import ChessEngine
+from ChessEngine import ZOBRIST_PIECES, ZOBRIST_CASTLING, ZOBRIST_ENPASSANT, ZOBRIST_BLACK_TO_MOVE, Move
+
+PIECES=('wp','wR','wN','wB','wQ','wK','bp','bR','bN','bB','bQ','bK')
+COLOR_PIECES={'w':('wp','wN','wB','wR','wQ','wK'),'b':('bp','bN','bB','bR','bQ','bK')}  # pawn, knight, bishop, rook, queen, king
+SQUARE_COORDS=[divmod(sq,8) for sq in range(64)]  # (row, col) of each square index, the way Move takes them
+
+def bit(row,col):
+    return 1<<(row*8+col)
+
+def lsb(bitboard):
+    """
+    Index of the least significant set bit
+    """
+    return (bitboard&-bitboard).bit_length()-1
+
+def msb(bitboard):
+    """
+    Index of the most significant set bit
+    """
+    return bitboard.bit_length()-1
+
+def squares(bitboard):
+    """
+    Yields the index of every set bit in the bitboard
+    """
+    while bitboard:
+        lowBit=bitboard&-bitboard
+        yield lowBit.bit_length()-1
+        bitboard^=lowBit
+
+def popCount(bitboard):
+    return bin(bitboard).count('1')
+
+def addMoves(moves,start,targets,board):
+    """
+    Appends a Move from `start` (row, col) to every square of the `targets` bitboard
+    """
+    coords=SQUARE_COORDS
+    while targets:
+        endBit=targets&-targets
+        targets^=endBit
+        moves.append(Move(start,coords[endBit.bit_length()-1],board))
+
+def _stepAttacks(offsets):
+    """
+    Builds a 64 entry table of the squares reached from each square by a single step of each offset (knight/king)
+    """
+    table=[]
+    for sq in range(64):
+        row,col=divmod(sq,8)
+        attacks=0
+        for dRow,dCol in offsets:
+            if 0<=row+dRow<=7 and 0<=col+dCol<=7:
+                attacks|=bit(row+dRow,col+dCol)
+        table.append(attacks)
+    return table
+
+KNIGHT_ATTACKS=_stepAttacks(((-2,-1),(-2,1),(-1,-2),(-1,2),(1,-2),(1,2),(2,-1),(2,1)))
+KING_ATTACKS=_stepAttacks(((-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)))
+# squares attacked by a pawn of the given color standing on a square (white pawns move up the board, ie. row-1)
+PAWN_ATTACKS={'w':_stepAttacks(((-1,-1),(-1,1))),'b':_stepAttacks(((1,-1),(1,1)))}
+
+# Sliding pieces - a ray per direction per square, blocked by the first occupied square along it
+    # "positive" directions walk towards higher square indexes, so the nearest blocker is the lowest set bit
+    # "negative" directions walk towards lower square indexes, so the nearest blocker is the highest set bit
+ROOK_DIRECTIONS=((1,0),(0,1),(-1,0),(0,-1))
+BISHOP_DIRECTIONS=((1,1),(1,-1),(-1,-1),(-1,1))
+
+def _rays(direction):
+    table=[]
+    for sq in range(64):
+        row,col=divmod(sq,8)
+        ray=0
+        for i in range(1,8):
+            endRow=row+direction[0]*i
+            endCol=col+direction[1]*i
+            if not(0<=endRow<=7 and 0<=endCol<=7):
+                break
+            ray|=bit(endRow,endCol)
+        table.append(ray)
+    return table
+
+RAYS={direction:_rays(direction) for direction in ROOK_DIRECTIONS+BISHOP_DIRECTIONS}
+
+def _isPositive(direction):
+    return direction[0]>0 or (direction[0]==0 and direction[1]>0)
+
+# (ray table, is positive direction) pairs so the attack loops don't recompute the direction sign
+ROOK_RAYS=tuple((RAYS[direction],_isPositive(direction)) for direction in ROOK_DIRECTIONS)
+BISHOP_RAYS=tuple((RAYS[direction],_isPositive(direction)) for direction in BISHOP_DIRECTIONS)
+
+def _slidingAttacks(sq,occupied,rays):
+    attacks=0
+    for table,positive in rays:
+        ray=table[sq]
+        blockers=ray&occupied
+        if blockers:
+            blocker=lsb(blockers) if positive else msb(blockers)
+            ray^=table[blocker]  # cut the ray off behind the first blocker (blocker itself stays attacked)
+        attacks|=ray
+    return attacks
+
+def _blockerMask(sq,directions):
+    """
+    Squares of the rays from sq that can block them - the last square of a ray has nothing behind it to block
+    """
+    mask=0
+    for direction in directions:
+        ray=RAYS[direction][sq]
+        if ray:
+            mask|=ray^(1<<(msb(ray) if _isPositive(direction) else lsb(ray)))
+    return mask
+
+ROOK_BLOCKERS=[_blockerMask(sq,ROOK_DIRECTIONS) for sq in range(64)]
+BISHOP_BLOCKERS=[_blockerMask(sq,BISHOP_DIRECTIONS) for sq in range(64)]
+ROOK_TABLES=[{} for _ in range(64)]  # per square: occupancy of its blocker squares -> attacks, filled as they come up
+BISHOP_TABLES=[{} for _ in range(64)]
+
+def rookAttacks(sq,occupied):
+    blockers=occupied&ROOK_BLOCKERS[sq]
+    table=ROOK_TABLES[sq]
+    attacks=table.get(blockers)
+    if attacks is None:
+        attacks=table[blockers]=_slidingAttacks(sq,blockers,ROOK_RAYS)
+    return attacks
+
+def bishopAttacks(sq,occupied):
+    blockers=occupied&BISHOP_BLOCKERS[sq]
+    table=BISHOP_TABLES[sq]
+    attacks=table.get(blockers)
+    if attacks is None:
+        attacks=table[blockers]=_slidingAttacks(sq,blockers,BISHOP_RAYS)
+    return attacks
+
+def queenAttacks(sq,occupied):
+    return rookAttacks(sq,occupied)|bishopAttacks(sq,occupied)
+
+def _between():
+    table=[[0]*64 for _ in range(64)]
+    for sq in range(64):
+        row,col=divmod(sq,8)
+        for dRow,dCol in ROOK_DIRECTIONS+BISHOP_DIRECTIONS:
+            path=0
+            endRow,endCol=row+dRow,col+dCol
+            while 0<=endRow<=7 and 0<=endCol<=7:
+                table[sq][endRow*8+endCol]=path
+                path|=bit(endRow,endCol)
+                endRow,endCol=endRow+dRow,endCol+dCol
+    return table
+
+BETWEEN=_between()  # BETWEEN[a][b]: squares strictly between a and b when they share a line, otherwise 0
+
+ROW_MASKS=[0xFF<<(8*row) for row in range(8)]
+# castling per color - (rights bit, squares that must be empty, squares the king passes through and lands on, king end)
+CASTLING={'w':((1,bit(7,5)|bit(7,6),(61,62),62),(2,bit(7,1)|bit(7,2)|bit(7,3),(59,58),58)),
+          'b':((4,bit(0,5)|bit(0,6),(5,6),6),(8,bit(0,1)|bit(0,2)|bit(0,3),(3,2),2))}
+# rights kept (bits of CastlingRights.index()) when a move starts or ends on each square - a king or rook leaving its
+# square, or a rook being captured on it, loses the rights that depend on it
+CASTLING_MASKS=[15]*64
+for _sq,_lost in ((60,3),(63,1),(56,2),(4,12),(7,4),(0,8)):
+    CASTLING_MASKS[_sq]=15^_lost
+
+class BitboardGameState():
+    """
+    Position and game history kept in bitboards - see the module docstring
+        - move generation is legal: the pieces giving check and the pinned pieces are found once per position, then each
+          piece's moves are its attacks masked by them (only enpassant captures are tried out one by one)
+        - history holds one entry per move made - castling rights, enpassant square, halfmove clock, zobrist key and
+          scores from before it - so undoMove restores everything without a log per field
+    """
+    # position I/O and the draw rules only read/set board, whiteToMove, currentCastlingRights, enpassantPossible and the
+    # counters (setting goes through setPosition), which this class keeps under the same names - so they are shared
+    fromFen=classmethod(ChessEngine.GameState.fromFen.__func__)
+    fromBytes=classmethod(ChessEngine.GameState.fromBytes.__func__)
+    loadFen=ChessEngine.GameState.loadFen
+    toFen=ChessEngine.GameState.toFen
+    loadBytes=ChessEngine.GameState.loadBytes
+    toBytes=ChessEngine.GameState.toBytes
+    computeZobristKey=ChessEngine.GameState.computeZobristKey
+    computeScores=ChessEngine.GameState.computeScores
+    isRepetition=ChessEngine.GameState.isRepetition
+    getDrawReason=ChessEngine.GameState.getDrawReason
+
+    def __init__(self):
+        self.loadFen(ChessEngine.STARTING_FEN)
+
+    @property
+    def scoreTable(self):
+        return ChessEngine.GameState.scoreTable  # installed by ChessAI, the same table for both engines
+
+    @property
+    def currentCastlingRights(self):
+        """
+        Castling rights as a ChessEngine.CastlingRights - they are kept as the bits of its index() in castlingRights
+        """
+        rights=self.castlingRights
+        return ChessEngine.CastlingRights(bool(rights&1),bool(rights&2),bool(rights&4),bool(rights&8))
+
+    @classmethod
+    def fromGameState(cls,gamestate):
+        """
+        Copies a game (a ChessEngine.GameState or a BitboardGameState) - the current position and its history, so moves
+        made before the copy can still be undone and repeats of earlier positions are still seen
+        """
+        state=cls.__new__(cls)
+        state.setPosition([row[:] for row in gamestate.board],gamestate.whiteToMove,gamestate.currentCastlingRights,
+                          gamestate.enpassantPossible,gamestate.halfmoveClock,gamestate.fullmoveNumber)
+        state.moveLog=list(gamestate.moveLog)
+        state.positionCounts=dict(gamestate.positionCounts)
+        if isinstance(gamestate,BitboardGameState):
+            state.history=list(gamestate.history)
+        else:  # rebuilt from the mailbox's per field logs (one entry per position reached)
+            state.history=[(gamestate.CastlingRightsLog[i].index(),gamestate.enpassantPossibleLog[i],
+                            gamestate.halfmoveClockLog[i],gamestate.zobristKeyLog[i])+gamestate.scoresLog[i]
+                           for i in range(len(gamestate.moveLog))]
+        state.checkmate=gamestate.checkmate
+        state.stalemate=gamestate.stalemate
+        state.draw=gamestate.draw
+        return state
+
+    def setPosition(self,board,whiteToMove,castlingRights,enpassantPossible,halfmoveClock=0,fullmoveNumber=1):
+        """
+        Replaces the position with the one given (board is kept, not copied), the game and its history start over from it
+        """
+        self.board=board
+        self.whiteToMove=whiteToMove
+        self.castlingRights=castlingRights.index()
+        self.enpassantPossible=enpassantPossible
+        self.halfmoveClock=halfmoveClock
+        self.fullmoveNumber=fullmoveNumber
+        self.pieceBitboards={piece:0 for piece in PIECES}
+        self.colorBitboards={'w':0,'b':0}
+        for row in range(8):
+            for col in range(8):
+                piece=board[row][col]
+                if piece!='--':
+                    self.pieceBitboards[piece]|=bit(row,col)
+                    self.colorBitboards[piece[0]]|=bit(row,col)
+        self.moveLog=[]
+        self.history=[]
+        self.checkmate=False
+        self.stalemate=False
+        self.draw=False
+        self.zobristKey=self.computeZobristKey()
+        self.positionCounts={self.zobristKey:1}
+        self.whiteScore,self.blackScore=self.computeScores()
+        self.kingSafetyKey=None  # position getKingSafety last worked out
+
+    def makeMove(self,move):
+        """
+        Makes a move - the bitboards, the board squares it touches, castling rights, enpassant square, counters, zobrist
+        key and scores are all updated from what it changes
+        """
+        startRow,startCol,endRow,endCol=move.startRow,move.startCol,move.endRow,move.endCol
+        startSq=startRow*8+startCol
+        endSq=endRow*8+endCol
+        pieceMoved=move.pieceMoved
+        pieceCaptured=move.pieceCaptured
+        color=pieceMoved[0]
+        placedPiece=color+move.promotionPiece if move.isPawnPromotion else pieceMoved
+        pieces=self.pieceBitboards
+        colors=self.colorBitboards
+        board=self.board
+        table=ChessEngine.GameState.scoreTable
+        previousEnpassantKey=self.getEnpassantKey() if self.enpassantPossible!=() else 0  # before the board changes
+        self.history.append((self.castlingRights,self.enpassantPossible,self.halfmoveClock,self.zobristKey,
+                             self.whiteScore,self.blackScore))
+        self.moveLog.append(move)
+
+        startBit=1<<startSq
+        endBit=1<<endSq
+        pieces[pieceMoved]^=startBit
+        pieces[placedPiece]^=endBit
+        colors[color]^=startBit|endBit
+        board[startRow][startCol]='--'
+        board[endRow][endCol]=placedPiece
+        key=self.zobristKey^ZOBRIST_BLACK_TO_MOVE^ZOBRIST_PIECES[pieceMoved][startSq]^ZOBRIST_PIECES[placedPiece][endSq]
+        moverDelta=table[placedPiece][endSq]-table[pieceMoved][startSq] if table is not None else 0
+        capturedDelta=0
+        if pieceCaptured!='--':
+            if move.isEnpassantMove:
+                capturedSq=startRow*8+endCol  # the pawn beside the moving pawn
+                board[startRow][endCol]='--'
+            else:
+                capturedSq=endSq
+            capturedBit=1<<capturedSq
+            pieces[pieceCaptured]^=capturedBit
+            colors[pieceCaptured[0]]^=capturedBit
+            key^=ZOBRIST_PIECES[pieceCaptured][capturedSq]
+            if table is not None:
+                capturedDelta=table[pieceCaptured][capturedSq]
+        if move.isCastleMove:
+            rook=color+'R'
+            rookStart,rookEnd=(endSq+1,endSq-1) if endCol>startCol else (endSq-2,endSq+1)
+            rookBits=1<<rookStart|1<<rookEnd
+            pieces[rook]^=rookBits
+            colors[color]^=rookBits
+            board[endRow][rookStart%8]='--'
+            board[endRow][rookEnd%8]=rook
+            key^=ZOBRIST_PIECES[rook][rookStart]^ZOBRIST_PIECES[rook][rookEnd]
+            if table is not None:
+                moverDelta+=table[rook][rookEnd]-table[rook][rookStart]
+
+        rights=self.castlingRights
+        if rights:
+            newRights=rights&CASTLING_MASKS[startSq]&CASTLING_MASKS[endSq]
+            if newRights!=rights:
+                key^=ZOBRIST_CASTLING[rights]^ZOBRIST_CASTLING[newRights]
+                self.castlingRights=newRights
+        key^=previousEnpassantKey
+        if pieceMoved[1]=='p' and (endRow-startRow==2 or startRow-endRow==2):
+            self.enpassantPossible=((startRow+endRow)//2,startCol)
+        else:
+            self.enpassantPossible=()
+        self.halfmoveClock=0 if pieceMoved[1]=='p' or pieceCaptured!='--' else self.halfmoveClock+1
+        if color=='b':
+            self.fullmoveNumber+=1
+            self.blackScore+=moverDelta
+            self.whiteScore-=capturedDelta
+        else:
+            self.whiteScore+=moverDelta
+            self.blackScore-=capturedDelta
+        self.whiteToMove=not self.whiteToMove
+        if self.enpassantPossible!=():
+            key^=self.getEnpassantKey()
+        self.zobristKey=key
+        counts=self.positionCounts
+        counts[key]=counts.get(key,0)+1
+
+    def undoMove(self):
+        """
+        Undo the last move made
+        """
+        if len(self.moveLog)!=0:
+            move=self.moveLog.pop()
+            counts=self.positionCounts
+            count=counts[self.zobristKey]
+            if count==1:
+                del counts[self.zobristKey]
+            else:
+                counts[self.zobristKey]=count-1
+            self.castlingRights,self.enpassantPossible,self.halfmoveClock,self.zobristKey,self.whiteScore,self.blackScore= \
+                self.history.pop()
+
+            startRow,startCol,endRow,endCol=move.startRow,move.startCol,move.endRow,move.endCol
+            startSq=startRow*8+startCol
+            endSq=endRow*8+endCol
+            pieceMoved=move.pieceMoved
+            pieceCaptured=move.pieceCaptured
+            color=pieceMoved[0]
+            placedPiece=color+move.promotionPiece if move.isPawnPromotion else pieceMoved
+            pieces=self.pieceBitboards
+            colors=self.colorBitboards
+            board=self.board
+            startBit=1<<startSq
+            endBit=1<<endSq
+            pieces[pieceMoved]^=startBit
+            pieces[placedPiece]^=endBit
+            colors[color]^=startBit|endBit
+            board[startRow][startCol]=pieceMoved
+            board[endRow][endCol]='--'
+            if pieceCaptured!='--':
+                if move.isEnpassantMove:
+                    capturedSq=startRow*8+endCol
+                    board[startRow][endCol]=pieceCaptured
+                else:
+                    capturedSq=endSq
+                    board[endRow][endCol]=pieceCaptured
+                capturedBit=1<<capturedSq
+                pieces[pieceCaptured]^=capturedBit
+                colors[pieceCaptured[0]]^=capturedBit
+            if move.isCastleMove:
+                rook=color+'R'
+                rookStart,rookEnd=(endSq+1,endSq-1) if endCol>startCol else (endSq-2,endSq+1)
+                rookBits=1<<rookStart|1<<rookEnd
+                pieces[rook]^=rookBits
+                colors[color]^=rookBits
+                board[endRow][rookStart%8]=rook
+                board[endRow][rookEnd%8]='--'
+            if color=='b':
+                self.fullmoveNumber-=1
+            self.whiteToMove=not self.whiteToMove
+            self.checkmate=False
+            self.stalemate=False
+            self.draw=False
+
+    def getAttackers(self,sq,byColor,occupied):
+        """
+        Bitboard of the pieces of `byColor` that attack square index `sq`, sliding through `occupied`
+        """
+        pawn,knight,bishop,rook,queen,king=COLOR_PIECES[byColor]
+        pieces=self.pieceBitboards
+        return (KNIGHT_ATTACKS[sq]&pieces[knight])|(KING_ATTACKS[sq]&pieces[king])| \
+               (PAWN_ATTACKS['b' if byColor=='w' else 'w'][sq]&pieces[pawn])| \
+               (rookAttacks(sq,occupied)&(pieces[rook]|pieces[queen]))|(bishopAttacks(sq,occupied)&(pieces[bishop]|pieces[queen]))
+
+    def isSquareAttacked(self,sq,byColor,occupied=None,removed=0):
+        """
+        Determine if pieces of `byColor` attack square index `sq`
+            - occupied: occupancy to slide through (defaults to the current board)
+            - removed: bitboard of attackers that should be ignored (ie. captured in a hypothetical move)
+        """
+        if occupied is None:
+            occupied=self.colorBitboards['w']|self.colorBitboards['b']
+        pawn,knight,bishop,rook,queen,king=COLOR_PIECES[byColor]
+        pieces=self.pieceBitboards
+        keep=~removed
+        # a pawn of byColor attacks sq if a pawn of the other color on sq would attack the pawn's square
+        if KNIGHT_ATTACKS[sq]&pieces[knight]&keep or KING_ATTACKS[sq]&pieces[king] or \
+                PAWN_ATTACKS['b' if byColor=='w' else 'w'][sq]&pieces[pawn]&keep:
+            return True
+        return bool(rookAttacks(sq,occupied)&(pieces[rook]|pieces[queen])&keep or
+                    bishopAttacks(sq,occupied)&(pieces[bishop]|pieces[queen])&keep)
+
+    def getAttackMap(self,byColor,transparentSquare=None):
+        """
+        Every square attacked by pieces of `byColor` as a bitboard - same contract as ChessEngine.GameState.getAttackMap
+        """
+        pieces=self.pieceBitboards
+        occupied=self.colorBitboards['w']|self.colorBitboards['b']
+        if transparentSquare is not None:
+            occupied&=~bit(*transparentSquare)
+        attacks=0
+        for sq in squares(pieces[byColor+'p']):
+            attacks|=PAWN_ATTACKS[byColor][sq]
+        for sq in squares(pieces[byColor+'N']):
+            attacks|=KNIGHT_ATTACKS[sq]
+        for sq in squares(pieces[byColor+'K']):
+            attacks|=KING_ATTACKS[sq]
+        for sq in squares(pieces[byColor+'B']|pieces[byColor+'Q']):
+            attacks|=bishopAttacks(sq,occupied)
+        for sq in squares(pieces[byColor+'R']|pieces[byColor+'Q']):
+            attacks|=rookAttacks(sq,occupied)
+        return attacks
+
+    def squareUnderAttack(self,row,col):
+        return self.isSquareAttacked(row*8+col,'b' if self.whiteToMove else 'w')
+
+    def inCheck(self):
+        allyColor,enemyColor=('w','b') if self.whiteToMove else ('b','w')
+        return self.isSquareAttacked(self.pieceBitboards[allyColor+'K'].bit_length()-1,enemyColor)
+
+    # Search-oriented generation - the AI asks for moves a stage at a time and only checks legality of the moves it
+    # actually tries, so a beta cutoff on an early capture skips generating (and legality checking) everything else
+    def addPieceMoves(self,moves,allyColor,targetMask,occupied):
+        """
+        Appends the knight, bishop, rook, queen and king moves of `allyColor` that end on `targetMask` to moves
+        """
+        pawn,knight,bishop,rook,queen,king=COLOR_PIECES[allyColor]
+        pieces=self.pieceBitboards
+        board=self.board
+        coords=SQUARE_COORDS
+        for pieceBitboard,attacks in ((pieces[knight],None),(pieces[bishop],bishopAttacks),(pieces[rook],rookAttacks),
+                                      (pieces[queen],queenAttacks)):
+            while pieceBitboard:
+                startBit=pieceBitboard&-pieceBitboard
+                pieceBitboard^=startBit
+                startSq=startBit.bit_length()-1
+                addMoves(moves,coords[startSq],
+                         (KNIGHT_ATTACKS[startSq] if attacks is None else attacks(startSq,occupied))&targetMask,board)
+        kingSq=pieces[king].bit_length()-1
+        addMoves(moves,coords[kingSq],KING_ATTACKS[kingSq]&targetMask,board)
+
+    def getPseudoLegalCaptures(self):
+        """
+        The pseudo-legal captures and promotions (to a queen, see getPseudoLegalQuietMoves) as a list of Moves
+        """
+        allyColor,enemyColor=('w','b') if self.whiteToMove else ('b','w')
+        pieces=self.pieceBitboards
+        enemies=self.colorBitboards[enemyColor]
+        occupied=self.colorBitboards[allyColor]|enemies
+        board=self.board
+        coords=SQUARE_COORDS
+        moves=[]
+        # pawns - captures, and advances onto the last row
+        step,lastRow=(-8,ROW_MASKS[0]) if allyColor=='w' else (8,ROW_MASKS[7])
+        pawnAttacks=PAWN_ATTACKS[allyColor]
+        pawns=pieces[allyColor+'p']
+        while pawns:
+            startBit=pawns&-pawns
+            pawns^=startBit
+            startSq=startBit.bit_length()-1
+            targets=pawnAttacks[startSq]&enemies
+            endBit=1<<(startSq+step)
+            if endBit&lastRow and not endBit&occupied:
+                targets|=endBit
+            addMoves(moves,coords[startSq],targets,board)
+        if self.enpassantPossible!=():
+            enpassantSq=self.enpassantPossible[0]*8+self.enpassantPossible[1]
+            for startSq in squares(PAWN_ATTACKS[enemyColor][enpassantSq]&pieces[allyColor+'p']):
+                moves.append(Move(coords[startSq],self.enpassantPossible,board,isEnpassantMove=True))
+        self.addPieceMoves(moves,allyColor,enemies,occupied)
+        return moves
+
+    def getPseudoLegalQuietMoves(self):
+        """
+        The pseudo-legal moves that capture nothing and don't promote, including castling, as a list of Moves - then the
+        underpromotions (rarely worth searching early)
+        """
+        allyColor,enemyColor=('w','b') if self.whiteToMove else ('b','w')
+        pieces=self.pieceBitboards
+        enemies=self.colorBitboards[enemyColor]
+        occupied=self.colorBitboards[allyColor]|enemies
+        empty=~occupied
+        board=self.board
+        coords=SQUARE_COORDS
+        moves=[]
+        # pawns - single and double advances (those onto the last row are promotions, generated with the captures)
+        if allyColor=='w':
+            step,initialRow,lastRow=-8,ROW_MASKS[6],ROW_MASKS[0]
+        else:
+            step,initialRow,lastRow=8,ROW_MASKS[1],ROW_MASKS[7]
+        promotingPawns=0
+        pawns=pieces[allyColor+'p']
+        while pawns:
+            startBit=pawns&-pawns
+            pawns^=startBit
+            startSq=startBit.bit_length()-1
+            endBit=1<<(startSq+step)
+            if endBit&lastRow:
+                promotingPawns|=startBit
+            elif endBit&empty:
+                moves.append(Move(coords[startSq],coords[startSq+step],board))
+                if startBit&initialRow and empty>>(startSq+2*step)&1:
+                    moves.append(Move(coords[startSq],coords[startSq+2*step],board))
+        self.addPieceMoves(moves,allyColor,empty,occupied)
+        # castling (only the squares the king passes through are checked here, the landing square is checked as a normal
+        # move by isLegal)
+        rights=self.castlingRights
+        if rights:
+            kingSq=pieces[allyColor+'K'].bit_length()-1
+            for right,emptyPath,kingPath,kingEnd in CASTLING[allyColor]:
+                if rights&right and not occupied&emptyPath and not self.isSquareAttacked(kingSq,enemyColor,occupied) \
+                        and not self.isSquareAttacked(kingPath[0],enemyColor,occupied):
+                    moves.append(Move(coords[kingSq],coords[kingEnd],board,isCastleMove=True))
+        # underpromotions
+        pawnAttacks=PAWN_ATTACKS[allyColor]
+        while promotingPawns:
+            startBit=promotingPawns&-promotingPawns
+            promotingPawns^=startBit
+            startSq=startBit.bit_length()-1
+            targets=pawnAttacks[startSq]&enemies
+            if empty>>(startSq+step)&1:
+                targets|=1<<(startSq+step)
+            while targets:
+                endBit=targets&-targets
+                targets^=endBit
+                for promotionPiece in Move.promotionPieces[1:]:
+                    moves.append(Move(coords[startSq],coords[endBit.bit_length()-1],board,promotionPiece=promotionPiece))
+        return moves
+
+    def getPseudoLegalMoves(self):
+        """
+        Every pseudo-legal move as a list, captures first - check each with isLegalMove before making it
+        """
+        return self.getPseudoLegalCaptures()+self.getPseudoLegalQuietMoves()
+
+    def getPseudoLegalMove(self,moveID):
+        """
+        Rebuilds a non-castling move from its moveID if it is pseudo-legal in this position, otherwise returns None
+            - lets the search try a remembered move (hash move, killer move) before generating anything
+        """
+        promotionIndex,moveID=divmod(moveID,10000)  # 0 for moves that aren't promotions, else index of the piece + 1
+        startRow,startCol,endRow,endCol=moveID//1000,moveID//100%10,moveID//10%10,moveID%10
+        startSq=startRow*8+startCol
+        endSq=endRow*8+endCol
+        allyColor='w' if self.whiteToMove else 'b'
+        piece=self.board[startRow][startCol]
+        if piece[0]!=allyColor or self.board[endRow][endCol][0]==allyColor:
+            return None
+        endBit=1<<endSq
+        occupied=self.colorBitboards['w']|self.colorBitboards['b']
+        pieceType=piece[1]
+        isEnpassantMove=False
+        if pieceType=='p':
+            step=-8 if allyColor=='w' else 8
+            if endBit&PAWN_ATTACKS[allyColor][startSq]:
+                isEnpassantMove=self.enpassantPossible==(endRow,endCol)
+                if not(endBit&occupied) and not isEnpassantMove:
+                    return None
+            elif endSq==startSq+step:
+                if endBit&occupied:
+                    return None
+            elif endSq==startSq+2*step and startRow==(6 if allyColor=='w' else 1):
+                if (endBit|1<<(startSq+step))&occupied:
+                    return None
+            else:
+                return None
+        elif pieceType=='N':
+            attacks=KNIGHT_ATTACKS[startSq]
+        elif pieceType=='B':
+            attacks=bishopAttacks(startSq,occupied)
+        elif pieceType=='R':
+            attacks=rookAttacks(startSq,occupied)
+        elif pieceType=='Q':
+            attacks=queenAttacks(startSq,occupied)
+        else:
+            attacks=KING_ATTACKS[startSq]  # castling moves are left to the quiet move generation
+        if pieceType!='p' and not(attacks&endBit):
+            return None
+        if (pieceType=='p' and endRow in (0,7))!=(promotionIndex!=0):  # promotion moveIDs only for pawns reaching the last row
+            return None
+        return ChessEngine.Move((startRow,startCol),(endRow,endCol),self.board,isEnpassantMove=isEnpassantMove,
+                                promotionPiece=ChessEngine.Move.promotionPieces[promotionIndex-1] if promotionIndex else None)
+
+    def isLegalMove(self,move):
+        """
+        Determine if a pseudo-legal move leaves the mover's own king safe
+        """
+        return self.isLegal(move.startRow*8+move.startCol,move.endRow*8+move.endCol,move.isEnpassantMove)
+
+    def getEnpassantKey(self):
+        """
+        Zobrist key of the enpassant file, or 0 - same rule as ChessEngine.GameState.getEnpassantKey (only hashed when a
+        pawn of the side to move can really capture enpassant)
+        """
+        if self.enpassantPossible==():
+            return 0
+        row,col=self.enpassantPossible
+        if row!=(2 if self.whiteToMove else 5):
+            return 0
+        allyColor,enemyColor=('w','b') if self.whiteToMove else ('b','w')
+        enpassantSq=row*8+col
+        for startSq in squares(PAWN_ATTACKS[enemyColor][enpassantSq]&self.pieceBitboards[allyColor+'p']):
+            if self.isKingSafeAfter(startSq,enpassantSq,True):
+                return ZOBRIST_ENPASSANT[col]
+        return 0
+
+    def getKingSafety(self):
+        """
+        (king square, whether it is in check, squares between it and the enemy sliders on its lines) for the side to move
+            - worked out once per position (by zobrist key) - the search checks the legality of many moves in each one
+        """
+        if self.kingSafetyKey!=self.zobristKey:
+            allyColor,enemyColor=('w','b') if self.whiteToMove else ('b','w')
+            pieces=self.pieceBitboards
+            kingSq=pieces[allyColor+'K'].bit_length()-1
+            pinLines=0
+            snipers=(rookAttacks(kingSq,0)&(pieces[enemyColor+'R']|pieces[enemyColor+'Q']))| \
+                    (bishopAttacks(kingSq,0)&(pieces[enemyColor+'B']|pieces[enemyColor+'Q']))
+            while snipers:
+                sniperBit=snipers&-snipers
+                snipers^=sniperBit
+                pinLines|=BETWEEN[kingSq][sniperBit.bit_length()-1]
+            self.kingSafety=(kingSq,self.isSquareAttacked(kingSq,enemyColor),pinLines)
+            self.kingSafetyKey=self.zobristKey
+        return self.kingSafety
+
+    def isLegal(self,startSq,endSq,isEnpassantMove):
+        """
+        Determine if a pseudo-legal move leaves the mover's own king safe, without touching the board
+            - when not in check, a move other than a king move or enpassant can only expose the king by leaving a square
+              between it and an enemy slider, so every other move is legal without looking at attacks
+        """
+        kingSq,inCheck,pinLines=self.getKingSafety()
+        if not inCheck and not isEnpassantMove and startSq!=kingSq and not 1<<startSq&pinLines:
+            return True
+        return self.isKingSafeAfter(startSq,endSq,isEnpassantMove)
+
+    def isKingSafeAfter(self,startSq,endSq,isEnpassantMove):
+        """
+        Determine if the mover's king is safe after a pseudo-legal move, by looking up the attacks on it with the move's
+        squares changed in the occupancy
+        """
+        allyColor,enemyColor=('w','b') if self.whiteToMove else ('b','w')
+        startBit=1<<startSq
+        endBit=1<<endSq
+        occupied=(self.colorBitboards['w']|self.colorBitboards['b'])^startBit
+        captured=endBit&self.colorBitboards[enemyColor]
+        if isEnpassantMove:
+            captured=1<<(startSq-startSq%8+endSq%8)  # pawn is beside the moving pawn, on its start row
+            occupied^=captured
+        occupied|=endBit
+        kingBitboard=self.pieceBitboards[allyColor+'K']
+        kingSq=endSq if kingBitboard&startBit else kingBitboard.bit_length()-1
+        return not self.isSquareAttacked(kingSq,enemyColor,occupied,captured)
+
+    def getValidMoves(self):
+        """
+        Creates a list of valid moves from the bitboards - every move generated is legal, nothing is made and undone
+        """
+        allyColor,enemyColor=('w','b') if self.whiteToMove else ('b','w')
+        pawn,knight,bishop,rook,queen,king=COLOR_PIECES[allyColor]
+        pieces=self.pieceBitboards
+        allies=self.colorBitboards[allyColor]
+        enemies=self.colorBitboards[enemyColor]
+        occupied=allies|enemies
+        board=self.board
+        coords=SQUARE_COORDS
+        moves=[]
+        kingSq=pieces[king].bit_length()-1
+        kingStart=coords[kingSq]
+        checkers=self.getAttackers(kingSq,enemyColor,occupied)
+
+        # king - the squares it steps to are checked with it off the board, so it can't hide from a slider behind itself
+        withoutKing=occupied^(1<<kingSq)
+        targets=KING_ATTACKS[kingSq]&~allies
+        while targets:
+            endBit=targets&-targets
+            targets^=endBit
+            endSq=endBit.bit_length()-1
+            if not self.isSquareAttacked(endSq,enemyColor,withoutKing):
+                moves.append(Move(kingStart,coords[endSq],board))
+
+        if not checkers&(checkers-1):  # unless in double check, other pieces can move too
+            # allowed end squares - anywhere not taken by an ally, or when in check only capturing/blocking the checker
+            allowed=~allies
+            if checkers:
+                allowed&=checkers|BETWEEN[kingSq][checkers.bit_length()-1]
+            # pinned pieces - the only ally between the king and an enemy slider on its line can only move along that line
+            pinned=0
+            pinRays={}  # pinned piece's bit -> squares it may move to
+            enemyRooks=pieces[enemyColor+'R']|pieces[enemyColor+'Q']
+            enemyBishops=pieces[enemyColor+'B']|pieces[enemyColor+'Q']
+            snipers=(rookAttacks(kingSq,0)&enemyRooks)|(bishopAttacks(kingSq,0)&enemyBishops)
+            while snipers:
+                sniperBit=snipers&-snipers
+                snipers^=sniperBit
+                line=BETWEEN[kingSq][sniperBit.bit_length()-1]
+                blockers=line&occupied
+                if blockers&allies and not blockers&(blockers-1):
+                    pinned|=blockers
+                    pinRays[blockers]=line|sniperBit
+
+            # knights (a pinned knight can never stay on its line), bishops, rooks and queens
+            for pieceBitboard,attacks in ((pieces[knight]&~pinned,None),(pieces[bishop],bishopAttacks),
+                                          (pieces[rook],rookAttacks),(pieces[queen],queenAttacks)):
+                while pieceBitboard:
+                    startBit=pieceBitboard&-pieceBitboard
+                    pieceBitboard^=startBit
+                    startSq=startBit.bit_length()-1
+                    targets=(KNIGHT_ATTACKS[startSq] if attacks is None else attacks(startSq,occupied))&allowed
+                    if startBit&pinned:
+                        targets&=pinRays[startBit]
+                    addMoves(moves,coords[startSq],targets,board)
+
+            # pawns
+            if allyColor=='w':
+                step,initialRow,lastRow=-8,ROW_MASKS[6],ROW_MASKS[0]
+            else:
+                step,initialRow,lastRow=8,ROW_MASKS[1],ROW_MASKS[7]
+            pawnAttacks=PAWN_ATTACKS[allyColor]
+            pawns=pieces[pawn]
+            while pawns:
+                startBit=pawns&-pawns
+                pawns^=startBit
+                startSq=startBit.bit_length()-1
+                mask=allowed&pinRays[startBit] if startBit&pinned else allowed
+                targets=pawnAttacks[startSq]&enemies
+                oneStep=startSq+step
+                if not occupied>>oneStep&1:
+                    targets|=1<<oneStep
+                    if startBit&initialRow and not occupied>>(oneStep+step)&1:
+                        targets|=1<<(oneStep+step)
+                targets&=mask
+                start=coords[startSq]
+                while targets:
+                    endBit=targets&-targets
+                    targets^=endBit
+                    end=coords[endBit.bit_length()-1]
+                    if endBit&lastRow:  # promotion - one move per piece
+                        for promotionPiece in Move.promotionPieces:
+                            moves.append(Move(start,end,board,promotionPiece=promotionPiece))
+                    else:
+                        moves.append(Move(start,end,board))
+            # enpassant - rare, and it can expose the king along the row both pawns leave, so each is tried out
+            if self.enpassantPossible!=():
+                enpassantSq=self.enpassantPossible[0]*8+self.enpassantPossible[1]
+                for startSq in squares(PAWN_ATTACKS[enemyColor][enpassantSq]&pieces[pawn]):
+                    if self.isKingSafeAfter(startSq,enpassantSq,True):
+                        moves.append(Move(coords[startSq],self.enpassantPossible,board,isEnpassantMove=True))
+
+            # castling - never out of check, through or into an attacked square
+            rights=self.castlingRights
+            if rights and not checkers:
+                for right,emptyPath,kingPath,kingEnd in CASTLING[allyColor]:
+                    if rights&right and not occupied&emptyPath and not self.isSquareAttacked(kingPath[0],enemyColor,occupied) \
+                            and not self.isSquareAttacked(kingPath[1],enemyColor,occupied):
+                        moves.append(Move(kingStart,coords[kingEnd],board,isCastleMove=True))
+
+        if len(moves)==0:
+            self.checkmate=checkers!=0
+            self.stalemate=checkers==0
+        else:
+            self.checkmate=False
+            self.stalemate=False
+        self.draw=len(moves)!=0 and self.getDrawReason() is not None
+        return moves
@@ -0,0 +1,131 @@
+"""
+Opening book - moves to play (with weights) for positions looked up by zobrist key, in a sorted binary file that is
+memory-mapped and binary searched
+    - Polyglot's layout: 16 byte big-endian entries - key (8), move (2), weight (2), learn (4) - sorted by key, moves
+      encoded as to file/rank, from file/rank and promotion piece in 3 bits each, castling as the king taking its rook
+    - Keys are ChessEngine's zobrist keys rather than Polyglot's own random numbers, so books are built with buildBook
+    - The file is mapped read-only: a probe touches a few pages, nothing is loaded up front and every process/game
+      reading the same book shares it through the OS page cache
+Usage (from the repo root):
+    python src/ChessBook.py build books/openings.txt books/book.bin
+    python src/ChessBook.py probe "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1" --book books/book.bin
+"""
+
+import argparse
+import collections
+import mmap
+import os
+import random
+import struct
+import ChessEngine
+
+ENTRY=struct.Struct('>QHHI')
+BOOK_PATH=os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir,'books','book.bin')
+PROMOTION_CODES={'N':1,'B':2,'R':3,'Q':4}
+
+def encodeMove(move):
+    """
+    Polyglot move code of a Move - ranks count from white's side (row 7 is rank 0)
+    """
+    endCol=move.endCol
+    if move.isCastleMove:
+        endCol=7 if move.endCol==6 else 0  # king "captures" its own rook
+    code=endCol|(7-move.endRow)<<3|move.startCol<<6|(7-move.startRow)<<9
+    if move.isPawnPromotion:
+        code|=PROMOTION_CODES[move.promotionPiece]<<12
+    return code
+
+class OpeningBook():
+    """
+    Read-only view of a book file
+    """
+    def __init__(self,path=BOOK_PATH):
+        self.file=open(path,'rb')
+        size=os.fstat(self.file.fileno()).st_size
+        self.data=mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ) if size else b''  # an empty file can't be mapped
+        self.count=size//ENTRY.size
+
+    def getEntries(self,key):
+        """
+        (move code, weight) of every entry for the position key - binary search for the first entry, then scan
+        """
+        low,high=0,self.count
+        while low<high:
+            middle=(low+high)//2
+            if ENTRY.unpack_from(self.data,middle*ENTRY.size)[0]<key:
+                low=middle+1
+            else:
+                high=middle
+        entries=[]
+        while low<self.count:
+            entryKey,moveCode,weight,learn=ENTRY.unpack_from(self.data,low*ENTRY.size)
+            if entryKey!=key:
+                break
+            entries.append((moveCode,weight))
+            low+=1
+        return entries
+
+    def findMove(self,gamestate,validMoves):
+        """
+        Picks a book move for the position at random, in proportion to the weights - None when it isn't in the book
+        """
+        entries=self.getEntries(gamestate.zobristKey)
+        if not entries:
+            return None
+        movesByCode={encodeMove(move):move for move in validMoves}
+        candidates=[(movesByCode[moveCode],weight) for moveCode,weight in entries if moveCode in movesByCode and weight>0]
+        if not candidates:
+            return None
+        return random.choices([move for move,weight in candidates],weights=[weight for move,weight in candidates])[0]
+
+    def close(self):
+        if self.count:
+            self.data.close()
+        self.file.close()
+
+def buildBook(lines,path):
+    """
+    Writes a book from games given as lines of moves in coordinate notation (ie. e2e4 e7e5 g1f3) - every (position, move)
+    pair is weighted by the number of games playing it. Blank lines and # comments are skipped
+    """
+    weights=collections.Counter()
+    for lineNumber,line in enumerate(lines,1):
+        line=line.strip()
+        if not line or line.startswith('#'):
+            continue
+        gamestate=ChessEngine.GameState()
+        for notation in line.split():
+            move=next((move for move in gamestate.getValidMoves() if move.getChessNotation()==notation),None)
+            if move is None:
+                raise ValueError("Line "+str(lineNumber)+": "+notation+" is not a valid move")
+            weights[(gamestate.zobristKey,encodeMove(move))]+=1
+            gamestate.makeMove(move)
+    with open(path,'wb') as file:
+        for (key,moveCode),weight in sorted(weights.items()):
+            file.write(ENTRY.pack(key,moveCode,min(weight,0xFFFF),0))
+    return len(weights)
+
+def main():
+    parser=argparse.ArgumentParser(description="Build or probe an opening book")
+    subparsers=parser.add_subparsers(dest='command',required=True)
+    build=subparsers.add_parser('build',help="build a book from lines of moves")
+    build.add_argument('input')
+    build.add_argument('output')
+    probe=subparsers.add_parser('probe',help="list the book moves of a position")
+    probe.add_argument('fen')
+    probe.add_argument('--book',default=BOOK_PATH)
+    args=parser.parse_args()
+
+    if args.command=='build':
+        with open(args.input) as lines:
+            print(str(buildBook(lines,args.output))+" entries written to "+args.output)
+    else:
+        gamestate=ChessEngine.GameState.fromFen(args.fen)
+        book=OpeningBook(args.book)
+        movesByCode={encodeMove(move):move for move in gamestate.getValidMoves()}
+        for moveCode,weight in book.getEntries(gamestate.zobristKey):
+            print(movesByCode[moveCode].getChessNotation() if moveCode in movesByCode else "?",weight)
+        book.close()
+
+if __name__=="__main__":
+    main()
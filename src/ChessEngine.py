@@ -1,9 +1,59 @@
+import random
+
+# Zobrist hashing - a random 64-bit number per (piece, square), per castling rights combination, per enpassant file and one
+# for black to move. A position's key is the xor of the numbers of everything in it, so a move only has to xor what changed
+zobristRandom=random.Random(557)  # fixed seed so every process (and anything stored to disk) agrees on the keys
+ZOBRIST_PIECES={piece:[zobristRandom.getrandbits(64) for _ in range(64)]
+                for piece in ('wp','wR','wN','wB','wQ','wK','bp','bR','bN','bB','bQ','bK')}
+ZOBRIST_CASTLING=[zobristRandom.getrandbits(64) for _ in range(16)]  # indexed by CastlingRights.index()
+ZOBRIST_ENPASSANT=[zobristRandom.getrandbits(64) for _ in range(8)]  # indexed by the col of the enpassant square
+ZOBRIST_BLACK_TO_MOVE=zobristRandom.getrandbits(64)
+
+# Attack tables - for every square index (row*8+col) the squares a knight/king/pawn there attacks, and the squares along
+# each sliding direction nearest first. Attack checks look outward from a square with these instead of generating moves
+def _stepSquares(offsets):
+    return [[(row+dRow,col+dCol) for dRow,dCol in offsets if 0<=row+dRow<=7 and 0<=col+dCol<=7]
+            for row in range(8) for col in range(8)]
+
+def _raySquares(directions):
+    rays=[]
+    for row in range(8):
+        for col in range(8):
+            squareRays=[]
+            for dRow,dCol in directions:
+                ray=[]
+                endRow,endCol=row+dRow,col+dCol
+                while 0<=endRow<=7 and 0<=endCol<=7:
+                    ray.append((endRow,endCol))
+                    endRow,endCol=endRow+dRow,endCol+dCol
+                if ray:
+                    squareRays.append(ray)
+            rays.append(squareRays)
+    return rays
+
+KNIGHT_SQUARES=_stepSquares(((-2,-1),(-2,1),(-1,-2),(-1,2),(1,-2),(1,2),(2,-1),(2,1)))
+KING_SQUARES=_stepSquares(((-1,-1),(-1,0),(-1,1),(0,-1),(0,1),(1,-1),(1,0),(1,1)))
+PAWN_ATTACK_SQUARES={'w':_stepSquares(((-1,-1),(-1,1))),'b':_stepSquares(((1,-1),(1,1)))}
+ORTHOGONAL_RAYS=_raySquares(((-1,0),(0,-1),(1,0),(0,1)))  # rooks and queens
+DIAGONAL_RAYS=_raySquares(((-1,-1),(-1,1),(1,-1),(1,1)))  # bishops and queens
+
+STARTING_FEN='rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+# Compact encoding (GameState.toBytes) - 32 bytes per position:
+    # bytes 0-7: occupancy, bit row*8+col set for every occupied square
+    # bytes 8-23: a 4 bit piece code (index in PIECE_CODES) per occupied square in square order, two per byte
+    # byte 24: bit 0 black to move, bits 1-4 CastlingRights.index()
+    # byte 25: enpassant col+1 (0 for none), byte 26: halfmove clock, bytes 27-28: fullmove number, bytes 29-31: unused
+PIECE_CODES=tuple(ZOBRIST_PIECES)
+ENCODED_SIZE=32
 
 class GameState():
     """
     This class is responsible for storing all the info about the current state of the game. It will also be responsible for
     determining the valid moves at the current state. It will also keep a move log
     """
+    # Evaluation table - piece -> 64 integer scores (one per square index row*8+col). Installed by ChessAI so the board
+    # score can be kept up to date move by move instead of rescanning the board at every leaf of the search
+    scoreTable=None
     def __init__(self):
         # Board rep/d as 8x8 2D list of lists w/ element of list having two characters. Rep/d from W's perspective.
         # First char rep/s color of piece ('b','w' or '-')
@@ -36,6 +86,7 @@ class GameState():
 
         self.checkmate=False
         self.stalemate=False
+        self.draw=False  # drawn by the fifty-move rule or threefold repetition (see getDrawReason)
         
         self.enpassantPossible=()  # coords for sq where enpassant capture is possible                
         self.enpassantPossibleLog=[self.enpassantPossible]
@@ -44,11 +95,290 @@ class GameState():
         self.currentCastlingRights=CastlingRights(True,True,True,True)
         self.CastlingRightsLog=[CastlingRights(self.currentCastlingRights.wK_side, self.currentCastlingRights.wQ_side,
                                                self.currentCastlingRights.bK_side, self.currentCastlingRights.bQ_side)] 
-    
+
+        # position key (see ZOBRIST_*), updated incrementally by makeMove/undoMove
+        self.zobristKey=self.computeZobristKey()
+        self.zobristKeyLog=[self.zobristKey]  # hash history - one key per position reached, current one last
+        self.positionCounts={self.zobristKey:1}  # position key -> times it has been reached, for repetition checks in O(1)
+
+        # running material + piece-square score of each side (see scoreTable), updated incrementally by makeMove/undoMove
+        self.whiteScore,self.blackScore=self.computeScores()
+        self.scoresLog=[(self.whiteScore,self.blackScore)]
+
+        # move counters - plies since the last capture or pawn move (one entry per position reached) and the FEN move number
+        self.halfmoveClock=0
+        self.halfmoveClockLog=[self.halfmoveClock]
+        self.fullmoveNumber=1
+
+    @classmethod
+    def fromFen(cls,fen):
+        """
+        Creates a game starting from the position of a FEN string instead of the starting position
+        """
+        gamestate=cls()
+        gamestate.loadFen(fen)
+        return gamestate
+
+    @classmethod
+    def fromBytes(cls,data):
+        """
+        Creates a game starting from a position encoded by toBytes
+        """
+        gamestate=cls()
+        gamestate.loadBytes(data)
+        return gamestate
+
+    def loadFen(self,fen):
+        """
+        Sets up the position of a FEN string - piece placement, side to move, castling rights, enpassant square and
+        (optionally) the halfmove clock and fullmove number
+        """
+        fields=fen.split()
+        ranks=fields[0].split('/') if len(fields)>=4 else []
+        if len(ranks)!=8:
+            raise ValueError("Invalid FEN: "+fen)
+        board=[]
+        for rank in ranks:
+            row=[]
+            for char in rank:
+                if char.isdigit():
+                    row+=['--']*int(char)
+                elif char.upper() in 'PRNBQK':
+                    row.append(('w' if char.isupper() else 'b')+('p' if char.upper()=='P' else char.upper()))
+                else:
+                    raise ValueError("Invalid FEN: "+fen)
+            if len(row)!=8:
+                raise ValueError("Invalid FEN: "+fen)
+            board.append(row)
+        if fields[1] not in ('w','b'):
+            raise ValueError("Invalid FEN: "+fen)
+        for king in ('wK','bK'):
+            if sum(row.count(king) for row in board)!=1:  # move generation and check detection need exactly one
+                raise ValueError("Invalid FEN (one king per side needed): "+fen)
+        rights=fields[2]
+        castlingRights=CastlingRights('K' in rights,'Q' in rights,'k' in rights,'q' in rights)
+        enpassant=fields[3]
+        enpassantPossible=() if enpassant=='-' else (Move.rankToRow[enpassant[1]],Move.fileToCol[enpassant[0]])
+        self.setPosition(board,fields[1]=='w',castlingRights,enpassantPossible,
+                         int(fields[4]) if len(fields)>4 else 0,int(fields[5]) if len(fields)>5 else 1)
+
+    def toFen(self):
+        """
+        FEN string of the current position
+        """
+        ranks=[]
+        for row in self.board:
+            rank=''
+            empty=0
+            for piece in row:
+                if piece=='--':
+                    empty+=1
+                    continue
+                if empty:
+                    rank+=str(empty)
+                    empty=0
+                char='P' if piece[1]=='p' else piece[1]
+                rank+=char if piece[0]=='w' else char.lower()
+            ranks.append(rank+(str(empty) if empty else ''))
+        rights=self.currentCastlingRights
+        castling=('K' if rights.wK_side else '')+('Q' if rights.wQ_side else '')+ \
+                 ('k' if rights.bK_side else '')+('q' if rights.bQ_side else '')
+        enpassant=Move.colToFile[self.enpassantPossible[1]]+Move.rowToRank[self.enpassantPossible[0]] if self.enpassantPossible!=() else '-'
+        return ' '.join(('/'.join(ranks),'w' if self.whiteToMove else 'b',castling or '-',enpassant,
+                         str(self.halfmoveClock),str(self.fullmoveNumber)))
+
+    def loadBytes(self,data):
+        """
+        Sets up a position encoded by toBytes
+        """
+        if len(data)!=ENCODED_SIZE:
+            raise ValueError("Encoded position must be "+str(ENCODED_SIZE)+" bytes")
+        occupancy=int.from_bytes(data[0:8],'little')
+        board=[['--']*8 for _ in range(8)]
+        index=0
+        for sq in range(64):
+            if occupancy>>sq&1:
+                code=data[8+index//2]>>(4*(index%2))&0xF
+                if code>=len(PIECE_CODES):
+                    raise ValueError("Invalid piece code in encoded position")
+                board[sq//8][sq%8]=PIECE_CODES[code]
+                index+=1
+        flags=data[24]
+        whiteToMove=not flags&1
+        castlingRights=CastlingRights(bool(flags>>1&1),bool(flags>>2&1),bool(flags>>3&1),bool(flags>>4&1))
+        enpassantPossible=(2 if whiteToMove else 5,data[25]-1) if data[25] else ()  # the square behind a pawn that just moved 2
+        self.setPosition(board,whiteToMove,castlingRights,enpassantPossible,data[26],int.from_bytes(data[27:29],'little'))
+
+    def toBytes(self):
+        """
+        Fixed size (ENCODED_SIZE bytes) encoding of the current position - see the layout above PIECE_CODES
+        """
+        occupancy=0
+        codes=[]
+        for row in range(8):
+            for col in range(8):
+                piece=self.board[row][col]
+                if piece!='--':
+                    occupancy|=1<<(row*8+col)
+                    codes.append(PIECE_CODES.index(piece))
+        if len(codes)>32:
+            raise ValueError("Can't encode a position with more than 32 pieces")
+        codes+=[0]*(32-len(codes))
+        data=bytearray(occupancy.to_bytes(8,'little'))
+        data+=bytes(codes[i]|codes[i+1]<<4 for i in range(0,32,2))
+        data.append((not self.whiteToMove)|self.currentCastlingRights.index()<<1)
+        data.append(self.enpassantPossible[1]+1 if self.enpassantPossible!=() else 0)
+        data.append(min(self.halfmoveClock,255))
+        data+=min(self.fullmoveNumber,0xFFFF).to_bytes(2,'little')
+        data+=bytes(ENCODED_SIZE-len(data))
+        return bytes(data)
+
+    def setPosition(self,board,whiteToMove,castlingRights,enpassantPossible,halfmoveClock=0,fullmoveNumber=1):
+        """
+        Replaces the position with the one given, the game (and every log) starts over from it
+        """
+        self.board=board
+        self.whiteToMove=whiteToMove
+        self.moveLog=[]
+        for row in range(8):
+            for col in range(8):
+                if board[row][col]=='wK':
+                    self.wKLocation=(row,col)
+                elif board[row][col]=='bK':
+                    self.bKLocation=(row,col)
+        self.checkmate=False
+        self.stalemate=False
+        self.draw=False
+        self.enpassantPossible=enpassantPossible
+        self.enpassantPossibleLog=[enpassantPossible]
+        self.currentCastlingRights=castlingRights
+        self.CastlingRightsLog=[CastlingRights(castlingRights.wK_side,castlingRights.wQ_side,castlingRights.bK_side,castlingRights.bQ_side)]
+        self.zobristKey=self.computeZobristKey()
+        self.zobristKeyLog=[self.zobristKey]
+        self.positionCounts={self.zobristKey:1}
+        self.whiteScore,self.blackScore=self.computeScores()
+        self.scoresLog=[(self.whiteScore,self.blackScore)]
+        self.halfmoveClock=halfmoveClock
+        self.halfmoveClockLog=[halfmoveClock]
+        self.fullmoveNumber=fullmoveNumber
+
+    def computeZobristKey(self):
+        """
+        Computes the zobrist key of the current position from scratch (only needed when a position is set up)
+        """
+        key=0
+        for row in range(8):
+            for col in range(8):
+                piece=self.board[row][col]
+                if piece!='--':
+                    key^=ZOBRIST_PIECES[piece][row*8+col]
+        key^=ZOBRIST_CASTLING[self.currentCastlingRights.index()]^self.getEnpassantKey()
+        if not self.whiteToMove:
+            key^=ZOBRIST_BLACK_TO_MOVE
+        return key
+
+    def getEnpassantKey(self):
+        """
+        Zobrist key of the enpassant file, or 0 - only hashed when a pawn of the side to move can really capture
+        enpassant, so a double pawn push nothing can take doesn't make the position differ from the same one without it
+        (the rules count positions with the same possible moves as repeats)
+        """
+        if self.enpassantPossible==():
+            return 0
+        row,col=self.enpassantPossible
+        if row!=(2 if self.whiteToMove else 5):  # not behind a pawn of the other side that could have moved 2
+            return 0
+        pawn='wp' if self.whiteToMove else 'bp'
+        pawnRow=row+1 if self.whiteToMove else row-1  # capturing pawns stand beside the pawn that moved 2
+        kingRow,kingCol=self.wKLocation if self.whiteToMove else self.bKLocation
+        board=self.board
+        for pawnCol in (col-1,col+1):
+            if 0<=pawnCol<=7 and board[pawnRow][pawnCol]==pawn:
+                # try the capture out on the board - it can't be made if it leaves the king in check
+                captured=board[pawnRow][col]
+                board[pawnRow][pawnCol]=board[pawnRow][col]='--'
+                board[row][col]=pawn
+                legal=not self.squareUnderAttack(kingRow,kingCol)
+                board[pawnRow][pawnCol]=pawn
+                board[pawnRow][col]=captured
+                board[row][col]='--'
+                if legal:
+                    return ZOBRIST_ENPASSANT[col]
+        return 0
+
+    def computeScores(self):
+        """
+        Computes (white score, black score) from scratch (only needed when a position is set up)
+        """
+        scores={'w':0,'b':0,'-':0}
+        if self.scoreTable is not None:
+            for row in range(8):
+                for col in range(8):
+                    piece=self.board[row][col]
+                    if piece!='--':
+                        scores[piece[0]]+=self.scoreTable[piece][row*8+col]
+        return scores['w'],scores['b']
+
+    def updateScores(self,move):
+        """
+        Adds the score changes made by `move` - called at the end of makeMove once the board has been updated
+        """
+        if self.scoreTable is not None:
+            table=self.scoreTable
+            endSq=move.endRow*8+move.endCol
+            # mover: piece leaves its start square and lands (possibly promoted) on the end square, plus the castling rook
+            moverDelta=table[self.board[move.endRow][move.endCol]][endSq]-table[move.pieceMoved][move.startRow*8+move.startCol]
+            if move.isCastleMove:
+                rookScores=table[move.pieceMoved[0]+'R']
+                if (move.endCol-move.startCol)==2:  # kingside
+                    moverDelta+=rookScores[endSq-1]-rookScores[endSq+1]
+                else:  # queenside
+                    moverDelta+=rookScores[endSq+1]-rookScores[endSq-2]
+            # opponent: loses the captured piece
+            capturedDelta=0
+            if move.isEnpassantMove:
+                capturedDelta=table[move.pieceCaptured][move.startRow*8+move.endCol]
+            elif move.pieceCaptured!='--':
+                capturedDelta=table[move.pieceCaptured][endSq]
+            if move.pieceMoved[0]=='w':
+                self.whiteScore+=moverDelta
+                self.blackScore-=capturedDelta
+            else:
+                self.blackScore+=moverDelta
+                self.whiteScore-=capturedDelta
+        self.scoresLog.append((self.whiteScore,self.blackScore))
+
+    def updateZobristKey(self,move,previousEnpassantKey):
+        """
+        Xors the changes made by `move` into the zobrist key - called at the end of makeMove once the board, enpassant
+        square and castling rights have all been updated
+            - previousEnpassantKey: getEnpassantKey() of the position before the move
+        """
+        key=self.zobristKey^ZOBRIST_BLACK_TO_MOVE  # side to move always changes
+        startSq=move.startRow*8+move.startCol
+        endSq=move.endRow*8+move.endCol
+        key^=ZOBRIST_PIECES[move.pieceMoved][startSq]^ZOBRIST_PIECES[self.board[move.endRow][move.endCol]][endSq]  # end sq holds the promoted piece after a promotion
+        if move.isEnpassantMove:
+            key^=ZOBRIST_PIECES[move.pieceCaptured][move.startRow*8+move.endCol]
+        elif move.pieceCaptured!='--':
+            key^=ZOBRIST_PIECES[move.pieceCaptured][endSq]
+        if move.isCastleMove:
+            rookKeys=ZOBRIST_PIECES[move.pieceMoved[0]+'R']
+            if (move.endCol-move.startCol)==2:  # kingside
+                key^=rookKeys[endSq+1]^rookKeys[endSq-1]
+            else:  # queenside
+                key^=rookKeys[endSq-2]^rookKeys[endSq+1]
+        key^=ZOBRIST_CASTLING[self.CastlingRightsLog[-2].index()]^ZOBRIST_CASTLING[self.CastlingRightsLog[-1].index()]
+        key^=previousEnpassantKey^self.getEnpassantKey()
+        self.zobristKey=key
+        self.zobristKeyLog.append(key)
+        self.positionCounts[key]=self.positionCounts.get(key,0)+1
+
     def makeMove(self,move):
         """
         Takes move as a parameter and executes it
         """
+        previousEnpassantKey=self.getEnpassantKey()  # worked out before the board changes
         self.board[move.endRow][move.endCol]=move.pieceMoved  # updates sq after move w/ the piece moved
         self.board[move.startRow][move.startCol]='--'  # updates sq prior to move to empty
         self.moveLog.append(move)  # log move sq to allow for undo
@@ -70,10 +400,9 @@ class GameState():
 
         self.enpassantPossibleLog.append(self.enpassantPossible)
         
-        # pawn promotion
+        # pawn promotion - the piece was chosen when the move was created (each choice is its own move)
         if move.isPawnPromotion:
-            promotedPiece=input("Promote to Q, R, B, or N: ")
-            self.board[move.endRow][move.endCol]=move.pieceMoved[0]+promotedPiece
+            self.board[move.endRow][move.endCol]=move.pieceMoved[0]+move.promotionPiece
 
         # castle moves
         if move.isCastleMove:
@@ -89,6 +418,15 @@ class GameState():
         self.CastlingRightsLog.append(CastlingRights(self.currentCastlingRights.wK_side, self.currentCastlingRights.wQ_side,
                                             self.currentCastlingRights.bK_side, self.currentCastlingRights.bQ_side))
 
+        # move counters
+        self.halfmoveClock=0 if move.pieceMoved[1]=='p' or move.pieceCaptured!='--' else self.halfmoveClock+1
+        self.halfmoveClockLog.append(self.halfmoveClock)
+        if self.whiteToMove:  # black just moved
+            self.fullmoveNumber+=1
+
+        self.updateZobristKey(move,previousEnpassantKey)
+        self.updateScores(move)
+
     def undoMove(self):
         """
         Undo the last move made
@@ -113,7 +451,8 @@ class GameState():
             
             # undo update in castling rights
             self.CastlingRightsLog.pop() # remove new castle rights from the move being undone
-            self.currentCastlingRights=self.CastlingRightsLog[-1] # set current castling rights to the last one in the list
+            lastRights=self.CastlingRightsLog[-1]  # copy it so updateCastlingRights can never mutate an entry of the log
+            self.currentCastlingRights=CastlingRights(lastRights.wK_side, lastRights.wQ_side, lastRights.bK_side, lastRights.bQ_side)
 
             # undo castle move
             if move.isCastleMove:
@@ -124,10 +463,46 @@ class GameState():
                     self.board[move.endRow][move.endCol-2]=self.board[move.endRow][move.endCol+1]
                     self.board[move.endRow][move.endCol+1]='--'
             
+            # restore previous position key
+            count=self.positionCounts[self.zobristKey]
+            if count==1:
+                del self.positionCounts[self.zobristKey]
+            else:
+                self.positionCounts[self.zobristKey]=count-1
+            self.zobristKeyLog.pop()
+            self.zobristKey=self.zobristKeyLog[-1]
+            self.scoresLog.pop()
+            self.whiteScore,self.blackScore=self.scoresLog[-1]
+            self.halfmoveClockLog.pop()
+            self.halfmoveClock=self.halfmoveClockLog[-1]
+            if not self.whiteToMove:  # undid a move of black's
+                self.fullmoveNumber-=1
+
             # undo checkmate
             self.checkmate=False
             self.stalemate=False
+            self.draw=False
     
+    def isRepetition(self):
+        """
+        Determine if the position has been reached before - the search scores even one repeat as a draw, since the side
+        that could avoid it would have, and the side that couldn't can repeat it again
+        """
+        return self.positionCounts[self.zobristKey]>=2
+
+    def getDrawReason(self):
+        """
+        Why the game is drawn ('fifty-move rule' or 'threefold repetition'), None if it isn't - positions are told apart by
+        zobrist key, so the side to move, castling rights and enpassant square count as in the rules (the enpassant
+        square only when a capture onto it is possible, see getEnpassantKey)
+            - checkmate takes precedence over the fifty-move rule, so only trust this when there are legal moves
+        """
+        if self.halfmoveClock>=100:
+            return 'fifty-move rule'
+        if self.positionCounts[self.zobristKey]>=3:
+            return 'threefold repetition'
+        return None
+
     def updateCastlingRights(self, move):
         """
         Updates the castling rights given the move
@@ -180,6 +555,9 @@ class GameState():
         else:
             kingRow=self.bKLocation[0]
             kingCol=self.bKLocation[1]
+        # every square the opponent attacks, seen through the king (it can't hide from a slider by stepping along its line)
+        # - king moves and castling just look squares up in it
+        self.enemyAttacks=self.getAttackMap('b' if self.whiteToMove else 'w',(kingRow,kingCol))
         if self.checked:
             if len(self.checks)==1:  # only one check, block check or move king
                 moves=self.getAllPossibleMoves()
@@ -201,6 +579,8 @@ class GameState():
                 # get rid of any moves do not block check or move king
                 for i in range(len(moves)-1, -1,-1):  # go through backwards removing from a list as iterating
                     if moves[i].pieceMoved[1]!='K':  # move does not move king so it must block  or capture
+                        if moves[i].isEnpassantMove and (moves[i].startRow,moves[i].endCol)==(checkRow,checkCol):
+                            continue  # enpassant captures the checking pawn without landing on its square
                         if not (moves[i].endRow,moves[i].endCol) in validSquares: # move does not block check or capture piece
                             moves.remove(moves[i])
             else:  # double check, king has to move
@@ -213,14 +593,14 @@ class GameState():
                 self.getCastlingMoves(self.bKLocation[0],self.bKLocation[1],moves,allyColor="b")
         
         if len(moves)==0:
-            if self.inCheck:
+            if self.checked:
                 self.checkmate=True
             else:
-                # TODO stalemate on repeated moves
                 self.stalemate=True
         else:
             self.checkmate=False
             self.stalemate=False
+        self.draw=len(moves)!=0 and self.getDrawReason() is not None  # checkmate on the move that reaches 100 plies still counts
         
         self.currentCastlingRights=tempCastlingRights
         return moves
@@ -238,14 +618,68 @@ class GameState():
         '''
         Determine if the enemy can attack the square (row,col)
         '''
-        self.whiteToMove=not(self.whiteToMove)  # switch to oppt turn
-        oppMoves=self.getAllPossibleMoves()
-        self.whiteToMove=not(self.whiteToMove)  # reset turn even if stmnt sq not under attack
-        for move in oppMoves:
-            if move.endRow==row and move.endCol==col:  # square is under attack
+        return self.isSquareAttacked(row*8+col,'b' if self.whiteToMove else 'w')
+
+    def isSquareAttacked(self,sq,byColor):
+        """
+        Determine if pieces of `byColor` attack square index `sq` (row*8+col) - looks outward from the square for a
+        piece that could reach it, instead of generating the opponent's moves
+        """
+        board=self.board
+        for row,col in KNIGHT_SQUARES[sq]:
+            if board[row][col]==byColor+'N':
                 return True
+        for row,col in KING_SQUARES[sq]:
+            if board[row][col]==byColor+'K':
+                return True
+        # a pawn of byColor attacks sq from where a pawn of the other color on sq would attack
+        for row,col in PAWN_ATTACK_SQUARES['b' if byColor=='w' else 'w'][sq]:
+            if board[row][col]==byColor+'p':
+                return True
+        for rays,sliders in ((ORTHOGONAL_RAYS,'RQ'),(DIAGONAL_RAYS,'BQ')):
+            for ray in rays[sq]:
+                for row,col in ray:
+                    piece=board[row][col]
+                    if piece!='--':
+                        if piece[0]==byColor and piece[1] in sliders:
+                            return True
+                        break  # first piece on the ray blocks the rest of it
         return False  # by default a square is not under attack
 
+    def getAttackMap(self,byColor,transparentSquare=None):
+        """
+        Every square attacked by pieces of `byColor`, as a 64-bit mask (bit row*8+col)
+            - transparentSquare: (row,col) sliders see through, ie. the king of the other side when working out where it
+              can move to
+            - defended pieces count as attacked, so the mask is also a measure of each side's control (mobility, king safety)
+        """
+        board=self.board
+        attacks=0
+        for startRow in range(8):
+            for startCol in range(8):
+                piece=board[startRow][startCol]
+                if piece[0]!=byColor:
+                    continue
+                sq=startRow*8+startCol
+                pieceType=piece[1]
+                if pieceType=='p':
+                    targets=PAWN_ATTACK_SQUARES[byColor][sq]
+                elif pieceType=='N':
+                    targets=KNIGHT_SQUARES[sq]
+                elif pieceType=='K':
+                    targets=KING_SQUARES[sq]
+                else:
+                    targets=()
+                    rays=ORTHOGONAL_RAYS[sq] if pieceType=='R' else DIAGONAL_RAYS[sq] if pieceType=='B' else ORTHOGONAL_RAYS[sq]+DIAGONAL_RAYS[sq]
+                    for ray in rays:
+                        for row,col in ray:
+                            attacks|=1<<(row*8+col)
+                            if board[row][col]!='--' and (row,col)!=transparentSquare:
+                                break
+                for row,col in targets:
+                    attacks|=1<<(row*8+col)
+        return attacks
+
     def getAllPossibleMoves(self):
         """
         Creates list of all possible moves, not considering checks
@@ -353,20 +787,22 @@ class GameState():
             lastRow=7
             enemyColor='w'
             kingRow,kingCol=self.bKLocation
-        pawnPromotion=False
+        pawnPromotion=row+moveAmt==lastRow  # if piece gets to bank rank then it is a pawn promotion
+
+        promotionPieces=Move.promotionPieces if pawnPromotion else (None,)  # one move per piece the pawn can become
 
         if self.board[row+moveAmt][col]=='--':  # pawn advances 1sq
-            if not piecePinned or pinDirection==(moveAmt,0):
-                if row+moveAmt==lastRow: # if piece gets to bank rank then it is a pawn promotion
-                    pawnPromotion=True
-                moves.append(Move((row,col),(row+moveAmt,col),self.board, pawnPromotion=pawnPromotion))
+            if not piecePinned or pinDirection in ((moveAmt,0),(-moveAmt,0)):  # pinned along its file, by a piece ahead or behind
+                for promotionPiece in promotionPieces:
+                    moves.append(Move((row,col),(row+moveAmt,col),self.board, pawnPromotion=pawnPromotion,promotionPiece=promotionPiece))
                 if row==initialRow and self.board[row+2*moveAmt][col]=='--': # pawn advances 2sqs
                     moves.append(Move((row,col),(row+2*moveAmt,col),self.board))
 
         if col-1>=0:  # capture to the left
-            if not piecePinned or pinDirection==(moveAmt,-1):
+            if not piecePinned or pinDirection in ((moveAmt,-1),(-moveAmt,1)):  # pinned on this diagonal, by a piece ahead or behind
                 if self.board[row+moveAmt][col-1][0]==enemyColor:
-                    moves.append(Move((row,col),(row+moveAmt,col-1),self.board,pawnPromotion=pawnPromotion))
+                    for promotionPiece in promotionPieces:
+                        moves.append(Move((row,col),(row+moveAmt,col-1),self.board,pawnPromotion=pawnPromotion,promotionPiece=promotionPiece))
                 elif (row+moveAmt,col-1)==self.enpassantPossible:
                     attackingPiece=blockingPiece=False
                     if kingRow==row:
@@ -382,16 +818,19 @@ class GameState():
                                 blockingPiece=True
                         for i in outsideRange:
                             square=self.board[row][i]
-                            if square[0]==enemyColor and (square[i]=="R" or square[i]=="Q"):  # attacking piece
+                            if square[0]==enemyColor and (square[1]=="R" or square[1]=="Q"):  # attacking piece
                                 attackingPiece=True
+                                break
                             elif square!="--":
                                 blockingPiece=True
+                                break
                     if not(attackingPiece) or blockingPiece:
-                        moves.append(Move((row,col),(row-1,col-1),self.board,isEnpassantMove=True))
+                        moves.append(Move((row,col),(row+moveAmt,col-1),self.board,isEnpassantMove=True))
         if col+1<=7:  # capture to the right
-            if not piecePinned or pinDirection==(moveAmt,1):
+            if not piecePinned or pinDirection in ((moveAmt,1),(-moveAmt,-1)):  # pinned on this diagonal, by a piece ahead or behind
                 if self.board[row+moveAmt][col+1][0]==enemyColor:
-                    moves.append(Move((row,col),(row+moveAmt,col+1),self.board,pawnPromotion=pawnPromotion))
+                    for promotionPiece in promotionPieces:
+                        moves.append(Move((row,col),(row+moveAmt,col+1),self.board,pawnPromotion=pawnPromotion,promotionPiece=promotionPiece))
                 elif (row+moveAmt,col+1)==self.enpassantPossible:
                     attackingPiece=blockingPiece=False
                     if kingRow==row:
@@ -407,14 +846,14 @@ class GameState():
                                 blockingPiece=True
                         for i in outsideRange:
                             square=self.board[row][i]
-                            if square[0]==enemyColor and (square[i]=="R" or square[i]=="Q"):  # attacking piece
+                            if square[0]==enemyColor and (square[1]=="R" or square[1]=="Q"):  # attacking piece
                                 attackingPiece=True
+                                break
                             elif square!="--":
                                 blockingPiece=True
+                                break
                     if not(attackingPiece) or blockingPiece:
-                        moves.append(Move((row,col),(row-1,col+1),self.board,isEnpassantMove=True))
-
-        # add pawn promotions later
+                        moves.append(Move((row,col),(row+moveAmt,col+1),self.board,isEnpassantMove=True))
 
     def getRookMoves(self,row,col,moves):
         """
@@ -426,7 +865,7 @@ class GameState():
             if self.pins[i][0]==row and self.pins[i][1]==col:
                 piecePinned=True
                 pinDirection=(self.pins[i][2],self.pins[i][3])
-                if self.board[row][col][i]!='Q':  # cannot remove queen from pin on rook moves, only remove it on bishop moves
+                if self.board[row][col][1]!='Q':  # cannot remove queen from pin on rook moves, only remove it on bishop moves
                     self.pins.remove(self.pins[i])
                 break
 
@@ -441,7 +880,7 @@ class GameState():
                         endPiece=self.board[endRow][endCol]
                         if endPiece=="--":  # empty space valid
                             moves.append(Move((row,col),(endRow,endCol),self.board))
-                        elif endPiece==enemyColor:  # enemy piece valid
+                        elif endPiece[0]==enemyColor:  # enemy piece valid
                             moves.append(Move((row,col),(endRow,endCol),self.board))
                             break
                         else:  # friendly piece invalid
@@ -493,35 +932,19 @@ class GameState():
         """
         Gets all King moves for the king located at the row,col and add all these moves to the list of potential moves
         """
-        rowMoves=(-1,-1,-1, 0, 0, 1, 1, 1)
-        colMoves=(-1, 0, 1,-1, 1,-1, 0, 1)
         allyColor="w" if self.whiteToMove else "b"
-        for i in range(8):
-            endRow=row+rowMoves[i]
-            endCol=col+colMoves[i]
-            if 0<=endRow<=7 and 0<=endCol<=7:
-                endPiece=self.board[endRow][endCol]
-                if endPiece[0]!=allyColor:  # not an ally piece (empty or enemy place)
-                    # place king on end square and check for checks
-                    if allyColor=='w':
-                        self.wKLocation=(endRow,endCol)
-                    else:
-                        self.bKLocation=(endRow,endCol)
-                    inCheck, pins, checks=self.checkForPinsAndChecks()
-                    if not inCheck:
-                        moves.append(Move((row,col),(endRow,endCol),self.board))
-                    # place king back on original location
-                    if allyColor=='w':
-                        self.wKLocation=(row,col)
-                    else:
-                        self.bKLocation=(row, col)
+        for endRow,endCol in KING_SQUARES[row*8+col]:
+            endPiece=self.board[endRow][endCol]
+            if endPiece[0]!=allyColor:  # not an ally piece (empty or enemy place)
+                if not self.enemyAttacks>>(endRow*8+endCol)&1:  # king can't move onto an attacked square (see getValidMoves)
+                    moves.append(Move((row,col),(endRow,endCol),self.board))
     
     def getCastlingMoves(self, row, col, moves, allyColor):
         """
         Generates all valid castling moves for the king at (row,col) and add them to the list of moves
         """
         # check whether king is in check
-        if self.squareUnderAttack(row,col):
+        if self.enemyAttacks>>(row*8+col)&1:
             return # can't castle when in check
         # check whether squares are clear on castling side
         if (self.whiteToMove and self.currentCastlingRights.wK_side) or (not(self.whiteToMove) and self.currentCastlingRights.bK_side):
@@ -536,7 +959,7 @@ class GameState():
         Generates castling moves for king-side castling
         """
         if self.board[row][col+1]=='--' and self.board[row][col+2]=='--': 
-            if not(self.squareUnderAttack(row,col+1)) and not(self.squareUnderAttack(row,col+2)):
+            if not self.enemyAttacks>>(row*8+col+1)&3:  # neither square the king passes through/lands on is attacked
                 moves.append(Move((row,col),(row,col+2),self.board,isCastleMove=True))
 
     def getQueensideCastlingMoves(self, row, col, moves, allyColor):
@@ -544,7 +967,7 @@ class GameState():
         Generates castling moves for queen-side castling
         """
         if self.board[row][col-1]=='--' and self.board[row][col-2]=='--' and self.board[row][col-3]=='--':
-            if not(self.squareUnderAttack(row,col-1)) and not(self.squareUnderAttack(row,col-2)):
+            if not self.enemyAttacks>>(row*8+col-2)&3:  # neither square the king passes through/lands on is attacked
                 moves.append(Move((row,col),(row,col-2),self.board,isCastleMove=True))
 
     def getKnightMoves(self,row,col,moves):
@@ -557,7 +980,7 @@ class GameState():
                 piecePinned=True
                 self.pins.remove(self.pins[i])
                 break
-        knightMoves=((-2,-1),(-2,1),(-1,-2),(-1,2),(1,2),(2,-1),(2,1))
+        knightMoves=((-2,-1),(-2,1),(-1,-2),(-1,2),(1,-2),(1,2),(2,-1),(2,1))
         allyColor="w" if self.whiteToMove else "b"
         for move in knightMoves:
             endRow=row+move[0]
@@ -577,12 +1000,18 @@ class CastlingRights():
             # 2) The two squares the king is moving through cannot be under attack & king cannot be in check
                 # Must check three squares - square where king is, square king passes through, & square king lands
             # 3) It must be the king's and rooks' first rook of the game
-    def __init__(self,wK_side,bK_side,wQ_side,bQ_side):
+    def __init__(self,wK_side,wQ_side,bK_side,bQ_side):  # same order every caller passes them in
         self.wK_side=wK_side
-        self.bK_side=bK_side
         self.wQ_side=wQ_side
+        self.bK_side=bK_side
         self.bQ_side=bQ_side
 
+    def index(self):
+        """
+        Packs the four rights into a number from 0-15 (used to look up zobrist keys)
+        """
+        return self.wK_side|self.wQ_side<<1|self.bK_side<<2|self.bQ_side<<3
+
 class Move():
     # maps keys to values according to chess notation
     # key = value
@@ -592,40 +1021,63 @@ class Move():
     fileToCol = {'a':0,'b':1,'c':2,'d':3,
                  'e':4,'f':5,'g':6,'h':7}
     colToFile = {v:k for k,v in fileToCol.items()}
+    # pieces a pawn can promote to - each gets its own move, with moveID+10000*(index+1) so all four are distinct
+    promotionPieces=('Q','R','B','N')
+    # Moves are created by the million during a search - __slots__ keeps each one a fixed size object without a __dict__,
+    # and only what the engine needs per move is stored (display info like isCapture is worked out when asked for)
+    __slots__=('startRow','startCol','endRow','endCol','pieceMoved','pieceCaptured','isPawnPromotion','promotionPiece',
+               'isEnpassantMove','isCastleMove','moveID')
 
-    def __init__(self,startSq, endSq, board,isEnpassantMove=False, pawnPromotion=False,isCastleMove=False):
-        self.startRow=startSq[0]
-        self.startCol=startSq[1]
-        self.endRow=endSq[0]
-        self.endCol=endSq[1]
-        self.pieceMoved=board[self.startRow][self.startCol]
-        self.pieceCaptured=board[self.endRow][self.endCol]
+    def __init__(self,startSq, endSq, board,isEnpassantMove=False, pawnPromotion=False,isCastleMove=False,promotionPiece=None):
+        self.startRow,self.startCol=startRow,startCol=startSq
+        self.endRow,self.endCol=endRow,endCol=endSq
+        self.pieceMoved=pieceMoved=board[startRow][startCol]
+        # creates unique number for each move
+        moveID=startRow*1000+startCol*100+endRow*10+endCol
         # pawn promotion
-        self.isPawnPromotion=((self.pieceMoved=='wp' and self.endRow==0) or (self.pieceMoved=='bp' and self.endRow==7))
-        # capture move
-        self.isCapture=self.pieceCaptured!='--'
+        if pieceMoved[1]=='p' and (endRow==0 or endRow==7):
+            self.isPawnPromotion=True
+            self.promotionPiece=promotionPiece=promotionPiece or 'Q'  # 'Q','R','B' or 'N'
+            moveID+=10000*(self.promotionPieces.index(promotionPiece)+1)
+        else:
+            self.isPawnPromotion=False
+            self.promotionPiece=None
+        self.moveID=moveID
         # Enpassant
         self.isEnpassantMove=isEnpassantMove
-        if self.isEnpassantMove:
-            self.pieceCaptured='bp' if self.pieceMoved=='wp' else 'wp'  # enpassant captures opposite colored pawn
-        self.moveID=self.startRow*1000+self.startCol*100+self.endRow*10+self.endCol  # creates unique number for each move
+        if isEnpassantMove:
+            self.pieceCaptured='bp' if pieceMoved=='wp' else 'wp'  # enpassant captures opposite colored pawn
+        else:
+            self.pieceCaptured=board[endRow][endCol]
         # castling move
         self.isCastleMove=isCastleMove
-    
+
+    @property
+    def isCapture(self):
+        """
+        Whether a piece stands on the end square (an enpassant capture doesn't count, its pawn is beside it)
+        """
+        return self.pieceCaptured!='--' and not self.isEnpassantMove
+
     def __eq__(self,other):
         """
-        Overrides the equals method
+        Overrides the equals method - moves are equal when their moveIDs are, so a move built from the player's clicks
+        matches the engine's move between the same squares
         """
         if isinstance(other,Move):  # makes sure `other` object is instance of the Move
             return self.moveID==other.moveID
         return False
 
+    def __hash__(self):
+        return self.moveID
+
     def getChessNotation(self):
         """
         Converts input to pseudo chess notation.
             - Note it is possible to make this real chess notation
         """
-        return self.getRankFile(self.startRow,self.startCol)+self.getRankFile(self.endRow,self.endCol)
+        notation=self.getRankFile(self.startRow,self.startCol)+self.getRankFile(self.endRow,self.endCol)
+        return notation+self.promotionPiece.lower() if self.isPawnPromotion else notation  # ie. e7e8q
 
     def getRankFile(self,row,col):
         return self.colToFile[col]+self.rowToRank[row]
@@ -639,10 +1091,8 @@ class Move():
         endSquare=self.getRankFile(self.endRow,self.endCol)
         #pawn moves
         if self.pieceMoved[1]=='p':
-            if self.isCapture:
-                return self.colToFile[self.startCol]+"x"+endSquare
-        else:
-            return endSquare+"Q" if self.isPawnPromotion else endSquare
+            moveString=self.colToFile[self.startCol]+"x"+endSquare if self.isCapture or self.isEnpassantMove else endSquare
+            return moveString+"="+self.promotionPiece if self.isPawnPromotion else moveString
         #piece moves
         moveString=self.pieceMoved[1]
         if self.isCapture:
@@ -0,0 +1,220 @@
+"""
+Position index - which games of a PGN database reached a position, and how they ended, without scanning the games
+    - Built in one batch pass: every game is replayed (ChessPGN) and each distinct position it reaches is paired with the
+      game's number. The pairs are sorted in bounded chunks written to temporary run files and merged, so building takes
+      the same memory for any size of database
+    - The index file holds sorted arrays that are memory-mapped and binary searched, like ChessBook:
+        header - magic, number of positions, postings and games
+        positions - (zobrist key, first posting, games, white wins, draws, black wins) sorted by key
+        postings - game numbers, grouped by position in key order
+        games - byte offset of each game in the PGN file (read it again with seek, see readGame)
+    - A query is one binary search, so it takes microseconds however many games there are. Transpositions find each
+      other, positions are told apart by zobrist key (side to move, castling rights and enpassant square included)
+Usage (from the repo root):
+    python src/ChessIndex.py build games.pgn games.idx
+    python src/ChessIndex.py query games.idx "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1" --pgn games.pgn
+"""
+
+import argparse
+import heapq
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from array import array
+import ChessEngine
+import ChessPGN
+
+MAGIC=b'CHESSIDX'
+HEADER=struct.Struct('>8sQQQ')
+POSITION=struct.Struct('>QIIIII')
+POSTING=struct.Struct('>I')
+GAME=struct.Struct('>Q')
+PAIR=struct.Struct('>QI')  # (key, game number) in the sorted run files
+CHUNK_SIZE=1<<20  # (key, game) pairs sorted in memory at once while building
+RESULT_CODES={'1-0':0,'1/2-1/2':1,'0-1':2}  # index of the count a game's result adds to (other results add to none)
+
+class PositionIndex():
+    """
+    Read-only view of an index file
+    """
+    def __init__(self,path):
+        self.file=open(path,'rb')
+        self.data=mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+        magic,self.positionCount,self.postingCount,self.gameCount=HEADER.unpack_from(self.data,0)
+        if magic!=MAGIC:
+            raise ValueError(path+" is not a position index")
+        self.postingsStart=HEADER.size+self.positionCount*POSITION.size
+        self.gamesStart=self.postingsStart+self.postingCount*POSTING.size
+
+    def findPosition(self,key):
+        """
+        (first posting, games, white wins, draws, black wins) of the position key, None if no game reached it
+        """
+        low,high=0,self.positionCount
+        while low<high:
+            middle=(low+high)//2
+            if POSITION.unpack_from(self.data,HEADER.size+middle*POSITION.size)[0]<key:
+                low=middle+1
+            else:
+                high=middle
+        if low==self.positionCount:
+            return None
+        entry=POSITION.unpack_from(self.data,HEADER.size+low*POSITION.size)
+        return entry[1:] if entry[0]==key else None
+
+    def getStats(self,gamestate):
+        """
+        (games, white wins, draws, black wins) of the games that reached the position
+        """
+        entry=self.findPosition(gamestate.zobristKey)
+        return entry[1:] if entry is not None else (0,0,0,0)
+
+    def getGames(self,gamestate,limit=None):
+        """
+        Lazily yields (game number, byte offset in the PGN file) of the games that reached the position, in file order
+        """
+        entry=self.findPosition(gamestate.zobristKey)
+        if entry is None:
+            return
+        firstPosting,games=entry[0],entry[1]
+        for i in range(firstPosting,firstPosting+(games if limit is None else min(games,limit))):
+            gameNumber=POSTING.unpack_from(self.data,self.postingsStart+i*POSTING.size)[0]
+            yield gameNumber,GAME.unpack_from(self.data,self.gamesStart+gameNumber*GAME.size)[0]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+def readGame(pgnFile,offset):
+    """
+    Game of a PGN file (opened in binary mode) starting at a byte offset from the index
+    """
+    pgnFile.seek(offset)
+    return next(ChessPGN.readGames(pgnFile))
+
+def writeRun(pairs,directory,runs):
+    """
+    Sorts a chunk of (key, game) pairs into a new run file
+    """
+    pairs.sort()
+    path=os.path.join(directory,'run'+str(len(runs)))
+    with open(path,'wb') as file:
+        file.write(b''.join(PAIR.pack(key,gameNumber) for key,gameNumber in pairs))
+    runs.append(path)
+    pairs.clear()
+
+def readRun(path):
+    with open(path,'rb') as file:
+        while True:
+            data=file.read(PAIR.size*4096)
+            if not data:
+                return
+            yield from PAIR.iter_unpack(data)
+
+def buildIndex(pgnFile,path,report=None):
+    """
+    Indexes every game of a PGN file (opened in binary mode) - returns (games, positions, errors). Games with a move that
+    can't be decoded are indexed up to that move and counted as errors
+    """
+    offsets=array('Q')
+    results=bytearray()  # RESULT_CODES of each game, 3 for any other result
+    errors=0
+    startTime=time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        runs=[]
+        pairs=[]
+        for gameNumber,game in enumerate(ChessPGN.readGames(pgnFile)):
+            offsets.append(game.offset)
+            results.append(RESULT_CODES.get(game.result,3))
+            keys=set()
+            gamestate=None
+            try:
+                gamestate=game.getStartingPosition()
+                keys.add(gamestate.zobristKey)  # before the replay, which yields nothing if the first move is bad
+                for gamestate,move in game.replay():
+                    keys.add(gamestate.zobristKey)
+            except (ValueError,KeyError,IndexError):
+                errors+=1
+            if gamestate is not None:
+                keys.add(gamestate.zobristKey)  # replay has made the last good move when it stops, or fails
+            pairs.extend((key,gameNumber) for key in keys)  # each position once per game, however often it repeats
+            if len(pairs)>=CHUNK_SIZE:
+                writeRun(pairs,directory,runs)
+            if report is not None and (gameNumber+1)%10000==0:
+                print(str(gameNumber+1)+" games read, "+format(time.perf_counter()-startTime,".0f")+"s",file=report)
+        if pairs:
+            writeRun(pairs,directory,runs)
+
+        # merge the runs - positions and postings go to their own files, then everything is put together
+        positionCount=postingCount=0
+        positionsPath=os.path.join(directory,'positions')
+        postingsPath=os.path.join(directory,'postings')
+        with open(positionsPath,'wb') as positionsFile, open(postingsPath,'wb') as postingsFile:
+            currentKey=None
+            counts=[0,0,0,0]
+            firstPosting=0
+            for key,gameNumber in heapq.merge(*(readRun(run) for run in runs)):
+                if key!=currentKey:
+                    if currentKey is not None:
+                        positionsFile.write(POSITION.pack(currentKey,firstPosting,postingCount-firstPosting,*counts[:3]))
+                        positionCount+=1
+                    currentKey=key
+                    counts=[0,0,0,0]
+                    firstPosting=postingCount
+                postingsFile.write(POSTING.pack(gameNumber))
+                postingCount+=1
+                counts[results[gameNumber]]+=1
+            if currentKey is not None:
+                positionsFile.write(POSITION.pack(currentKey,firstPosting,postingCount-firstPosting,*counts[:3]))
+                positionCount+=1
+        with open(path,'wb') as file:
+            file.write(HEADER.pack(MAGIC,positionCount,postingCount,len(offsets)))
+            for sectionPath in (positionsPath,postingsPath):
+                with open(sectionPath,'rb') as section:
+                    shutil.copyfileobj(section,file)
+            if sys.byteorder=='little':
+                offsets.byteswap()  # stored big-endian like the rest
+            offsets.tofile(file)
+    return len(offsets),positionCount,errors
+
+def main():
+    parser=argparse.ArgumentParser(description="Build or query an index of the positions reached by a PGN database")
+    subparsers=parser.add_subparsers(dest='command',required=True)
+    build=subparsers.add_parser('build',help="index the games of a PGN file")
+    build.add_argument('pgn')
+    build.add_argument('index')
+    query=subparsers.add_parser('query',help="games that reached a position, with their results")
+    query.add_argument('index')
+    query.add_argument('fen')
+    query.add_argument('--pgn',help="PGN file the index was built from, to list the games")
+    query.add_argument('--games',type=int,default=10,help="games to list")
+    args=parser.parse_args()
+
+    if args.command=='build':
+        startTime=time.perf_counter()
+        with open(args.pgn,'rb') as pgnFile:
+            games,positions,errors=buildIndex(pgnFile,args.index,report=sys.stdout)
+        print(str(games)+" games ("+str(errors)+" with errors), "+str(positions)+" positions indexed in "+
+              format(time.perf_counter()-startTime,".1f")+"s")
+    else:
+        gamestate=ChessEngine.GameState.fromFen(args.fen)
+        index=PositionIndex(args.index)
+        startTime=time.perf_counter()
+        games,whiteWins,draws,blackWins=index.getStats(gamestate)
+        elapsed=time.perf_counter()-startTime
+        print(str(games)+" games: white wins "+str(whiteWins)+", draws "+str(draws)+", black wins "+str(blackWins)+
+              " ("+format(elapsed*1e6,".0f")+" microseconds)")
+        if args.pgn:
+            with open(args.pgn,'rb') as pgnFile:
+                for gameNumber,offset in index.getGames(gamestate,args.games):
+                    game=readGame(pgnFile,offset)
+                    print("  "+str(gameNumber+1)+": "+game.tags.get('White','?')+" - "+game.tags.get('Black','?')+" "+
+                          game.result+" ("+game.tags.get('Event','?')+", "+game.tags.get('Date','?')+")")
+        index.close()
+
+if __name__=="__main__":
+    main()
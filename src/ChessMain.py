@@ -6,11 +6,12 @@ import os,sys
 import pygame as p
 import ChessEngine
 import ChessAI
-from multiprocessing import Process, Queue
+import ChessWorker
 
 BOARD_WIDTH=BOARD_HEIGHT=512 # 400 is also ok
 MOVE_LOG_PANEL_WIDTH=250
 MOVE_LOG_PANEL_HEIGHT=BOARD_HEIGHT
+MOVES_PER_LINE=3 # full moves (white and black) on each line of the move log
 DIMENSION = 8 # dimensions of a chess board are 8x8
 SQ_SIZE = BOARD_HEIGHT//DIMENSION
 MAX_FPS = 15 # for animations later on
@@ -41,29 +42,48 @@ def main():
             # This prevents recalling move every frame which can be computationally expensive
     animate=False  # flag variable for when animation occurs
     loadImages()  #only done once before while loop
+    renderer=BoardRenderer(screen,moveLogFont)
     running=True
     sqSelected=()  # no sq is selected, keeps track of last click of user - tuple (row, col)
     playerClicks=[]  # keeps track of player clicks - two tuples: [(rows,cols),(rows up/down,cols left/right)]
+    promotionMoves=[]  # while the promotion picker is open, the move for each piece the player can pick (empty when closed)
     gameOver=False
     playerOne=True # if a human is playing white, this will be true. If AI is playing, then false.
     playerTwo=False # if a human is playing black, this will be true. If AI is playing, then false.
     AIThinking=False
-    moveFinderProcess=None
+    searchWorker=ChessWorker.SearchWorker()  # stays alive for the whole game, keeping the AI's caches between moves
     moveUndone=False
+    idle=False  # nothing to animate or wait for but the player
     
     while running:
         humanTurn=(gamestate.whiteToMove and playerOne) or (not(gamestate.whiteToMove) and playerTwo)  
-        for event in p.event.get():
+        # when idle, sleep until there is input instead of waking up MAX_FPS times a second to redraw nothing
+        events=[p.event.wait()]+p.event.get() if idle else p.event.get()
+        for event in events:
             if event.type==p.QUIT:
                 running=False
+                searchWorker.close()
                 p.quit()
                 sys.exit()
             # mouse handler
             elif event.type==p.MOUSEBUTTONDOWN:
-                if not gameOver:
+                if event.button in (4,5):  # mouse wheel - scrolls the move log, never a click on the board
+                    if p.mouse.get_pos()[0]>=BOARD_WIDTH:
+                        renderer.moveLogView.scroll(-1 if event.button==4 else 1)
+                elif not gameOver:
                     location=p.mouse.get_pos() # (x,y) location of mouse
                     col=location[0]//SQ_SIZE
                     row=location[1]//SQ_SIZE
+                    if promotionMoves:  # picker open - the click either picks a piece or closes it
+                        for i in range(len(promotionMoves)):
+                            if (row,col)==getPromotionPickerSquare(promotionMoves[i],i):
+                                gamestate.makeMove(promotionMoves[i])
+                                moveMade=True
+                                animate=True
+                        promotionMoves=[]
+                        sqSelected=()
+                        playerClicks=[]
+                        continue
                     if sqSelected==(row,col) or col>=8:  # user hit same square twice
                         sqSelected=()  # deselect
                         playerClicks=[]  # clear player clicks
@@ -76,13 +96,18 @@ def main():
                         print(move.getChessNotation())
                         for i in range(len(validMoves)):
                             if move==validMoves[i]:
+                                if move.isPawnPromotion:  # one valid move per promotion piece - open the picker instead of moving
+                                    promotionMoves=[validMove for validMove in validMoves if validMove.moveID%10000==move.moveID%10000]
+                                    break
                                 gamestate.makeMove(validMoves[i])   # `validMoves[i] is is the move generated by the engine while `move` is the move generated by the player
                                 moveMade=True
                                 animate=True
                                 sqSelected=()  # reset user clicks
                                 playerClicks=[]  # clear player clicks
-                        if not moveMade:
+                        if not moveMade and not promotionMoves:
                             playerClicks=[sqSelected]
+            elif event.type==p.VIDEOEXPOSE:  # window was covered/restored - what was on screen is gone
+                renderer.invalidate()
             # key handler
             elif event.type==p.KEYDOWN:
                 if event.key==p.K_z:  # undo when 'z' is pressed
@@ -90,8 +115,9 @@ def main():
                     moveMade=True
                     animate=False
                     gameOver=False
+                    promotionMoves=[]
                     if AIThinking:
-                        moveFinderProcess.terminate()
+                        searchWorker.cancel()
                         AIThinking=False
                     moveUndone=True
                 if event.key==p.K_r:  # reset the board when 'r' is pressed
@@ -99,11 +125,12 @@ def main():
                     validMoves=gamestate.getValidMoves()
                     sqSelected=()
                     playerClicks=[]
+                    promotionMoves=[]
                     moveMade=False
                     animate=False
                     gameOver=False
                     if AIThinking:
-                        moveFinderProcess.terminate()
+                        searchWorker.cancel()
                         AIThinking=False
                     moveUndone=True
                     
@@ -113,17 +140,23 @@ def main():
             if not(AIThinking):
                 AIThinking=True
                 print("thinking...")
-                returnQueue=Queue()  # used to pass data btwn threads
-                moveFinderProcess=Process(
-                    target=ChessAI.findBestMove,  # function to call
-                    args=(gamestate,validMoves,returnQueue)
-                )
-                moveFinderProcess.start()  # call findBestMove(gamestate,validMoves,returnQueue)
-                
-            if not(moveFinderProcess.is_alive()): # checks if process is still alive
-                print("done thinking")
-                AI_move=returnQueue.get()
-                if AI_move is None:  # should never happen (only case is where next move results in checkmate)
+                searchWorker.startSearch(gamestate.moveLog)  # only the moves are sent, the worker replays them itself
+
+            searchDone,AI_moveID,searchStats=searchWorker.poll()
+            if searchDone:
+                if searchStats is not None and 'error' in searchStats:
+                    print("search failed - "+searchStats['error']+", playing a random move")
+                    if not searchWorker.process.is_alive():  # start a new worker for the next AI move
+                        searchWorker.close()
+                        searchWorker=ChessWorker.SearchWorker()
+                else:
+                    print("done thinking"+(" - depth "+str(searchStats['depth'])+", "+format(searchStats['nodesPerSecond'],".0f")+
+                                           " nodes/sec" if searchStats is not None and searchStats['source']=='search' else ""))
+                AI_move=None
+                for move in validMoves:
+                    if move.moveID==AI_moveID:
+                        AI_move=move
+                if AI_move is None:  # the search failed (or found no move)
                     AI_move=ChessAI.findRandomMove(validMoves)  # could pass in `gamestate.validMoves()` but that will regenerate valid moves over and over again (redundant)
                 gamestate.makeMove(AI_move)
                 moveMade=True
@@ -133,88 +166,199 @@ def main():
         if moveMade:
             if animate:
                 animateMove(gamestate.moveLog[-1],screen,gamestate.board,clock)  # animate last move in move log (current move)
+                renderer.invalidate()
             validMoves = gamestate.getValidMoves()
             moveMade = False
             animate=False
             moveUndone=False
         
-        drawGameState(screen,gamestate,validMoves,sqSelected,moveLogFont)
-        
         # GameOver States
-        if gamestate.checkmate or gamestate.stalemate:
+        if gamestate.checkmate or gamestate.stalemate or gamestate.draw:
             gameOver=True
-            drawEndGameText(screen,("Stalemate" if gamestate.stalemate else "Black wins by checkmate" if gamestate.whiteToMove else "White wins by checkmate"))
-            
-        
-        clock.tick(MAX_FPS)
-        p.display.flip()
+        endGameText=getEndGameText(gamestate) if gameOver else None
+        renderer.draw(gamestate,validMoves,sqSelected,promotionMoves,endGameText)
 
-def drawGameState(screen, gamestate, validMoves, sqSelected,moveLogFont):
-    """
-    Function responsible for all graphics in current gamestate
-    """
-    drawBoard(screen)  # 1) draws squares on board
-    highlightSquares(screen,gamestate,validMoves,sqSelected) # 2) Highlights selectged squares
-    drawPieces(screen,gamestate.board)  # 3) draw pieces on top of squares
-    drawMoveLog(screen,gamestate,moveLogFont)
+        AIToMove=not((gamestate.whiteToMove and playerOne) or (not(gamestate.whiteToMove) and playerTwo))
+        idle=not AIThinking and (gameOver or not AIToMove or moveUndone)
+        if not idle:
+            clock.tick(MAX_FPS)
 
-def drawBoard(screen):
+class BoardRenderer():
     """
-    Function draws board.
-        - Note: Top left square of board (either perspective) is always white.
+    Retained-mode drawing - remembers what is on screen and each frame redraws (and sends to the display) only what changed
+        - The empty board is rendered once to a surface, a square is repainted by blitting its part of that surface back
+        - Each square is remembered as (piece, highlight, promotion choice), only squares that look different are redrawn
+        - The move log panel is redrawn only when its lines change or it is scrolled (see MoveLogView)
+        - A frame where nothing changed draws nothing and doesn't touch the display
     """
-    global colors
-    colors = [p.Color('light yellow'),p.Color('dark grey')]
-    for row in range(DIMENSION):
-        for column in range(DIMENSION):
-            color = colors[(row+column)%2]  # black sqs at spots where sum of row position and column position is even
-            p.draw.rect(screen,color,p.Rect(column*SQ_SIZE,row*SQ_SIZE,SQ_SIZE,SQ_SIZE))
+    def __init__(self,screen,moveLogFont):
+        self.screen=screen
+        self.moveLogView=MoveLogView(moveLogFont)
+        self.highlights={}  # highlight -> translucent square surface
+        for highlight,color in (('selected','blue'),('target','yellow')):
+            surface=p.Surface((SQ_SIZE,SQ_SIZE))
+            surface.set_alpha(100)  # set transpaency value -> 0 is transparant vs 255 is opaque
+            surface.fill(p.Color(color))
+            self.highlights[highlight]=surface
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Forgets what is on screen, so the next draw repaints everything (after an animation or the window was covered)
+        """
+        self.drawnSquares=[None]*(DIMENSION*DIMENSION)
+        self.moveLogView.changed=True
+        self.drawnText=None
 
-def highlightSquares(screen, gamestate, validMoves, sqSelected):
+    def draw(self,gamestate,validMoves,sqSelected,promotionMoves,endGameText=None):
+        """
+        Brings the screen up to date with the game and updates the display where it changed
+        """
+        dirtyRects=[]
+        if endGameText!=self.drawnText:  # text appeared/went away - repaint the board under it
+            self.drawnSquares=[None]*(DIMENSION*DIMENSION)
+        looks=getSquareLooks(gamestate,validMoves,sqSelected,promotionMoves)
+        for sq in range(DIMENSION*DIMENSION):
+            if looks[sq]!=self.drawnSquares[sq]:
+                dirtyRects.append(self.drawSquare(sq,looks[sq]))
+                self.drawnSquares[sq]=looks[sq]
+        if endGameText is not None and dirtyRects:  # squares under the text may have been repainted
+            drawEndGameText(self.screen,endGameText)
+            dirtyRects.append(p.Rect(0,0,BOARD_WIDTH,BOARD_HEIGHT))
+        self.drawnText=endGameText
+        self.moveLogView.update(gamestate.moveLog)
+        if self.moveLogView.changed:
+            dirtyRects.append(self.moveLogView.draw(self.screen))
+        if dirtyRects:
+            p.display.update(dirtyRects)
+
+    def drawSquare(self,sq,look):
+        """
+        Repaints one square - board, highlight, then piece (or promotion choice) - and returns its rect
+        """
+        piece,highlight,promotionPiece=look
+        square=p.Rect((sq%DIMENSION)*SQ_SIZE,(sq//DIMENSION)*SQ_SIZE,SQ_SIZE,SQ_SIZE)
+        self.screen.blit(getBoardSurface(),square,square)
+        if promotionPiece is not None:  # promotion choices on top of everything while picking
+            p.draw.rect(self.screen,p.Color('white'),square)
+            p.draw.rect(self.screen,p.Color('black'),square,1)  # outline
+            self.screen.blit(IMAGES[promotionPiece],square)
+            return square
+        if highlight is not None:
+            self.screen.blit(self.highlights[highlight],square)
+        if piece!='--':
+            self.screen.blit(IMAGES[piece],square)
+        return square
+
+def getSquareLooks(gamestate,validMoves,sqSelected,promotionMoves):
     """
-    Highlight square selected and moves for the piece selected
+    What each square should show - (piece, highlight, promotion choice) by row*8+col
+        - highlight: 'selected' for the selected piece the player can move, 'target' for the squares it can move to
     """
+    highlights=[None]*(DIMENSION*DIMENSION)
     if sqSelected!=():
         row,col=sqSelected
         # check if square selected is a piece which can be moved
         if gamestate.board[row][col][0]==('w' if gamestate.whiteToMove else 'b'):
-            # highlight selected square
-            surface=p.Surface((SQ_SIZE,SQ_SIZE))
-            surface.set_alpha(100)  # set transpaency value -> 0 is transparant vs 255 is opaque
-            surface.fill(p.Color('blue'))
-            screen.blit(surface,(col*SQ_SIZE,row*SQ_SIZE))  # background light surface at position (x,y)
-            # highlight moves from that square
-            surface.fill(p.Color('yellow'))
+            highlights[row*DIMENSION+col]='selected'
             for move in validMoves:
                 if move.startRow==row and move.startCol==col:
-                    screen.blit(surface,(move.endCol*SQ_SIZE, move.endRow*SQ_SIZE))
+                    highlights[move.endRow*DIMENSION+move.endCol]='target'
+    promotionPieces=[None]*(DIMENSION*DIMENSION)
+    for i in range(len(promotionMoves)):
+        row,col=getPromotionPickerSquare(promotionMoves[i],i)
+        promotionPieces[row*DIMENSION+col]=promotionMoves[i].pieceMoved[0]+promotionMoves[i].promotionPiece
+    return [(gamestate.board[sq//DIMENSION][sq%DIMENSION],highlights[sq],promotionPieces[sq]) for sq in range(DIMENSION*DIMENSION)]
 
-def drawMoveLog(screen,gamestate,font):
+boardSurface=None  # the empty board, rendered the first time it is needed
+
+def getBoardSurface():
+    """
+    Surface with the empty board.
+        - Note: Top left square of board (either perspective) is always white.
+    """
+    global boardSurface, colors
+    if boardSurface is None:
+        colors = [p.Color('light yellow'),p.Color('dark grey')]
+        boardSurface=p.Surface((BOARD_WIDTH,BOARD_HEIGHT))
+        for row in range(DIMENSION):
+            for column in range(DIMENSION):
+                color = colors[(row+column)%2]  # black sqs at spots where sum of row position and column position is even
+                p.draw.rect(boardSurface,color,p.Rect(column*SQ_SIZE,row*SQ_SIZE,SQ_SIZE,SQ_SIZE))
+    return boardSurface
+
+def drawBoard(screen):
+    """
+    Function draws board.
+    """
+    screen.blit(getBoardSurface(),(0,0))
+
+class MoveLogView():
     """
-    Draws the move log
+    The move log panel as a list of lines rendered once each (MOVES_PER_LINE full moves to a line)
+        - update() only renders the lines whose moves changed - as moves are made that is just the last line. An
+          undo/reset drops the lines from the first move that no longer matches and renders them again
+        - scroll() moves the view through games too long for the panel, while it is at the bottom it follows new moves
     """
-    moveLogRect=p.Rect(BOARD_WIDTH,0,MOVE_LOG_PANEL_WIDTH,MOVE_LOG_PANEL_HEIGHT)
-    p.draw.rect(screen,p.Color("black"),moveLogRect)
-    moveLog=gamestate.moveLog
-    moveTexts=[]
-    for i in range(0,len(moveLog),2):
-        moveString=str(i//2+1)+". "+str(moveLog[i])+" "
-        if i+1<len(moveLog): # ensure black made a move
-            moveString+=str(moveLog[i+1])+" "
-        moveTexts.append(moveString)
-    movesPerRow=3
     padding=5
     lineSpacing=2
-    textY=padding
-    for i in range(0,len(moveTexts),movesPerRow):
-        text=""
-        for j in range(movesPerRow):
-            if i+j<len(moveTexts):
-                text+=moveTexts[i+j]
-        textObject=font.render(text,True,p.Color('white')) # create text object - (text,antialiasing,color)
-        textLocation=moveLogRect.move(padding,textY)
-        screen.blit(textObject,textLocation)
-        textY+=textObject.get_height()+lineSpacing
+
+    def __init__(self,font):
+        self.font=font
+        self.moves=[]  # moves the lines were rendered from
+        self.lines=[]  # rendered line surfaces
+        self.lineHeight=font.get_linesize()+self.lineSpacing
+        self.visibleLines=max(1,(MOVE_LOG_PANEL_HEIGHT-2*self.padding)//self.lineHeight)
+        self.firstLine=0  # index of the top line shown
+        self.changed=True  # panel has to be drawn again
+
+    def update(self,moveLog):
+        """
+        Brings the lines up to date with the game's move log
+        """
+        if len(moveLog)==len(self.moves) and (len(moveLog)==0 or moveLog[-1] is self.moves[-1]):
+            return  # nothing happened since the last frame (the usual case)
+        common=0  # moves both agree on
+        while common<len(self.moves) and common<len(moveLog) and moveLog[common] is self.moves[common]:
+            common+=1
+        pliesPerLine=2*MOVES_PER_LINE
+        following=self.firstLine==self.getLastFirstLine()
+        del self.lines[common//pliesPerLine:]
+        self.moves=moveLog[:]
+        for start in range(len(self.lines)*pliesPerLine,len(moveLog),pliesPerLine):
+            text=""
+            for i in range(start,min(start+pliesPerLine,len(moveLog)),2):
+                text+=str(i//2+1)+". "+str(moveLog[i])+" "
+                if i+1<len(moveLog): # ensure black made a move
+                    text+=str(moveLog[i+1])+" "
+            self.lines.append(self.font.render(text,True,p.Color('white'))) # create text object - (text,antialiasing,color)
+        self.firstLine=self.getLastFirstLine() if following else min(self.firstLine,self.getLastFirstLine())
+        self.changed=True
+
+    def getLastFirstLine(self):
+        """
+        Top line when scrolled all the way down
+        """
+        return max(0,len(self.lines)-self.visibleLines)
+
+    def scroll(self,lines):
+        firstLine=max(0,min(self.firstLine+lines,self.getLastFirstLine()))
+        if firstLine!=self.firstLine:
+            self.firstLine=firstLine
+            self.changed=True
+
+    def draw(self,screen):
+        """
+        Draws the visible lines, returns the panel's rect
+        """
+        moveLogRect=p.Rect(BOARD_WIDTH,0,MOVE_LOG_PANEL_WIDTH,MOVE_LOG_PANEL_HEIGHT)
+        p.draw.rect(screen,p.Color("black"),moveLogRect)
+        textY=self.padding
+        for line in self.lines[self.firstLine:self.firstLine+self.visibleLines]:
+            screen.blit(line,moveLogRect.move(self.padding,textY))
+            textY+=self.lineHeight
+        self.changed=False
+        return moveLogRect
 
 def drawPieces(screen,board):
     """
@@ -226,11 +370,17 @@ def drawPieces(screen,board):
             if piece != '--': # not empty space
                 screen.blit(IMAGES[piece],p.Rect(column*SQ_SIZE,row*SQ_SIZE,SQ_SIZE,SQ_SIZE))
 
+def getPromotionPickerSquare(move,index):
+    """
+    Square (row,col) the picker shows the index-th promotion choice on - a column running from the promotion square
+    toward the middle of the board
+    """
+    return (move.endRow+index if move.endRow==0 else move.endRow-index, move.endCol)
+
 def animateMove(move, screen, board, clock):
     """
-    Animating a move
+    Animating a move - only the board is sent to the display, the move log panel doesn't change while it runs
     """
-    global colors
     coordinates=[]  # list of coordinates that the animation will move through
     deltaRow=move.endRow-move.startRow
     deltaCol=move.endCol-move.startCol
@@ -252,9 +402,16 @@ def animateMove(move, screen, board, clock):
             screen.blit(IMAGES[move.pieceCaptured],endSquare)
         # draw moving piece
         screen.blit(IMAGES[move.pieceMoved],p.Rect(col*SQ_SIZE,row*SQ_SIZE,SQ_SIZE,SQ_SIZE))
-        p.display.flip()
+        p.display.update(p.Rect(0,0,BOARD_WIDTH,BOARD_HEIGHT))
         clock.tick(60)  # framerate for animation
 
+def getEndGameText(gamestate):
+    if gamestate.stalemate:
+        return "Stalemate"
+    if gamestate.draw:
+        return "Draw by "+gamestate.getDrawReason()
+    return "Black wins by checkmate" if gamestate.whiteToMove else "White wins by checkmate"
+
 def drawEndGameText(screen, text):
     font=p.font.SysFont("Helvetica",32,True,False)  # create font object - (font type, size, bold, italicized)
     # drawing text
@@ -0,0 +1,273 @@
+"""
+Self-play matches - plays two configurations of the AI against each other headlessly and measures the difference
+    - An engine configuration is a set of ChessAI settings (ie. DEPTH=3 TIME_LIMIT=200 QUIESCENCE_CHECK_EVASIONS=False),
+      applied before each of its moves. Each engine keeps its own transposition table and history scores
+    - Openings come from the first plies of the book's opening lines, every opening is played twice with the colors
+      swapped so neither engine gets the better side of it
+    - Games are spread over a pool of processes and written as PGN, the result is reported as the Elo difference with
+      a 95% confidence interval and an SPRT (sequential probability ratio test) verdict - with --sprt the match stops as
+      soon as the test is decided
+Usage (from the repo root):
+    python src/ChessMatch.py --games 40 --time 200 --engine1 DEPTH=64 --engine2 DEPTH=64 QUIESCENCE_CHECK_EVASIONS=False
+    python src/ChessMatch.py --games 1000 --engine1 DEPTH=3 --engine2 DEPTH=2 --pgn match.pgn --sprt --elo0 0 --elo1 20
+"""
+
+import argparse
+import ast
+import datetime
+import math
+import os
+import random
+import sys
+from multiprocessing import Pool
+import ChessAI
+import ChessBitboard
+import ChessPGN
+
+OPENINGS_PATH=os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir,'books','openings.txt')
+OPENING_PLIES=8 # plies of each opening line played before the engines take over
+MAX_PLIES=400 # games still going after this many plies are adjudicated a draw
+
+def parseConfig(settings):
+    """
+    Engine configuration from NAME=value strings - names must be ChessAI settings, values are Python literals
+    """
+    config={}
+    for setting in settings:
+        name,_,value=setting.partition('=')
+        if not name.isupper() or not hasattr(ChessAI,name):
+            raise ValueError(name+" is not a ChessAI setting")
+        try:
+            config[name]=ast.literal_eval(value)
+        except (ValueError,SyntaxError):
+            raise ValueError("Invalid value for "+name+": "+value)
+    return config
+
+def readOpenings(lines,plies=OPENING_PLIES):
+    """
+    Distinct openings (lists of moves in coordinate notation) from book lines, cut to `plies` moves
+    """
+    openings=[]
+    for line in lines:
+        line=line.strip()
+        if line and not line.startswith('#'):
+            opening=line.split()[:plies]
+            if opening not in openings:
+                openings.append(opening)
+    return openings or [[]]
+
+def getEloDifference(score):
+    """
+    Elo difference that makes `score` (0-1) the expected score
+    """
+    if score<=0:
+        return -math.inf
+    if score>=1:
+        return math.inf
+    return 400*math.log10(score/(1-score))
+
+def getExpectedScore(elo):
+    return 1/(1+10**(-elo/400))
+
+def getScoreStats(wins,draws,losses):
+    """
+    Mean and variance of the per-game score (1, 1/2, 0)
+    """
+    games=wins+draws+losses
+    score=(wins+draws/2)/games
+    variance=(wins*(1-score)**2+draws*(0.5-score)**2+losses*score**2)/games
+    return score,variance
+
+def computeElo(wins,draws,losses):
+    """
+    Elo difference with its 95% confidence interval - (elo, lower, upper)
+    """
+    games=wins+draws+losses
+    if games==0:
+        return 0.0,-math.inf,math.inf
+    score,variance=getScoreStats(wins,draws,losses)
+    margin=1.96*math.sqrt(variance/games)
+    return getEloDifference(score),getEloDifference(score-margin),getEloDifference(score+margin)
+
+def sprt(wins,draws,losses,elo0,elo1,alpha=0.05,beta=0.05):
+    """
+    Sequential probability ratio test of H0: the difference is elo0 against H1: it is elo1 - (log likelihood ratio,
+    lower bound, upper bound, verdict). The verdict is 'H1' once the ratio passes the upper bound (engine1 is stronger by
+    about elo1), 'H0' once it passes the lower bound, otherwise None (play on)
+        - uses the normal approximation of the score distribution, accurate once there are a few dozen games
+    """
+    lower=math.log(beta/(1-alpha))
+    upper=math.log((1-beta)/alpha)
+    games=wins+draws+losses
+    if games==0:
+        return 0.0,lower,upper,None
+    score,variance=getScoreStats(wins,draws,losses)
+    if variance==0:  # every game had the same result - no spread to judge by yet
+        return 0.0,lower,upper,None
+    score0=getExpectedScore(elo0)
+    score1=getExpectedScore(elo1)
+    llr=games*(score1-score0)*(2*score-score0-score1)/(2*variance)
+    verdict='H1' if llr>=upper else 'H0' if llr<=lower else None
+    return llr,lower,upper,verdict
+
+engines=None  # (name, config) of both engines, set in each worker by initWorker
+defaults=None  # ChessAI's own value of every setting either engine changes
+
+def initWorker(engineConfigs):
+    global engines, defaults
+    ChessAI.VERBOSE=False
+    ChessAI.USE_BOOK=False  # the match supplies the openings
+    engines=engineConfigs
+    defaults={}
+    for name,config in engines:
+        for setting in config:
+            defaults[setting]=getattr(ChessAI,setting)
+
+def applyEngine(engine,searchState):
+    """
+    Switches ChessAI over to an engine - its settings and its own transposition table/history scores, with killer move
+    slots for as deep as it searches
+    """
+    name,config=engines[engine]
+    for setting,value in defaults.items():
+        setattr(ChessAI,setting,config.get(setting,value))
+    plies=max(ChessAI.MAX_DEPTH,ChessAI.DEPTH)+1  # killer slots the deepest search can index (ChessAI sized them at import)
+    if len(ChessAI.killerMoves)<plies:
+        ChessAI.killerMoves=[[None,None] for _ in range(plies)]
+    if searchState[engine] is None:
+        searchState[engine]=(ChessAI.TranspositionTable(ChessAI.TT_BUCKETS),{'w':{},'b':{}})
+    ChessAI.transpositionTable,ChessAI.historyScores=searchState[engine]
+
+def playGame(task):
+    """
+    Plays one game - task is (round, opening moves, engine playing white). Returns a dict with the round, the engine that
+    played white, the result ('1-0', '0-1' or '1/2-1/2'), how the game ended, the moves in SAN and the plies of the opening
+    """
+    gameRound,opening,whiteEngine=task
+    random.seed(gameRound)  # the AI shuffles its root moves - same round, same game
+    gamestate=ChessBitboard.BitboardGameState()
+    sanMoves=[]
+    for notation in opening:
+        validMoves=gamestate.getValidMoves()
+        move=next((move for move in validMoves if move.getChessNotation()==notation),None)
+        if move is None:
+            raise ValueError("Opening move "+notation+" is not valid")
+        sanMoves.append(ChessPGN.getSan(gamestate,move,validMoves))
+        gamestate.makeMove(move)
+    searchState=[None,None]
+    while True:
+        validMoves=gamestate.getValidMoves()
+        if gamestate.checkmate:
+            result,termination=('0-1' if gamestate.whiteToMove else '1-0'),'checkmate'
+            break
+        if gamestate.stalemate:
+            result,termination='1/2-1/2','stalemate'
+            break
+        if gamestate.draw:
+            result,termination='1/2-1/2',gamestate.getDrawReason()
+            break
+        if len(gamestate.moveLog)>=MAX_PLIES:
+            result,termination='1/2-1/2','adjudicated after '+str(MAX_PLIES)+' plies'
+            break
+        engine=whiteEngine if gamestate.whiteToMove else 1-whiteEngine
+        applyEngine(engine,searchState)
+        move=ChessAI.searchBestMove(gamestate,validMoves)
+        if move is None:
+            move=validMoves[0]
+        sanMoves.append(ChessPGN.getSan(gamestate,move,validMoves))
+        gamestate.makeMove(move)
+    return {'round':gameRound,'whiteEngine':whiteEngine,'result':result,'termination':termination,'moves':sanMoves,
+            'openingPlies':len(opening)}
+
+def formatPgn(game,names,date):
+    """
+    One game as PGN
+    """
+    white,black=(names[0],names[1]) if game['whiteEngine']==0 else (names[1],names[0])
+    tags=[('Event','Self-play match'),('Site','?'),('Date',date),('Round',str(game['round'])),('White',white),
+          ('Black',black),('Result',game['result']),('Termination',game['termination'])]
+    return ChessPGN.formatGame(tags,game['moves'],game['result'])
+
+def getTasks(openings,games):
+    """
+    (round, opening, engine playing white) of each game - consecutive rounds play the same opening with colors swapped
+    """
+    return [(gameRound,openings[(gameRound-1)//2%len(openings)],(gameRound-1)%2) for gameRound in range(1,games+1)]
+
+def runMatch(engineConfigs,games,openings,pgnFile=None,workers=1,sprtBounds=None,report=sys.stdout):
+    """
+    Plays the match and reports each game and the standings as they come in - returns engine1's (wins, draws, losses)
+        - sprtBounds: (elo0, elo1) to stop as soon as the SPRT is decided, None plays every game
+    """
+    names=[name for name,config in engineConfigs]
+    date=datetime.date.today().strftime('%Y.%m.%d')
+    wins=draws=losses=0
+    with Pool(workers,initializer=initWorker,initargs=(engineConfigs,)) as pool:
+        for game in pool.imap_unordered(playGame,getTasks(openings,games)):
+            if pgnFile is not None:
+                pgnFile.write(formatPgn(game,names,date))
+                pgnFile.flush()
+            if game['result']=='1/2-1/2':
+                draws+=1
+            elif (game['result']=='1-0')==(game['whiteEngine']==0):
+                wins+=1
+            else:
+                losses+=1
+            white,black=(names[0],names[1]) if game['whiteEngine']==0 else (names[1],names[0])
+            print("round "+str(game['round'])+": "+white+" - "+black+" "+game['result']+" ("+game['termination']+
+                  "), "+names[0]+" +"+str(wins)+" ="+str(draws)+" -"+str(losses),file=report)
+            if sprtBounds is not None and sprt(wins,draws,losses,*sprtBounds)[3] is not None:
+                break  # leaving the pool's block terminates the games still running
+    return wins,draws,losses
+
+def formatElo(elo):
+    return format(elo,"+.1f") if math.isfinite(elo) else ("+inf" if elo>0 else "-inf")
+
+def main():
+    parser=argparse.ArgumentParser(description="Play two AI configurations against each other and compare their strength")
+    parser.add_argument('--engine1',nargs='*',default=[],metavar='SETTING=VALUE',help="ChessAI settings of the first engine")
+    parser.add_argument('--engine2',nargs='*',default=[],metavar='SETTING=VALUE',help="ChessAI settings of the second engine")
+    parser.add_argument('--name1',default='engine1')
+    parser.add_argument('--name2',default='engine2')
+    parser.add_argument('--games',type=int,default=20,help="games to play (even, so every opening is played with both colors)")
+    parser.add_argument('--time',type=int,help="ms per move for both engines (TIME_LIMIT, unless an engine sets its own)")
+    parser.add_argument('--openings',default=OPENINGS_PATH,help="opening lines, one per line in coordinate notation")
+    parser.add_argument('--opening-plies',type=int,default=OPENING_PLIES,help="plies of each opening line to play")
+    parser.add_argument('--pgn',help="file to write the games to")
+    parser.add_argument('--workers',type=int,default=os.cpu_count(),help="games played at once (default: one per core)")
+    parser.add_argument('--sprt',action='store_true',help="stop once the SPRT of elo0 against elo1 is decided")
+    parser.add_argument('--elo0',type=float,default=0.0,help="SPRT null hypothesis - engine1 is this much stronger")
+    parser.add_argument('--elo1',type=float,default=5.0,help="SPRT alternative hypothesis")
+    args=parser.parse_args()
+
+    engineConfigs=[]
+    for name,settings in ((args.name1,args.engine1),(args.name2,args.engine2)):
+        try:
+            config=parseConfig(settings)
+        except ValueError as error:
+            parser.error(str(error))
+        if args.time is not None:
+            config.setdefault('TIME_LIMIT',args.time)
+        engineConfigs.append((name,config))
+    with open(args.openings) as file:
+        openings=readOpenings(file,args.opening_plies)
+    pgnFile=open(args.pgn,'w') if args.pgn else None
+    try:
+        wins,draws,losses=runMatch(engineConfigs,args.games,openings,pgnFile,max(1,args.workers),
+                                   (args.elo0,args.elo1) if args.sprt else None)
+    finally:
+        if pgnFile is not None:
+            pgnFile.close()
+
+    games=wins+draws+losses
+    elo,lower,upper=computeElo(wins,draws,losses)
+    llr,lowerBound,upperBound,verdict=sprt(wins,draws,losses,args.elo0,args.elo1)
+    print(args.name1+" vs "+args.name2+": +"+str(wins)+" ="+str(draws)+" -"+str(losses)+" ("+str(games)+" games, score "+
+          format((wins+draws/2)/games if games else 0,".3f")+")")
+    print("Elo difference: "+formatElo(elo)+" (95% CI "+formatElo(lower)+" to "+formatElo(upper)+")")
+    print("SPRT elo0="+str(args.elo0)+" elo1="+str(args.elo1)+": LLR "+format(llr,".2f")+" ("+format(lowerBound,".2f")+", "+
+          format(upperBound,".2f")+") - "+{'H1':"H1 accepted, "+args.name1+" is stronger",
+                                          'H0':"H0 accepted, "+args.name1+" is not stronger"}.get(verdict,"inconclusive"))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+PGN games - reading them back in and writing them out with standard algebraic notation (SAN)
+    - readGames streams a file line by line and yields one game at a time (tags and SAN moves, comments, variations and
+      NAGs dropped), so a database of any size is read in constant memory
+    - A game's moves are decoded against getValidMoves only as its positions are asked for (PgnGame.replay)
+    - getSan writes full SAN - disambiguation, captures, promotion piece and check/checkmate marks - which Move.__str__
+      can't, as it needs the position the move is played in
+Usage (from the repo root):
+    python src/ChessPGN.py check games.pgn                      decodes every game, reports errors and speed
+    python src/ChessPGN.py lines games.pgn --plies 16 > lines.txt   opening lines for ChessBook.py build
+"""
+
+import argparse
+import re
+import sys
+import time
+import ChessBitboard
+import ChessEngine
+
+RESULTS=('1-0','0-1','1/2-1/2','*')
+TAG_PATTERN=re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# movetext tokens - brace comments (possibly running on to later lines), rest-of-line comments, variation parentheses,
+# NAGs, and everything else (move numbers, moves, results)
+TOKEN_PATTERN=re.compile(r'\{[^}]*\}?|;.*|[()]|\$\d+|[^\s(){};$]+')
+MOVE_NUMBER_PATTERN=re.compile(r'\d+\.+')
+SAN_PATTERN=re.compile(r'([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+class PgnGame():
+    """
+    One game read by readGames - tags (name -> value, in file order), moves as SAN, the result token and where the game
+    starts in the file (see readGames)
+    """
+    def __init__(self,tags,moves,result,offset=None):
+        self.tags=tags
+        self.moves=moves
+        self.result=result
+        self.offset=offset
+
+    def getStartingPosition(self,engine=ChessBitboard.BitboardGameState):
+        """
+        Position the game starts from - its FEN tag if it has one
+        """
+        if 'FEN' in self.tags:
+            return engine.fromFen(self.tags['FEN'])
+        return engine()
+
+    def replay(self,engine=ChessBitboard.BitboardGameState):
+        """
+        Lazily plays the game through - yields (gamestate, move) before each move is made, the gamestate is the same
+        object every time (copy what needs to be kept). Raises ValueError at the first move that isn't legal
+        """
+        gamestate=self.getStartingPosition(engine)
+        for san in self.moves:
+            move=decodeSan(gamestate,san)
+            yield gamestate,move
+            gamestate.makeMove(move)
+
+def readGames(lines):
+    """
+    Yields the games of a PGN file (any iterable of lines) one at a time, without reading ahead past the game
+        - lines of a file opened in binary mode are decoded as UTF-8, and each game's offset is then the byte offset of
+          its first line, so the game can be read again with seek (for text lines it counts characters)
+    """
+    tags={}
+    moves=[]
+    inMovetext=False
+    inComment=False
+    variationDepth=0
+    offset=0  # of the next line
+    gameOffset=None
+    for line in lines:
+        lineOffset=offset
+        offset+=len(line)
+        if isinstance(line,bytes):
+            line=line.decode('utf-8','replace')
+        if inComment:
+            end=line.find('}')
+            if end==-1:
+                continue
+            line=line[end+1:]
+            inComment=False
+        stripped=line.strip()
+        if not stripped or stripped.startswith('%'):  # blank, or an escaped line
+            continue
+        if stripped.startswith('[') and variationDepth==0:
+            if inMovetext:  # a game without a result token
+                yield PgnGame(tags,moves,'*',gameOffset)
+                tags,moves,inMovetext,gameOffset={},[],False,None
+            if gameOffset is None:
+                gameOffset=lineOffset
+            match=TAG_PATTERN.match(stripped)
+            if match:
+                tags[match.group(1)]=match.group(2).replace('\\"','"').replace('\\\\','\\')
+            continue
+        for token in TOKEN_PATTERN.findall(line):
+            if token[0]=='{':
+                inComment=not token.endswith('}')
+            elif token[0]==';':
+                break
+            elif token=='(':
+                variationDepth+=1
+            elif token==')':
+                variationDepth=max(0,variationDepth-1)
+            elif variationDepth>0 or token[0]=='$':
+                continue
+            elif token in RESULTS:
+                yield PgnGame(tags,moves,token,gameOffset if gameOffset is not None else lineOffset)
+                tags,moves,inMovetext,gameOffset={},[],False,None
+            else:
+                token=MOVE_NUMBER_PATTERN.sub('',token,count=1)  # "12." "12..." and "12.e4"
+                if token:
+                    if gameOffset is None:
+                        gameOffset=lineOffset
+                    moves.append(token)
+                    inMovetext=True
+    if inMovetext or tags:
+        yield PgnGame(tags,moves,'*',gameOffset)
+
+def decodeSan(gamestate,san,validMoves=None):
+    """
+    Legal move of the position that `san` describes - raises ValueError if there is none or more than one
+        - check marks and annotations (+ # ! ?) are ignored, castling may be written with zeros
+    """
+    if validMoves is None:
+        validMoves=gamestate.getValidMoves()
+    text=san.rstrip('+#!?')
+    if text in ('O-O','0-0','O-O-O','0-0-0'):
+        endCol=6 if len(text)==3 else 2
+        for move in validMoves:
+            if move.isCastleMove and move.endCol==endCol:
+                return move
+        raise ValueError("Illegal move "+san)
+    match=SAN_PATTERN.match(text)
+    if match is None:
+        raise ValueError("Invalid SAN "+san)
+    pieceType,fromFile,fromRank,endSquare,promotionPiece=match.groups()
+    pieceType=pieceType or 'p'
+    endCol=ChessEngine.Move.fileToCol[endSquare[0]]
+    endRow=ChessEngine.Move.rankToRow[endSquare[1]]
+    candidates=[move for move in validMoves
+                if move.pieceMoved[1]==pieceType and move.endRow==endRow and move.endCol==endCol and not move.isCastleMove
+                and (fromFile is None or move.startCol==ChessEngine.Move.fileToCol[fromFile])
+                and (fromRank is None or move.startRow==ChessEngine.Move.rankToRow[fromRank])
+                and move.promotionPiece==promotionPiece]
+    if len(candidates)!=1:
+        raise ValueError(("Ambiguous move " if candidates else "Illegal move ")+san)
+    return candidates[0]
+
+def getSan(gamestate,move,validMoves=None):
+    """
+    Standard algebraic notation of a legal move, in the position before it is made
+    """
+    if validMoves is None:
+        validMoves=gamestate.getValidMoves()
+    if move.isCastleMove:
+        san="O-O" if move.endCol==6 else "O-O-O"
+    else:
+        endSquare=move.getRankFile(move.endRow,move.endCol)
+        isCapture=move.pieceCaptured!='--'  # enpassant included
+        if move.pieceMoved[1]=='p':
+            san=(move.colToFile[move.startCol]+"x" if isCapture else "")+endSquare
+            if move.isPawnPromotion:
+                san+="="+move.promotionPiece
+        else:
+            # another piece of the same kind that can go to the same square - name the start file, else rank, else both
+            others=[other for other in validMoves if other.pieceMoved==move.pieceMoved and other.endRow==move.endRow and
+                    other.endCol==move.endCol and (other.startRow,other.startCol)!=(move.startRow,move.startCol)]
+            disambiguation=""
+            if others:
+                if all(other.startCol!=move.startCol for other in others):
+                    disambiguation=move.colToFile[move.startCol]
+                elif all(other.startRow!=move.startRow for other in others):
+                    disambiguation=move.rowToRank[move.startRow]
+                else:
+                    disambiguation=move.getRankFile(move.startRow,move.startCol)
+            san=move.pieceMoved[1]+disambiguation+("x" if isCapture else "")+endSquare
+    gamestate.makeMove(move)
+    if gamestate.inCheck():
+        san+="#" if len(gamestate.getValidMoves())==0 else "+"
+    gamestate.undoMove()
+    return san
+
+def formatGame(tags,moves,result,whiteToMove=True,fullmoveNumber=1):
+    """
+    PGN text of a game - tag pairs (name, value), then the SAN moves wrapped to 80 columns
+        - whiteToMove/fullmoveNumber: of the starting position, for games set up from a FEN
+    """
+    text=''.join('['+name+' "'+str(value).replace('\\','\\\\').replace('"','\\"')+'"]\n' for name,value in tags)+'\n'
+    tokens=[]
+    for san in moves:
+        if whiteToMove:
+            tokens.append(str(fullmoveNumber)+'. '+san)
+        elif not tokens:  # game starts with black's move
+            tokens.append(str(fullmoveNumber)+'... '+san)
+        else:
+            tokens.append(san)
+        if not whiteToMove:
+            fullmoveNumber+=1
+        whiteToMove=not whiteToMove
+    tokens.append(result)
+    line=''
+    for token in tokens:
+        if line and len(line)+1+len(token)>80:
+            text+=line+'\n'
+            line=token
+        else:
+            line=line+' '+token if line else token
+    return text+line+'\n\n'
+
+def checkGames(lines,report=sys.stdout):
+    """
+    Decodes every move of every game - reports the games that fail, returns (games, plies, errors)
+    """
+    games=plies=errors=0
+    startTime=time.perf_counter()
+    for game in readGames(lines):
+        games+=1
+        try:
+            for gamestate,move in game.replay():
+                plies+=1
+        except (ValueError,KeyError,IndexError) as error:  # bad SAN or a FEN tag that can't be read
+            errors+=1
+            print("game "+str(games)+" ("+game.tags.get('White','?')+" - "+game.tags.get('Black','?')+"): "+str(error),
+                  file=report)
+    elapsed=time.perf_counter()-startTime
+    print(str(games)+" games, "+str(plies)+" plies, "+str(errors)+" errors, "+format(elapsed,".1f")+"s, "+
+          format(plies/elapsed if elapsed else 0,".0f")+" plies/sec",file=report)
+    return games,plies,errors
+
+def writeLines(lines,output,plies):
+    """
+    Writes the first `plies` moves of every game from the starting position as a line of coordinate notation - the
+    format ChessBook.buildBook reads. Games set up from a FEN or with bad moves are skipped
+    """
+    for game in readGames(lines):
+        if 'FEN' in game.tags:
+            continue
+        notations=[]
+        try:
+            for gamestate,move in game.replay():
+                if len(notations)==plies:
+                    break
+                notations.append(move.getChessNotation())
+        except (ValueError,KeyError,IndexError):
+            continue
+        if notations:
+            output.write(' '.join(notations)+'\n')
+
+def main():
+    parser=argparse.ArgumentParser(description="Read PGN game databases")
+    subparsers=parser.add_subparsers(dest='command',required=True)
+    checkParser=subparsers.add_parser('check',help="decode every game and report the ones with errors")
+    checkParser.add_argument('pgn',nargs='?',help="PGN file (default: stdin)")
+    linesParser=subparsers.add_parser('lines',help="write the openings of the games as lines for ChessBook.py build")
+    linesParser.add_argument('pgn',nargs='?',help="PGN file (default: stdin)")
+    linesParser.add_argument('--plies',type=int,default=16,help="moves of each game to write")
+    args=parser.parse_args()
+
+    lines=open(args.pgn,encoding='utf-8',errors='replace') if args.pgn else sys.stdin
+    try:
+        if args.command=='check':
+            sys.exit(1 if checkGames(lines)[2] else 0)
+        writeLines(lines,sys.stdout,args.plies)
+    finally:
+        if args.pgn:
+            lines.close()
+
+if __name__=="__main__":
+    main()
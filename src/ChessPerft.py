@@ -0,0 +1,145 @@
+"""
+Perft - counts every leaf node of the move tree to a fixed depth using getValidMoves/makeMove/undoMove
+    - Correctness: the counts of well known positions are published, so any difference means a move generation bug
+      (divide shows the count under each root move, to narrow down which one)
+    - Throughput: nodes/sec of the same run is the benchmark for any engine change
+    - Staged: the bitboard engine's search-side generation (getPseudoLegalMoves + isLegalMove, what the AI walks) is
+      counted too, so it is held to the same published numbers
+Usage (from the repo root):
+    python src/ChessPerft.py                       runs the regression suite on both engines
+    python src/ChessPerft.py --engine bitboard --position kiwipete --depth 3 --divide
+    python src/ChessPerft.py --engine bitboard --position kiwipete --staged
+"""
+
+import argparse
+import sys
+import time
+import ChessEngine
+import ChessBitboard
+
+ENGINES={'mailbox':ChessEngine.GameState,'bitboard':ChessBitboard.BitboardGameState}
+
+# name -> (FEN, published leaf counts for depth 1, 2, 3...)
+POSITIONS={
+    'start':('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',[20,400,8902,197281,4865609]),
+    # castling through/out of/into check, pins, enpassant and captures of castling rooks
+    'kiwipete':('r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',[48,2039,97862,4085603]),
+    # enpassant captures that expose the king along the rank, discovered checks
+    'endgame':('8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',[14,191,2812,43238,674624]),
+    'middlegame':('r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',[46,2079,89890,3894594]),
+    # promotions (and underpromotions) with captures, castling rights lost to captured rooks, checks
+    'promotion':('r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',[6,264,9467,422333]),
+    'promotion2':('rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',[44,1486,62379,2103487]),
+    # pawns pinned to a king in front of them - advancing along a file pin, enpassant along a diagonal pin
+    # (counts cross-checked against python-chess)
+    'filepin':('4k3/1K6/8/1P2PP2/2pp4/1r6/8/8 w - - 1 27',[11,191,1526,24185]),
+    'diagonalpin':('7k/2K5/8/3pP3/8/6b1/8/8 w - d6 0 1',[9,90,644,7617,51803]),
+}
+# depth each position is checked at by the suite - deep enough to catch regressions, shallow enough to run on every change
+SUITE_DEPTHS={'start':3,'kiwipete':3,'endgame':4,'middlegame':3,'promotion':3,'promotion2':3,'filepin':4,'diagonalpin':4}
+
+def perft(gamestate,depth):
+    """
+    Number of leaf nodes `depth` plies below the position
+    """
+    moves=gamestate.getValidMoves()
+    if depth==1:
+        return len(moves)  # leaves don't need to be made, just counted
+    nodes=0
+    for move in moves:
+        gamestate.makeMove(move)
+        nodes+=perft(gamestate,depth-1)
+        gamestate.undoMove()
+    return nodes
+
+def perftStaged(gamestate,depth):
+    """
+    perft through the search's move generation - pseudo-legal moves filtered by isLegalMove
+    """
+    nodes=0
+    for move in gamestate.getPseudoLegalMoves():
+        if not gamestate.isLegalMove(move):
+            continue
+        if depth==1:
+            nodes+=1
+        else:
+            gamestate.makeMove(move)
+            nodes+=perftStaged(gamestate,depth-1)
+            gamestate.undoMove()
+    return nodes
+
+def divide(gamestate,depth):
+    """
+    Perft split up by root move - returns a list of (move notation, leaf nodes)
+    """
+    results=[]
+    for move in gamestate.getValidMoves():
+        gamestate.makeMove(move)
+        results.append((move.getChessNotation(),perft(gamestate,depth-1) if depth>1 else 1))
+        gamestate.undoMove()
+    return results
+
+def runPerft(engine,fen,depth,expected=None,showDivide=False,staged=False):
+    """
+    Runs and reports one perft - returns True if the count matches `expected` (or nothing was expected)
+        - staged: count with perftStaged instead of getValidMoves
+    """
+    gamestate=engine.fromFen(fen)
+    startTime=time.perf_counter()
+    if showDivide:
+        results=divide(gamestate,depth)
+        for notation,count in results:
+            print("  "+notation+": "+str(count))
+        nodes=sum(count for notation,count in results)
+    else:
+        nodes=(perftStaged if staged else perft)(gamestate,depth)
+    elapsed=time.perf_counter()-startTime
+    passed=expected is None or nodes==expected
+    print("  depth "+str(depth)+": "+str(nodes)+" nodes"+
+          ("" if expected is None else " (expected "+str(expected)+") "+("ok" if passed else "FAIL"))+
+          ", "+format(elapsed,".2f")+"s, "+format(nodes/elapsed if elapsed else 0,".0f")+" nodes/sec")
+    return passed
+
+def runSuite(engineNames):
+    """
+    Checks every reference position at its suite depth on each engine (and its staged generation, if it has one) -
+    returns True if all counts match
+    """
+    passed=True
+    for engineName in engineNames:
+        for staged in (False,True) if hasattr(ENGINES[engineName],'getPseudoLegalMoves') else (False,):
+            for name,(fen,counts) in POSITIONS.items():
+                print(engineName+(" staged" if staged else "")+" - "+name)
+                passed=runPerft(ENGINES[engineName],fen,SUITE_DEPTHS[name],counts[SUITE_DEPTHS[name]-1],staged=staged) and passed
+    print("all counts match" if passed else "MISMATCHES FOUND")
+    return passed
+
+def main():
+    parser=argparse.ArgumentParser(description="Perft move generator correctness and throughput benchmark")
+    parser.add_argument('--engine',choices=sorted(ENGINES),help="engine to run (default: suite runs both)")
+    parser.add_argument('--position',choices=sorted(POSITIONS),help="reference position to run")
+    parser.add_argument('--fen',help="run an arbitrary position instead (no reference counts)")
+    parser.add_argument('--depth',type=int,help="depth to count to")
+    parser.add_argument('--divide',action='store_true',help="show the node count under each root move")
+    parser.add_argument('--staged',action='store_true',help="count with the search's staged generation (bitboard engine)")
+    args=parser.parse_args()
+
+    engineNames=[args.engine] if args.engine else sorted(ENGINES)
+    if args.position is None and args.fen is None:
+        sys.exit(0 if runSuite(engineNames) else 1)
+    if args.fen is not None:
+        fen,counts=args.fen,[]
+    else:
+        fen,counts=POSITIONS[args.position]
+    depth=args.depth if args.depth is not None else SUITE_DEPTHS.get(args.position,1)
+    if args.staged:
+        engineNames=[engineName for engineName in engineNames if hasattr(ENGINES[engineName],'getPseudoLegalMoves')]
+    passed=True
+    for engineName in engineNames:
+        print(engineName+(" staged" if args.staged else "")+" - "+(args.position or fen))
+        passed=runPerft(ENGINES[engineName],fen,depth,counts[depth-1] if depth<=len(counts) else None,args.divide,
+                        args.staged) and passed
+    sys.exit(0 if passed else 1)
+
+if __name__=="__main__":
+    main()
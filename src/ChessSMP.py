@@ -0,0 +1,187 @@
+"""
+Lazy SMP - parallel search across cores
+    - N processes search the same root position at the same time and share one transposition table in shared memory.
+      They don't split the work explicitly; what one process stores (scores, best moves, cutoffs) lets the others skip
+      or reorder that part of the tree
+    - Helpers are staggered (every other one starts an iteration deeper, each shuffles its root moves differently) so
+      they don't all walk the same tree in lockstep
+    - The main worker searches in the calling process under the normal time limit/depth and its move is returned;
+      helpers run until it finishes. A helper that dies is dropped, the search goes on with the others
+    - Used by ChessAnalyze --threads
+"""
+
+import os
+import queue
+import random
+import time
+from multiprocessing import Process, Queue, RawValue
+from multiprocessing.shared_memory import SharedMemory
+import ChessAI
+import ChessBitboard
+import ChessWorker
+
+RESULT_POLL_SECONDS=0.1  # how often the main worker checks that helpers it is waiting on are still alive
+
+class SharedTranspositionTable(ChessAI.TranspositionTable):
+    """
+    ChessAI.TranspositionTable stored in a shared memory block so every process of a parallel search uses the same entries
+        - Two 64-bit words per entry: (key xor data, data). Processes write without locks, so an entry torn by two
+          simultaneous writes just fails the key check on probe instead of returning a wrong result
+        - data packs moveID+1 (16 bits, moveIDs of promotions go up to 47777), depth (8), bound (2), generation (8) and score in tenths + 2^23 (24)
+    """
+    def __init__(self,sharedMemory,buckets=ChessAI.TT_BUCKETS):
+        self.mask=buckets-1
+        self.words=sharedMemory.buf.cast('Q')  # 4 words per bucket - depth-preferred entry then always-replace entry
+        self.generation=0
+        self.hits=0
+        self.misses=0
+        self.stores=0
+
+    @staticmethod
+    def sizeFor(buckets):
+        return buckets*4*8
+
+    def release(self):
+        self.words.release()  # shared memory can't be closed while a view of it exists
+
+    def probe(self,key):
+        words=self.words
+        index=(key&self.mask)*4
+        for slot in (index,index+2):
+            data=words[slot+1]
+            if data!=0 and words[slot]^data==key:
+                self.hits+=1
+                return (key,data>>16&0xFF,((data>>34)-(1<<23))/ChessAI.SCORE_SCALE,data>>24&0x3,
+                        (data&0xFFFF)-1 if data&0xFFFF else None,data>>26&0xFF)
+        self.misses+=1
+        return None
+
+    def store(self,key,depth,score,bound,bestMove):
+        words=self.words
+        index=(key&self.mask)*4
+        generation=self.generation&0xFF
+        data=((bestMove.moveID+1) if bestMove is not None else 0)|depth<<16|bound<<24|generation<<26| \
+             (round(score*ChessAI.SCORE_SCALE)+(1<<23))<<34
+        current=words[index+1]
+        if current==0 or words[index]^current==key or depth>=(current>>16&0xFF) or (current>>26&0xFF)!=generation:
+            slot=index
+        else:
+            slot=index+2
+        words[slot]=key^data
+        words[slot+1]=data
+        self.stores+=1
+
+class ParallelSearcher():
+    """
+    Pool of helper processes plus the shared transposition table - kept alive between searches like ChessWorker.SearchWorker
+    """
+    def __init__(self,workers=None,buckets=ChessAI.TT_BUCKETS):
+        self.workers=workers if workers is not None else os.cpu_count()  # total including the main worker
+        self.buckets=buckets
+        self.sharedMemory=SharedMemory(create=True,size=SharedTranspositionTable.sizeFor(buckets))
+        self.transpositionTable=SharedTranspositionTable(self.sharedMemory,buckets)
+        self.searchID=0
+        self.stopID=RawValue('l',0)  # helpers stop searching once this reaches their search's id
+        self.resultQueue=Queue()
+        self.helpers=[]  # (index, process, request queue) of the helpers still alive
+        for index in range(1,self.workers):
+            requestQueue=Queue()
+            process=Process(target=helperLoop,args=(index,requestQueue,self.resultQueue,self.sharedMemory,buckets,self.stopID),
+                            daemon=True)
+            process.start()
+            self.helpers.append((index,process,requestQueue))
+
+    def search(self,gamestate,timeLimit=None,startFen=None):
+        """
+        Searches the position reached by gamestate.moveLog on every worker
+            - startFen: position the move log starts from, None for the starting position
+            - returns (best move, stats) where stats has the total node counts (as SearchStats counts them), time and per
+              worker nodes/depth reached
+        """
+        self.searchID+=1
+        # searchBestMove's newSearch() bumps the main worker's generation once - helpers are sent that value so every
+        # worker stores under the same generation and doesn't take the others' entries for stale ones
+        generation=self.transpositionTable.generation+1
+        moveIDs=[move.moveID for move in gamestate.moveLog]
+        for index,process,requestQueue in self.helpers:
+            requestQueue.put(('search',self.searchID,startFen,moveIDs,generation))
+        startTime=time.perf_counter()
+        mainTable=ChessAI.transpositionTable
+        ChessAI.transpositionTable=self.transpositionTable
+        try:
+            bestMove=ChessAI.searchBestMove(gamestate,gamestate.getValidMoves(),timeLimit)
+        finally:
+            ChessAI.transpositionTable=mainTable
+            self.stopID.value=self.searchID
+        stats=ChessAI.searchStats
+        workerStats=[{'worker':0,'nodes':stats.nodes,'quiescenceNodes':stats.quiescenceNodes,'depth':stats.depth}]
+        waiting={index for index,process,requestQueue in self.helpers}
+        while waiting:
+            try:
+                searchID,index,nodes,quiescenceNodes,depth=self.resultQueue.get(timeout=RESULT_POLL_SECONDS)
+            except queue.Empty:
+                for index,process,requestQueue in self.helpers:
+                    if index in waiting and not process.is_alive():  # died without reporting - don't wait for it forever
+                        waiting.discard(index)
+                        workerStats.append({'worker':index,'nodes':0,'quiescenceNodes':0,'depth':0,
+                                            'error':"helper process died"})
+                self.helpers=[helper for helper in self.helpers if helper[1].is_alive()]
+                continue
+            if searchID==self.searchID and index in waiting:
+                waiting.discard(index)
+                workerStats.append({'worker':index,'nodes':nodes,'quiescenceNodes':quiescenceNodes,'depth':depth})
+        workerStats.sort(key=lambda stats: stats['worker'])
+        elapsed=time.perf_counter()-startTime
+        nodes=sum(stats['nodes'] for stats in workerStats)
+        quiescenceNodes=sum(stats['quiescenceNodes'] for stats in workerStats)
+        return bestMove,{'nodes':nodes,'quiescenceNodes':quiescenceNodes,'time':elapsed,
+                         'nodesPerSecond':(nodes+quiescenceNodes)/elapsed if elapsed else 0.0,'workers':workerStats}
+
+    def close(self):
+        self.stopID.value=self.searchID
+        for index,process,requestQueue in self.helpers:
+            requestQueue.put(('stop',))
+        for index,process,requestQueue in self.helpers:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+        self.transpositionTable.release()
+        self.sharedMemory.close()
+        self.sharedMemory.unlink()
+
+def helperLoop(index,requestQueue,resultQueue,sharedMemory,buckets,stopID):
+    """
+    Helper process - searches every requested position with no time limit until the main worker is done with it
+    """
+    ChessAI.transpositionTable=SharedTranspositionTable(sharedMemory,buckets)
+    random.seed(index)  # forked helpers would otherwise all shuffle their root moves the same way
+    gamestate=None  # built on the first request
+    currentFen=None  # position gamestate's move log starts from
+    while True:
+        request=requestQueue.get()
+        if request[0]=='stop':
+            break
+        _,searchID,startFen,moveIDs,generation=request
+        try:
+            if gamestate is None or startFen!=currentFen:
+                gamestate=ChessBitboard.BitboardGameState.fromFen(startFen) if startFen is not None else ChessBitboard.BitboardGameState()
+                currentFen=startFen
+            ChessWorker.syncPosition(gamestate,moveIDs)
+        except ValueError:  # can't follow the main worker this time - report nothing searched rather than die
+            resultQueue.put((searchID,index,0,0,0))
+            continue
+        ChessAI.stopSearch=lambda: stopID.value>=searchID
+        validMoves=gamestate.getValidMoves()
+        if len(validMoves)!=0 and stopID.value<searchID:
+            ChessAI.transpositionTable.generation=generation-1  # searchBestMove's newSearch() brings it to the main worker's
+            try:
+                ChessAI.searchBestMove(gamestate,validMoves,timeLimit=float('inf'),firstDepth=1+index%2)
+            except Exception:  # same as above - the main worker would otherwise wait for this helper until it is seen dead
+                resultQueue.put((searchID,index,0,0,0))
+                gamestate=None  # may be left mid-search, the next request rebuilds it
+                continue
+            stats=ChessAI.searchStats
+            resultQueue.put((searchID,index,stats.nodes,stats.quiescenceNodes,stats.depth))
+        else:
+            resultQueue.put((searchID,index,0,0,0))
+    ChessAI.transpositionTable.release()
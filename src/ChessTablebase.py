@@ -0,0 +1,353 @@
+"""
+Endgame tablebases - perfect play for positions with few pieces, worked out ahead of time by retrograde analysis
+    - One table per material balance (ie. KQvK, KRvKB), named with white's pieces first. Positions with the colors
+      reversed (KvKQ) are looked up in the same table with the board flipped
+    - One byte per position, indexed by side to move and the square of every piece (white king, black king, then the
+      rest in name order): 0 is a draw (or an impossible position), otherwise distance to mate in plies + 1 - odd
+      distances are wins for the side to move, even ones losses (0 plies = checkmated)
+    - Tables are memory-mapped, so a probe is one index calculation and one byte read
+    - Castling and enpassant are not part of the tables, positions where either is possible aren't probed (an
+      enpassant square only counts when a capture onto it is, as for the zobrist key - see GameState.getEnpassantKey)
+Usage (from the repo root):
+    python src/ChessTablebase.py generate KQvK KRvK KPvK      (3 pieces take a minute or two each, 4 pieces hours)
+    python src/ChessTablebase.py probe "8/8/8/4k3/8/8/8/4K2Q w - - 0 1"
+"""
+
+import argparse
+import mmap
+import os
+import time
+from array import array
+from ChessBitboard import KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, bishopAttacks, rookAttacks, queenAttacks, squares
+import ChessEngine
+
+TABLEBASE_DIR=os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir,'tablebases')
+MAX_PIECES=4
+PIECE_ORDER='KQRBNP'  # order pieces are named (and indexed) in
+DRAWN_MATERIAL=('KvK','KBvK','KNvK')  # neither side can ever mate, no table needed
+PROMOTION_PIECES=('Q','R','B','N')
+
+def getMaterial(pieces):
+    """
+    Table name of a list of pieces (ie. ['wK','bK','wQ'] -> 'KQvK')
+    """
+    white=''.join(sorted((piece[1].upper() for piece in pieces if piece[0]=='w'),key=PIECE_ORDER.index))
+    black=''.join(sorted((piece[1].upper() for piece in pieces if piece[0]=='b'),key=PIECE_ORDER.index))
+    return white+'v'+black
+
+def getTablePieces(material):
+    """
+    Pieces of a table in index order - white king, black king, then the others as named (ie. 'KQvKR' -> wK bK wQ bR)
+    """
+    white,black=material.split('v')
+    return ['wK','bK']+['w'+(char if char!='P' else 'p') for char in white[1:]]+['b'+(char if char!='P' else 'p') for char in black[1:]]
+
+def flipSquare(sq):
+    return (7-sq//8)*8+sq%8  # mirror top to bottom
+
+def attacksFrom(piece,sq,occupied):
+    """
+    Bitboard of the squares `piece` on `sq` attacks
+    """
+    pieceType=piece[1]
+    if pieceType=='N':
+        return KNIGHT_ATTACKS[sq]
+    if pieceType=='K':
+        return KING_ATTACKS[sq]
+    if pieceType=='p':
+        return PAWN_ATTACKS[piece[0]][sq]
+    if pieceType=='B':
+        return bishopAttacks(sq,occupied)
+    if pieceType=='R':
+        return rookAttacks(sq,occupied)
+    return queenAttacks(sq,occupied)
+
+def isAttacked(sq,byColor,pieces,placement,occupied,skip=-1):
+    """
+    Determine if pieces of `byColor` (except the one at index `skip`, ie. just captured) attack `sq`
+    """
+    for i in range(len(pieces)):
+        if i!=skip and pieces[i][0]==byColor and attacksFrom(pieces[i],placement[i],occupied)>>sq&1:
+            return True
+    return False
+
+class Tablebases():
+    """
+    The tables found in a directory, each mapped the first time it is needed
+    """
+    def __init__(self,directory=TABLEBASE_DIR):
+        self.directory=directory
+        self.tables={}  # material -> mapped table, or None when there is no file for it
+
+    def getTable(self,material):
+        if material not in self.tables:
+            path=os.path.join(self.directory,material+'.tb')
+            if os.path.exists(path):
+                with open(path,'rb') as file:
+                    self.tables[material]=mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ)
+            else:
+                self.tables[material]=None
+        return self.tables[material]
+
+    def probePieces(self,pieces,placement,whiteToMove):
+        """
+        Result for the side to move as (1 win/0 draw/-1 loss, plies to mate), None when there is no table for the material
+        """
+        material=getMaterial(pieces)
+        white,black=material.split('v')
+        if material in DRAWN_MATERIAL or black+'v'+white in DRAWN_MATERIAL:
+            return (0,0)
+        table=self.getTable(material)
+        if table is None:  # try it with the colors reversed
+            table=self.getTable(black+'v'+white)
+            if table is None:
+                return None
+            pieces=[('b' if piece[0]=='w' else 'w')+piece[1] for piece in pieces]
+            placement=[flipSquare(sq) for sq in placement]
+            whiteToMove=not whiteToMove
+            material=black+'v'+white
+        value=table[getIndex(material,pieces,placement,whiteToMove)]
+        if value==0:
+            return (0,0)
+        plies=value-1
+        return (1 if plies%2==1 else -1,plies)
+
+    def probe(self,gamestate):
+        """
+        Result of a game's position (see probePieces), None when it has too many pieces, castling/enpassant is possible
+        or there is no table for it
+        """
+        rights=gamestate.currentCastlingRights
+        if gamestate.getEnpassantKey()!=0 or rights.wK_side or rights.wQ_side or rights.bK_side or rights.bQ_side:
+            return None
+        pieces=[]
+        placement=[]
+        for row in range(8):
+            for col in range(8):
+                piece=gamestate.board[row][col]
+                if piece!='--':
+                    if len(pieces)==MAX_PIECES:
+                        return None
+                    pieces.append(piece)
+                    placement.append(row*8+col)
+        return self.probePieces(pieces,placement,gamestate.whiteToMove)
+
+def getIndex(material,pieces,placement,whiteToMove):
+    """
+    Index of a position in its table - pieces/placement can be in any order, they are matched to the table's piece order
+    """
+    index=0 if whiteToMove else 1
+    used=[False]*len(pieces)
+    for tablePiece in getTablePieces(material):
+        for i in range(len(pieces)):
+            if not used[i] and pieces[i]==tablePiece:
+                used[i]=True
+                index=index*64+placement[i]
+                break
+    return index
+
+def generate(material,tablebases,directory=TABLEBASE_DIR):
+    """
+    Builds the table for `material` by retrograde analysis and writes it to the directory
+        1) every legal position: count the moves staying in this table, score the moves that leave it (captures and
+           promotions) from the smaller tables, which must already exist, and find checkmates/stalemates
+        2) from the mates outward, ply by ply: a position with a move into a lost position is won one ply later, and a
+           position whose moves all lead to won positions is lost (as late as possible)
+        3) what is left undecided is a draw
+    """
+    pieces=getTablePieces(material)
+    count=len(pieces)
+    size=2*64**count
+    colors=[piece[0] for piece in pieces]
+    legal=bytearray(size)
+    movesLeft=array('B',bytes(size))  # moves within the table not yet known to lose
+    latestLoss=array('B',bytes(size))  # longest (plies) of the opponent's wins found so far, the loss is that + 1
+    hasDraw=bytearray(size)  # some move leaving the table draws, so the position can't be lost
+    values=bytearray(size)
+    buckets={}  # plies -> [(index, True if won)] still to be decided at that distance
+
+    def decode(index):
+        placement=[0]*count
+        for i in range(count-1,-1,-1):
+            index,placement[i]=divmod(index,64)
+        return placement,index==0  # index is left holding the side to move
+
+    def encode(placement,whiteToMove):
+        index=0 if whiteToMove else 1
+        for sq in placement:
+            index=index*64+sq
+        return index
+
+    # legal positions - no two pieces on a square, no pawns on the first/last row, side not to move isn't in check
+    for index in range(size):
+        placement,whiteToMove=decode(index)
+        occupied=0
+        for i in range(count):
+            occupied|=1<<placement[i]
+            if pieces[i][1]=='p' and not 8<=placement[i]<56:
+                break
+        else:
+            if bin(occupied).count('1')==count:
+                idle=1 if whiteToMove else 0  # king of the side not to move
+                if not isAttacked(placement[idle],'w' if whiteToMove else 'b',pieces,placement,occupied):
+                    legal[index]=1
+
+    # 1) forward pass
+    for index in range(size):
+        if not legal[index]:
+            continue
+        placement,whiteToMove=decode(index)
+        allyColor,enemyColor=('w','b') if whiteToMove else ('b','w')
+        kingIndex=0 if whiteToMove else 1
+        occupied=0
+        allies=0
+        for i in range(count):
+            occupied|=1<<placement[i]
+            if colors[i]==allyColor:
+                allies|=1<<placement[i]
+        legalMoves=0
+        exitWin=0
+        for i in range(count):
+            if colors[i]!=allyColor:
+                continue
+            piece=pieces[i]
+            sq=placement[i]
+            if piece[1]=='p':
+                step=-8 if allyColor=='w' else 8
+                targets=PAWN_ATTACKS[allyColor][sq]&occupied&~allies
+                if not occupied>>(sq+step)&1:
+                    targets|=1<<(sq+step)
+                    if (sq//8==6 and allyColor=='w') or (sq//8==1 and allyColor=='b'):
+                        if not occupied>>(sq+2*step)&1:
+                            targets|=1<<(sq+2*step)
+            else:
+                targets=attacksFrom(piece,sq,occupied)&~allies
+            for end in squares(targets):
+                captured=-1
+                for j in range(count):
+                    if placement[j]==end:
+                        captured=j
+                newPlacement=placement[:]
+                newPlacement[i]=end
+                newOccupied=(occupied^(1<<sq))|(1<<end)
+                kingSq=end if i==kingIndex else placement[kingIndex]
+                if isAttacked(kingSq,enemyColor,pieces,newPlacement,newOccupied,captured):
+                    continue
+                legalMoves+=1
+                promotes=piece[1]=='p' and (end<8 or end>=56)
+                if captured==-1 and not promotes:
+                    movesLeft[index]+=1
+                    continue
+                # leaves the table - look the result up in the smaller table
+                for promotionPiece in (PROMOTION_PIECES if promotes else (None,)):
+                    subPieces=[(allyColor+promotionPiece if j==i and promotionPiece else pieces[j]) for j in range(count) if j!=captured]
+                    subPlacement=[newPlacement[j] for j in range(count) if j!=captured]
+                    result=tablebases.probePieces(subPieces,subPlacement,not whiteToMove)
+                    if result is None:
+                        raise ValueError("Generate "+getMaterial(subPieces)+" before "+material)
+                    if result[0]==0:
+                        hasDraw[index]=1
+                    elif result[0]<0:  # opponent loses
+                        exitWin=result[1]+1 if exitWin==0 else min(exitWin,result[1]+1)
+                    else:
+                        latestLoss[index]=max(latestLoss[index],result[1])
+                if promotes:
+                    legalMoves+=len(PROMOTION_PIECES)-1
+        if legalMoves==0:
+            kingSq=placement[kingIndex]
+            if isAttacked(kingSq,enemyColor,pieces,placement,occupied):
+                buckets.setdefault(0,[]).append((index,False))  # checkmated
+            else:
+                hasDraw[index]=1  # stalemate
+                values[index]=0
+        elif exitWin:
+            buckets.setdefault(exitWin,[]).append((index,True))
+        elif movesLeft[index]==0 and not hasDraw[index]:  # every move leaves the table and loses
+            buckets.setdefault(latestLoss[index]+1,[]).append((index,False))
+
+    # 2) retrograde passes, shortest distance first
+    decided=bytearray(size)
+    plies=0
+    while buckets:
+        for index,won in buckets.pop(plies,()):
+            if decided[index]:
+                continue
+            decided[index]=1
+            values[index]=plies+1
+            placement,whiteToMove=decode(index)
+            # positions before this one - the side that just moved (not to move here) un-moves a piece, without
+            # un-capturing or un-promoting (those positions belong to other tables)
+            moverColor='b' if whiteToMove else 'w'
+            occupied=0
+            for sq in placement:
+                occupied|=1<<sq
+            for i in range(count):
+                if colors[i]!=moverColor:
+                    continue
+                piece=pieces[i]
+                sq=placement[i]
+                if piece[1]=='p':
+                    step=8 if moverColor=='w' else -8  # backwards
+                    starts=0
+                    if 8<=sq+step<56 and not occupied>>(sq+step)&1:
+                        starts|=1<<(sq+step)
+                        if ((moverColor=='w' and sq//8==4) or (moverColor=='b' and sq//8==3)) and not occupied>>(sq+2*step)&1:
+                            starts|=1<<(sq+2*step)
+                else:
+                    starts=attacksFrom(piece,sq,occupied)&~occupied
+                for start in squares(starts):
+                    previousPlacement=placement[:]
+                    previousPlacement[i]=start
+                    previous=encode(previousPlacement,not whiteToMove)
+                    if not legal[previous] or decided[previous]:
+                        continue
+                    if not won:  # moving into a lost position wins
+                        buckets.setdefault(plies+1,[]).append((previous,True))
+                    else:
+                        movesLeft[previous]-=1
+                        latestLoss[previous]=max(latestLoss[previous],plies)
+                        if movesLeft[previous]==0 and not hasDraw[previous]:
+                            buckets.setdefault(latestLoss[previous]+1,[]).append((previous,False))
+        plies+=1
+
+    # 3) undecided positions stay 0 - draws
+    os.makedirs(directory,exist_ok=True)
+    with open(os.path.join(directory,material+'.tb'),'wb') as file:
+        file.write(values)
+    tablebases.tables.pop(material,None)  # map the new file next time it is needed
+
+def main():
+    parser=argparse.ArgumentParser(description="Generate or probe endgame tablebases")
+    subparsers=parser.add_subparsers(dest='command',required=True)
+    generateParser=subparsers.add_parser('generate',help="generate tables, smaller ones first (ie. KQvK before KQvKR)")
+    generateParser.add_argument('materials',nargs='+')
+    probeParser=subparsers.add_parser('probe',help="look up a position and its moves")
+    probeParser.add_argument('fen')
+    parser.add_argument('--directory',default=TABLEBASE_DIR)
+    args=parser.parse_args()
+
+    tablebases=Tablebases(args.directory)
+    if args.command=='generate':
+        for material in args.materials:
+            if len(getTablePieces(material))>MAX_PIECES:
+                parser.error(material+" has more than "+str(MAX_PIECES)+" pieces")
+            startTime=time.perf_counter()
+            generate(material,tablebases,args.directory)
+            print(material+" generated in "+format(time.perf_counter()-startTime,".1f")+"s")
+    else:
+        gamestate=ChessEngine.GameState.fromFen(args.fen)
+        print("position:",describe(tablebases.probe(gamestate)))
+        for move in gamestate.getValidMoves():
+            gamestate.makeMove(move)
+            print(move.getChessNotation(),describe(tablebases.probe(gamestate)))
+            gamestate.undoMove()
+
+def describe(result):
+    if result is None:
+        return "not in the tablebases"
+    if result[0]==0:
+        return "draw"
+    return ("win" if result[0]>0 else "loss")+" in "+str(result[1])+" plies"
+
+if __name__=="__main__":
+    main()
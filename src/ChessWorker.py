@@ -0,0 +1,110 @@
+"""
+Long-lived AI search worker - one process that stays alive for the whole game instead of a new process per AI move
+    - Only the game's moves are sent (as moveIDs), never a pickled GameState. The worker keeps its own position and
+      replays/undoes just the moves that changed since the last search
+    - Because the process lives on, ChessAI's transposition table and history scores carry over from move to move
+    - A search can be cancelled (undo/reset) without killing the process
+    - A search that fails (ie. the position can't be synced) is reported as a result with an 'error' instead of a
+      move, and a worker process that died is reported by poll, so the game never waits on a search that won't finish
+"""
+
+from multiprocessing import Process, Queue, RawValue
+import queue
+import ChessAI
+import ChessBitboard
+
+class SearchWorker():
+    """
+    Main process side of the worker - start a search, poll for its result, cancel it
+    """
+    def __init__(self,timeLimit=None):
+        self.timeLimit=timeLimit  # ms per search, None uses ChessAI's defaults
+        self.requestQueue=Queue()
+        self.resultQueue=Queue()
+        self.searchID=0  # id of the latest search requested, results of any other search are stale
+        self.cancelledID=RawValue('l',0)  # searches with an id <= this stop as soon as possible (shared memory, lock free reads)
+        self.process=Process(target=workerLoop,args=(self.requestQueue,self.resultQueue,self.cancelledID),daemon=True)
+        self.process.start()
+
+    def startSearch(self,moveLog,timeLimit=None):
+        """
+        Starts searching the position reached by playing `moveLog` from the starting position
+        """
+        self.searchID+=1
+        self.requestQueue.put(('search',self.searchID,[move.moveID for move in moveLog],
+                               timeLimit if timeLimit is not None else self.timeLimit))
+
+    def poll(self):
+        """
+        Non-blocking check for the result of the latest search - returns (done, moveID of the best move or None, its
+        ChessAI.SearchStats as a dict or None)
+            - if the search failed or the worker died the stats are {'error': reason} and the moveID is None
+        """
+        while True:
+            try:
+                searchID,moveID,stats=self.resultQueue.get_nowait()
+            except queue.Empty:
+                if not self.process.is_alive():
+                    return True,None,{'error':"search worker died (exit code "+str(self.process.exitcode)+")"}
+                return False,None,None
+            if searchID==self.searchID:
+                return True,moveID,stats
+            # otherwise it is the result of a cancelled search, keep draining
+
+    def cancel(self):
+        """
+        Stops the latest search - the worker stays alive (with its caches) for the next one
+        """
+        self.cancelledID.value=self.searchID
+
+    def close(self):
+        self.cancel()
+        self.requestQueue.put(('stop',))
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+def workerLoop(requestQueue,resultQueue,cancelledID):
+    """
+    Worker process side - serves search requests until told to stop
+    """
+    gamestate=ChessBitboard.BitboardGameState()
+    while True:
+        request=requestQueue.get()
+        if request[0]=='stop':
+            break
+        _,searchID,moveIDs,timeLimit=request
+        if cancelledID.value>=searchID:  # cancelled before it even started
+            resultQueue.put((searchID,None,None))
+            continue
+        try:
+            syncPosition(gamestate,moveIDs)
+            ChessAI.stopSearch=lambda: cancelledID.value>=searchID
+            validMoves=gamestate.getValidMoves()
+            if len(validMoves)==0:
+                resultQueue.put((searchID,None,None))
+                continue
+            bestMove=ChessAI.searchBestMove(gamestate,validMoves,timeLimit)
+        except Exception as error:  # report it rather than die - the main process would wait for this result forever
+            resultQueue.put((searchID,None,{'error':type(error).__name__+": "+str(error)}))
+            gamestate=ChessBitboard.BitboardGameState()  # position may be half synced, the next search replays from the start
+            continue
+        resultQueue.put((searchID,bestMove.moveID if bestMove is not None else None,ChessAI.searchStats.asDict()))
+
+def syncPosition(gamestate,moveIDs):
+    """
+    Brings the worker's position in line with the game's move list - undoes back to the last move both agree on, then
+    plays the rest (so a normal AI turn costs one or two moves, not a replay of the game)
+    """
+    common=0
+    while common<len(gamestate.moveLog) and common<len(moveIDs) and gamestate.moveLog[common].moveID==moveIDs[common]:
+        common+=1
+    while len(gamestate.moveLog)>common:
+        gamestate.undoMove()
+    for moveID in moveIDs[common:]:
+        for move in gamestate.getValidMoves():
+            if move.moveID==moveID:
+                gamestate.makeMove(move)
+                break
+        else:
+            raise ValueError("Move "+str(moveID)+" is not valid in the worker's position")
@@ -0,0 +1,25 @@
+import ChessAI
+import ChessEngine
+
+ChessAI.VERBOSE=False
+
+def test_searchReturnsMoveWhenEveryMoveIsMated():
+    gamestate=ChessEngine.GameState.fromFen('7k/p2p3P/P2P4/2n5/8/2p5/4r2p/1K6 w - - 1 91')
+    validMoves=gamestate.getValidMoves()
+    move=ChessAI.searchBestMove(gamestate,validMoves[:])
+    assert move is not None
+    assert move.moveID in [validMove.moveID for validMove in validMoves]
+
+def test_repetitionOnTheLastPlyIsScoredAsADraw(monkeypatch):
+    monkeypatch.setattr(ChessAI,'USE_BOOK',False)
+    monkeypatch.setattr(ChessAI,'USE_TABLEBASES',False)
+    monkeypatch.setattr(ChessAI,'TIME_LIMIT',None)
+    monkeypatch.setattr(ChessAI,'DEPTH',1)
+    # a queen and a rook down - the only move that doesn't lose is Kg1, repeating the position after the first Kg1,
+    # and with depth 1 that repeat is on the horizon
+    gamestate=ChessEngine.GameState.fromFen('k7/r7/q7/8/8/8/8/7K w - - 0 1')
+    for notation in ['h1g1','a7b7','g1h1','b7a7']:
+        gamestate.makeMove(next(move for move in gamestate.getValidMoves() if move.getChessNotation()==notation))
+    move=ChessAI.searchBestMove(gamestate,gamestate.getValidMoves())
+    assert move.getChessNotation()=='h1g1'
+    assert ChessAI.searchStats.score==ChessAI.STALEMATE
@@ -0,0 +1,23 @@
+import ChessAnalyze
+
+START='rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq -'
+
+def test_parsePositionWithCountersAndOperations():
+    fen,operations=ChessAnalyze.parsePosition(START+' 0 1 bm e4; id "start";')
+    assert fen==START+' 0 1'
+    assert operations=={'bm':'e4','id':'start'}
+
+def test_parsePositionPlainFenAndEpd():
+    assert ChessAnalyze.parsePosition(START+' 3 12')==(START+' 3 12',{})
+    assert ChessAnalyze.parsePosition(START+' bm e4;')==(START,{'bm':'e4'})
+
+def test_badPositionsBecomeErrorRecords():
+    ChessAnalyze.initWorker(1)
+    for line in ('8/8/8/8/8/8/8/8 w - - 0 1','4k3/8/8/8/8/8/8/4K3 x - - 0 1','not a fen'):
+        result=ChessAnalyze.analysePosition((1,line,None))
+        assert 'error' in result and 'bestMove' not in result
+
+def test_matedEverywherePositionStillGetsAMove():
+    ChessAnalyze.initWorker(2)
+    result=ChessAnalyze.analysePosition((1,'7k/p2p3P/P2P4/2n5/8/2p5/4r2p/1K6 w - - 1 91',None))
+    assert result['bestMove'] in ('b1a1','b1c1')
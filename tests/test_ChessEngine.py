@@ -0,0 +1,43 @@
+import pytest
+import ChessBitboard
+import ChessEngine
+
+ENGINES=[ChessEngine.GameState,ChessBitboard.BitboardGameState]
+
+def playMoves(gamestate,notations):
+    for notation in notations:
+        gamestate.makeMove(next(move for move in gamestate.getValidMoves() if move.getChessNotation()==notation))
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_doublePushNothingCanTakeStillRepeats(engine):
+    # after 1.e4 no black pawn can take on e3, so the knights coming back reach the same position (not one with an
+    # enpassant square of its own) for the second and third time
+    gamestate=engine()
+    playMoves(gamestate,['e2e4'])
+    afterDoublePush=gamestate.zobristKey
+    playMoves(gamestate,['g8f6','g1f3','f6g8','f3g1'])
+    assert gamestate.zobristKey==afterDoublePush
+    assert gamestate.getDrawReason() is None
+    playMoves(gamestate,['g8f6','g1f3','f6g8','f3g1'])
+    assert gamestate.getDrawReason()=='threefold repetition'
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_enpassantSquareCountsOnlyWhenCaptureIsLegal(engine):
+    capturable=engine.fromFen('4k3/8/8/2Pp4/8/8/8/4K3 w - d6 0 1')
+    assert capturable.zobristKey!=engine.fromFen('4k3/8/8/2Pp4/8/8/8/4K3 w - - 0 1').zobristKey
+    pinned=engine.fromFen('4k3/8/8/K1Pp3r/8/8/8/8 w - d6 0 1')  # cxd6 would leave the king to the rook
+    assert pinned.zobristKey==engine.fromFen('4k3/8/8/K1Pp3r/8/8/8/8 w - - 0 1').zobristKey
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_pawnPinnedAlongItsFileCanAdvance(engine):
+    # the rook on b3 pins the b5 pawn to the king on b7 from behind - b5b6 stays on the line
+    gamestate=engine.fromFen('4k3/1K6/8/1P2PP2/2pp4/1r6/8/8 w - - 1 27')
+    assert 'b5b6' in [move.getChessNotation() for move in gamestate.getValidMoves()]
+
+def test_pawnPinnedOnADiagonalCanTakeEnpassantTowardItsKing():
+    # the bishop on g3 pins the e5 pawn to the king on c7 - exd6 stays on the diagonal, both cores must generate it
+    fen='7k/2K5/8/3pP3/8/6b1/8/8 w - d6 0 1'
+    mailboxMoves=sorted(move.getChessNotation() for move in ChessEngine.GameState.fromFen(fen).getValidMoves())
+    bitboardMoves=sorted(move.getChessNotation() for move in ChessBitboard.BitboardGameState.fromFen(fen).getValidMoves())
+    assert mailboxMoves==bitboardMoves
+    assert 'e5d6' in mailboxMoves
@@ -0,0 +1,53 @@
+import io
+import ChessEngine
+import ChessIndex
+
+PGN_TEXT=b'''[Event "Open game"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 1-0
+
+[Event "Transposed"]
+[Result "0-1"]
+
+1. Nf3 Nc6 2. e4 e5 0-1
+
+[Event "Sicilian"]
+[Result "1/2-1/2"]
+
+1. e4 c5 1/2-1/2
+
+[Event "Bad first move"]
+[FEN "4k3/8/8/8/8/8/8/4K2R w K - 0 1"]
+[Result "1-0"]
+
+1. Rh9 1-0
+'''
+
+def positionAfter(notations,fen=None):
+    gamestate=ChessEngine.GameState.fromFen(fen) if fen else ChessEngine.GameState()
+    for notation in notations:
+        gamestate.makeMove(next(move for move in gamestate.getValidMoves() if move.getChessNotation()==notation))
+    return gamestate
+
+def test_buildAndQuery(tmp_path):
+    pgnFile=io.BytesIO(PGN_TEXT)
+    path=str(tmp_path/'games.idx')
+    games,positions,errors=ChessIndex.buildIndex(pgnFile,path)
+    assert (games,errors)==(4,1)
+    index=ChessIndex.PositionIndex(path)
+    try:
+        assert index.getStats(positionAfter([]))==(3,1,1,1)
+        assert index.getStats(positionAfter(['e2e4']))==(2,1,1,0)
+        transposition=positionAfter(['e2e4','e7e5','g1f3','b8c6'])
+        assert index.getStats(transposition)==(2,1,0,1)  # reached by the first two games in different orders
+        assert index.getStats(positionAfter(['e2e4','c7c5','g1f3']))==(0,0,0,0)
+        # the game whose first move can't be decoded still has its starting position indexed
+        assert index.getStats(positionAfter([],'4k3/8/8/8/8/8/8/4K2R w K - 0 1'))==(1,1,0,0)
+        found=list(index.getGames(transposition))
+        assert [gameNumber for gameNumber,offset in found]==[0,1]
+        events=[ChessIndex.readGame(pgnFile,offset).tags['Event'] for gameNumber,offset in found]
+        assert events==['Open game','Transposed']
+        assert list(index.getGames(transposition,limit=1))==found[:1]
+    finally:
+        index.close()
@@ -0,0 +1,20 @@
+import ChessAI
+import ChessBitboard
+import ChessMatch
+
+def test_killerMovesCoverAnEngineDeeperThanTheDefault(monkeypatch):
+    for setting in ('VERBOSE','USE_BOOK','DEPTH','MAX_DEPTH','TIME_LIMIT','killerMoves','transpositionTable',
+                    'historyScores'):
+        monkeypatch.setattr(ChessAI,setting,getattr(ChessAI,setting))  # put back after ChessMatch changes them
+    monkeypatch.setattr(ChessMatch,'engines',None)
+    monkeypatch.setattr(ChessMatch,'defaults',None)
+    deepest=len(ChessAI.killerMoves)+10
+    ChessMatch.initWorker([('deep',{'MAX_DEPTH':deepest,'TIME_LIMIT':1}),('default',{})])
+    searchState=[None,None]
+    ChessMatch.applyEngine(0,searchState)
+    assert len(ChessAI.killerMoves)>deepest
+    ChessMatch.applyEngine(1,searchState)  # a shallower engine doesn't shrink them again
+    assert len(ChessAI.killerMoves)>deepest
+    ChessMatch.applyEngine(0,searchState)
+    gamestate=ChessBitboard.BitboardGameState()
+    assert ChessAI.searchBestMove(gamestate,gamestate.getValidMoves()) is not None
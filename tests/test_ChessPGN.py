@@ -0,0 +1,90 @@
+import pytest
+import ChessBitboard
+import ChessEngine
+import ChessPGN
+
+ENGINES=[ChessEngine.GameState,ChessBitboard.BitboardGameState]
+
+PGN_TEXT='''% produced by a test, this line is escaped
+[Event "Comments and variations"]
+[White "Müller, Jürgen"]
+[Black "Test"]
+[Result "1-0"]
+
+1. e4 {a comment that runs
+[Event "not a tag, still the comment"]
+on for three lines} e5 (1... c5 2. Nf3 (2. c3 d5 (2... Nf6)) 2... d6) 2. Bc4 $1 Nc6 ; rest of line (ignored
+% escaped line inside the movetext
+3. Qh5 Nf6?? 4. Qxf7# 1-0
+
+[Event "Second game"]
+[Result "1/2-1/2"]
+
+1.d4 d5 2.c4 e6 {étude} 1/2-1/2
+[Event "No result token"]
+
+1. Nf3 Nf6
+'''
+
+def getMove(gamestate,notation):
+    return next(move for move in gamestate.getValidMoves() if move.getChessNotation()==notation)
+
+@pytest.mark.parametrize('engine',ENGINES)
+@pytest.mark.parametrize('fen,notation,san',[
+    ('4k3/8/8/8/8/8/8/1N1K1N2 w - - 0 1','b1d2','Nbd2'),  # file
+    ('4k3/8/8/R7/8/8/8/R3K3 w - - 0 1','a1a3','R1a3'),  # rank
+    ('4k3/8/8/8/8/Q7/8/Q1Q1K3 w - - 0 1','a1b2','Qa1b2'),  # both
+    ('4k3/8/8/8/8/8/3N1N2/4K3 w - - 0 1','d2f3','Nf3'),  # the other knight can't reach f3
+])
+def test_sanDisambiguation(engine,fen,notation,san):
+    gamestate=engine.fromFen(fen)
+    assert ChessPGN.getSan(gamestate,getMove(gamestate,notation))==san
+
+@pytest.mark.parametrize('engine',ENGINES)
+def test_sanPromotionAndCheck(engine):
+    gamestate=engine.fromFen('3r3k/4P3/8/8/8/8/8/K7 w - - 0 1')
+    assert ChessPGN.getSan(gamestate,getMove(gamestate,'e7d8q'))=='exd8=Q+'
+    assert ChessPGN.getSan(gamestate,getMove(gamestate,'e7e8r'))=='e8=R+'
+    assert ChessPGN.getSan(gamestate,getMove(gamestate,'e7e8n'))=='e8=N'
+    mated=engine.fromFen('6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1')
+    assert ChessPGN.getSan(mated,getMove(mated,'a1a8'))=='Ra8#'
+
+@pytest.mark.parametrize('engine',ENGINES)
+@pytest.mark.parametrize('fen',[
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 b kq - 0 1',
+    '4k3/8/8/2Pp4/8/8/8/4K3 w - d6 0 1',
+])
+def test_sanRoundTrip(engine,fen):
+    gamestate=engine.fromFen(fen)
+    validMoves=gamestate.getValidMoves()
+    sans=[ChessPGN.getSan(gamestate,move,validMoves) for move in validMoves]
+    assert len(set(sans))==len(validMoves)
+    for move,san in zip(validMoves,sans):
+        decoded=ChessPGN.decodeSan(gamestate,san,validMoves)
+        assert (decoded.moveID,decoded.promotionPiece)==(move.moveID,move.promotionPiece)
+
+def test_readGamesSkipsCommentsVariationsAndEscapes():
+    games=list(ChessPGN.readGames(PGN_TEXT.splitlines(keepends=True)))
+    assert [game.result for game in games]==['1-0','1/2-1/2','*']
+    first=games[0]
+    assert first.tags=={'Event':"Comments and variations",'White':"Müller, Jürgen",'Black':"Test",'Result':"1-0"}
+    assert first.moves==['e4','e5','Bc4','Nc6','Qh5','Nf6??','Qxf7#']
+    assert games[1].moves==['d4','d5','c4','e6']
+    assert games[2].tags=={'Event':"No result token"} and games[2].moves==['Nf3','Nf6']
+    gamestate=None
+    for gamestate,move in first.replay():
+        pass  # the generator makes the last move as it finishes
+    assert gamestate.getValidMoves()==[] and gamestate.checkmate
+
+def test_byteOffsetsReadTheSameGameAgain(tmp_path):
+    path=tmp_path/'games.pgn'
+    path.write_bytes(PGN_TEXT.replace('\n','\r\n').encode('utf-8'))  # multi-byte characters, so bytes aren't characters
+    with open(path,'rb') as pgnFile:
+        games=list(ChessPGN.readGames(pgnFile))
+        for game in games:
+            pgnFile.seek(game.offset)
+            again=next(ChessPGN.readGames(pgnFile))
+            assert (again.tags,again.moves,again.result)==(game.tags,game.moves,game.result)
+    assert len(set(game.offset for game in games))==3
@@ -0,0 +1,57 @@
+import queue
+import ChessAI
+import ChessEngine
+import ChessSMP
+
+ChessAI.VERBOSE=False
+ChessAI.USE_BOOK=False  # the start position is in the book, it has to be searched here
+
+def test_workersStoreUnderOneGeneration():
+    searcher=ChessSMP.ParallelSearcher(3)
+    try:
+        bestMove,stats=searcher.search(ChessEngine.GameState(),200)
+        words=searcher.transpositionTable.words
+        generations={words[i+1]>>26&0xFF for i in range(0,len(words),2) if words[i+1]}
+        assert generations=={searcher.transpositionTable.generation}
+        assert bestMove is not None and len(stats['workers'])==3
+    finally:
+        searcher.close()
+
+def test_deadHelperDoesNotHangTheSearch():
+    searcher=ChessSMP.ParallelSearcher(3)
+    try:
+        searcher.helpers[0][1].kill()
+        searcher.helpers[0][1].join()
+        bestMove,stats=searcher.search(ChessEngine.GameState(),200)
+        assert bestMove is not None
+        assert [workerStats.get('error') is not None for workerStats in stats['workers']]==[False,True,False]
+    finally:
+        searcher.close()
+
+def test_helperReportsAFailedSearchAndCarriesOn(monkeypatch):
+    monkeypatch.setattr(ChessAI,'transpositionTable',ChessAI.transpositionTable)  # helperLoop replaces these two
+    monkeypatch.setattr(ChessAI,'stopSearch',None)
+    searchedFrom=[]
+    def searchBestMove(gamestate,validMoves,timeLimit=None,firstDepth=1):
+        searchedFrom.append(len(gamestate.moveLog))
+        if len(searchedFrom)==1:
+            gamestate.makeMove(validMoves[0])  # fails halfway down the tree
+            raise RuntimeError("search failed")
+        stats=ChessAI.SearchStats()
+        stats.nodes,stats.quiescenceNodes,stats.depth=100,250,3
+        ChessAI.searchStats=stats
+        return validMoves[0]
+    monkeypatch.setattr(ChessAI,'searchBestMove',searchBestMove)
+    monkeypatch.setattr(ChessAI,'searchStats',ChessAI.searchStats)
+    searcher=ChessSMP.ParallelSearcher(1)  # no helper processes - its shared table and stop value are used in this one
+    try:
+        requestQueue,resultQueue=queue.Queue(),queue.Queue()
+        e2e4=next(move for move in ChessEngine.GameState().getValidMoves() if move.getChessNotation()=='e2e4')
+        for searchID in (1,2):
+            requestQueue.put(('search',searchID,None,[e2e4.moveID],1))
+        requestQueue.put(('stop',))
+        ChessSMP.helperLoop(1,requestQueue,resultQueue,searcher.sharedMemory,searcher.buckets,searcher.stopID)
+        assert [resultQueue.get_nowait() for _ in range(2)]==[(1,1,0,0,0),(2,1,100,250,3)]
+        assert searchedFrom==[1,1]  # the position left mid-search isn't searched again
+    finally:
+        searcher.close()
@@ -0,0 +1,62 @@
+import pytest
+import ChessAI
+import ChessBitboard
+import ChessEngine
+import ChessTablebase
+
+ChessAI.VERBOSE=False
+
+@pytest.fixture(scope='module')
+def tablebases(tmp_path_factory):
+    # 3 piece tables take a few seconds each, so they are generated once for the whole module
+    directory=str(tmp_path_factory.mktemp('tablebases'))
+    tablebases=ChessTablebase.Tablebases(directory)
+    for material in ('KQvK','KRvK','KPvK'):
+        ChessTablebase.generate(material,tablebases,directory)
+    return tablebases
+
+def probeFen(tablebases,fen):
+    return tablebases.probe(ChessEngine.GameState.fromFen(fen))
+
+def test_mateInOne(tablebases):
+    assert probeFen(tablebases,'7k/8/6K1/8/8/8/8/1Q6 w - - 0 1')==(1,1)  # Qb8#
+    assert probeFen(tablebases,'1Q5k/8/6K1/8/8/8/8/8 b - - 0 1')==(-1,0)  # checkmated
+
+def test_distanceToMateIsOneMoreThanTheBestMove(tablebases):
+    for fen in ('8/8/8/4k3/8/8/8/4K2Q w - - 0 1','8/8/8/8/8/2k5/8/K6R w - - 0 1'):
+        gamestate=ChessEngine.GameState.fromFen(fen)
+        wdl,plies=tablebases.probe(gamestate)
+        assert wdl==1
+        replies=[]
+        for move in gamestate.getValidMoves():
+            gamestate.makeMove(move)
+            replies.append(tablebases.probe(gamestate))
+            gamestate.undoMove()
+        assert min(reply[1] for reply in replies if reply[0]==-1)==plies-1
+
+def test_stalemateIsADraw(tablebases):
+    gamestate=ChessEngine.GameState.fromFen('7k/5Q2/6K1/8/8/8/8/8 b - - 0 1')
+    assert gamestate.getValidMoves()==[] and gamestate.stalemate
+    assert tablebases.probe(gamestate)==(0,0)
+
+def test_probedAfterADoublePushNothingCanTake(tablebases):
+    afterPush=probeFen(tablebases,'8/8/8/8/4P3/8/8/K6k b - e3 0 1')
+    assert afterPush is not None
+    assert afterPush==probeFen(tablebases,'8/8/8/8/4P3/8/8/K6k b - - 0 1')
+
+def test_tablebaseMoveAgreesWithSearch(tablebases,monkeypatch):
+    monkeypatch.setattr(ChessAI,'tablebases',tablebases)
+    monkeypatch.setattr(ChessAI,'USE_BOOK',False)
+    fen='7k/8/5K2/8/8/8/8/1R6 w - - 0 1'  # KRvK, mate in 2
+    gamestate=ChessBitboard.BitboardGameState.fromFen(fen)  # the search's core, as searchBestMove probes it
+    tablebaseMove,score=ChessAI.probeTablebaseMove(gamestate,gamestate.getValidMoves())
+    monkeypatch.setattr(ChessAI,'USE_TABLEBASES',False)
+    monkeypatch.setattr(ChessAI,'TIME_LIMIT',None)
+    monkeypatch.setattr(ChessAI,'DEPTH',4)
+    searchMove=ChessAI.searchBestMove(gamestate,gamestate.getValidMoves())
+    results=[]
+    for move in (tablebaseMove,searchMove):
+        gamestate.makeMove(move)
+        results.append(tablebases.probe(gamestate))
+        gamestate.undoMove()
+    assert results[0]==results[1]==(-1,2)
@@ -0,0 +1,38 @@
+import time
+import ChessEngine
+import ChessWorker
+
+def waitForResult(searchWorker,timeout=30):
+    deadline=time.perf_counter()+timeout
+    while time.perf_counter()<deadline:
+        searchDone,moveID,stats=searchWorker.poll()
+        if searchDone:
+            return moveID,stats
+        time.sleep(0.01)
+    raise AssertionError("no result from the search worker")
+
+def test_badPositionIsReportedAndWorkerCarriesOn():
+    searchWorker=ChessWorker.SearchWorker(timeLimit=100)
+    try:
+        searchWorker.searchID=1
+        searchWorker.requestQueue.put(('search',1,[6444,6444],100))  # e2e4 twice - the second one can't be synced
+        moveID,stats=waitForResult(searchWorker)
+        assert moveID is None and 'error' in stats
+        gamestate=ChessEngine.GameState()
+        gamestate.makeMove(gamestate.getValidMoves()[0])
+        searchWorker.startSearch(gamestate.moveLog)
+        moveID,stats=waitForResult(searchWorker)
+        assert moveID in [move.moveID for move in gamestate.getValidMoves()]
+    finally:
+        searchWorker.close()
+
+def test_deadWorkerIsReported():
+    searchWorker=ChessWorker.SearchWorker(timeLimit=100)
+    try:
+        searchWorker.process.kill()
+        searchWorker.process.join()
+        searchWorker.startSearch([])
+        moveID,stats=waitForResult(searchWorker)
+        assert moveID is None and 'error' in stats
+    finally:
+        searchWorker.close()